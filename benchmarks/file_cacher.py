@@ -0,0 +1,196 @@
+"""
+Benchmarks for FileCacher on large synthetic file trees. Only uses the
+standard library.
+
+Run with the package installed, e.g.
+
+> uv run python benchmarks/file_cacher.py --file-counts 1000 100000 --output results.json
+
+For each number of files, a "wide" tree (a single level of directories
+of up to 1000 files each) and a "deep" tree (a binary tree of directories
+ten levels deep) are written with `utils.path.write_dict_files`, with
+file sizes mixed such that the mean size is a little over 1 KB. Note that
+a million files thus take up over a gigabyte of disk space.
+
+The results are written as JSON (to stdout if no output file is given)
+so that they can be compared across versions. Timings are in seconds,
+from a single run with the files likely in the page cache of the
+operating system.
+"""
+
+from pathlib import Path
+from typing import Any
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+
+from filecache.file_cacher import FileCacher
+from filecache.utils.path import (
+    FolderStructure,
+    expand_directories,
+    match_all,
+    write_dict_files,
+)
+
+LAYOUTS = ("wide", "deep")
+# sizes of files in bytes, each repeated in proportion to its weight
+FILE_SIZES = ((100, 90), (4096, 9), (65536, 1))
+DEEP_LEVELS = 10
+WIDE_DIRECTORY_FILES = 1000
+MATCH_PATTERNS = ["*.txt"]
+
+
+def file_contents(index: int) -> bytes:
+    """
+    Contents of the file with index `index`, of one of `FILE_SIZES`.
+    """
+
+    total_weight = sum(weight for _, weight in FILE_SIZES)
+    position = index % total_weight
+    for size, weight in FILE_SIZES:
+        if position < weight:
+            break
+        position -= weight
+    # differ between files so that the digests do too
+    return index.to_bytes(8) * (size // 8)
+
+
+def file_name(index: int) -> str:
+    # half of the files match `MATCH_PATTERNS`
+    suffix = "txt" if index % 2 == 0 else "bin"
+    return f"file_{index}.{suffix}"
+
+
+def files_structure(indices: range) -> FolderStructure:
+    return {file_name(index): file_contents(index) for index in indices}
+
+
+def tree_structure(file_count: int, layout: str) -> tuple[FolderStructure, int]:
+    """
+    Get the structure of a tree of `file_count` files in `layout`.
+
+    Returns:
+        The structure and its depth.
+    """
+
+    if layout == "wide":
+        return {
+            f"dir_{start // WIDE_DIRECTORY_FILES}": files_structure(
+                range(start, min(start + WIDE_DIRECTORY_FILES, file_count))
+            )
+            for start in range(0, file_count, WIDE_DIRECTORY_FILES)
+        }, 1
+
+    def subtree(indices: range, level: int) -> FolderStructure:
+        if level == DEEP_LEVELS:
+            return files_structure(indices)
+        middle = (indices.start + indices.stop) // 2
+        return {
+            "left": subtree(range(indices.start, middle), level + 1),
+            "right": subtree(range(middle, indices.stop), level + 1),
+        }
+
+    return subtree(range(file_count), 0), DEEP_LEVELS
+
+
+def timed(func, *args, **kwargs) -> tuple[Any, float]:
+
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmark_tree(file_count: int, layout: str) -> dict[str, Any]:
+    """
+    Time walking, filtering, hashing, saving, loading and comparing
+    a tree of `file_count` files in `layout`.
+    """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        root = Path(tmp_dir) / "tree"
+        structure, depth = tree_structure(file_count, layout)
+        _, write_time = timed(write_dict_files, root, structure)
+        del structure
+
+        paths, walk_time = timed(expand_directories, [root], depth=depth)
+        matched, filter_time = timed(
+            lambda: [path for path in paths if match_all(path, MATCH_PATTERNS)]
+        )
+        total_bytes = sum(path.stat().st_size for path in paths)
+
+        cacher = FileCacher(save_path=Path(tmp_dir), auto_load=False)
+        _, hash_time = timed(cacher.hash_files, [root], depth=depth)
+        _, save_time = timed(cacher.save)
+        save_size = cacher.save_path.stat().st_size
+
+        loaded, load_time = timed(
+            FileCacher(save_path=Path(tmp_dir), auto_load=False).load_cache,
+            relative=False,
+        )
+        # one changed file
+        changed = paths[0]
+        changed.write_bytes(b"changed")
+        cacher.hash_file(changed)
+        differences, compare_time = timed(cacher.compare_caches, loaded)
+        assert sum(differences.values()) == 1
+
+    return {
+        "files": len(paths),
+        "layout": layout,
+        "depth": depth,
+        "total_bytes": total_bytes,
+        "write": write_time,
+        "walk": walk_time,
+        "filter": filter_time,
+        "matched_files": len(matched),
+        "hash": hash_time,
+        "hash_mb_per_s": total_bytes / 1e6 / hash_time,
+        "hash_files_per_s": len(paths) / hash_time,
+        "save": save_time,
+        "save_size": save_size,
+        "load": load_time,
+        "compare": compare_time,
+    }
+
+
+def run(file_counts: list[int]) -> dict[str, Any]:
+
+    return {
+        "python": sys.version,
+        "platform": platform.platform(),
+        "trees": [
+            benchmark_tree(file_count, layout)
+            for file_count in file_counts
+            for layout in LAYOUTS
+        ],
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--file-counts",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000, 1_000_000],
+        help="numbers of files in the trees",
+    )
+    parser.add_argument(
+        "--output", type=Path, help="file to write the results to as JSON"
+    )
+    args = parser.parse_args()
+
+    results = json.dumps(run(args.file_counts), indent=4)
+    if args.output is None:
+        print(results)
+    else:
+        args.output.write_text(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""
+Benchmarks for the FunctionCacher hot path, the layouts the cachers save
+their caches in, and copying of outputs. Only uses the standard library.
+
+Run with the package installed, e.g.
+
+> uv run python benchmarks/function_cacher.py --output results.json
+
+To compare against another version, e.g. a checkout of the last release,
+pass its `src` folder with `--baseline`: the latency of cache hits (which
+older versions support as well) is then also measured with that version.
+
+The results are written as JSON (to stdout if no output file is given)
+so that they can be compared across versions. Timings are in seconds,
+those of calls being the best mean over several repeats, and those of
+saving and loading from a single run.
+"""
+
+from pathlib import Path
+from collections.abc import Callable
+from functools import lru_cache
+from typing import Any
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+from filecache.function_cacher import FunctionCacher
+from filecache.shelve_cacher import ShelveCacher
+from filecache.json_cacher import JsonCacher
+
+
+def target(*args):
+    return len(args)
+
+
+class Unhashable:
+    """
+    Argument that cannot be fingerprinted, so that cached invocations
+    are compared against one at a time.
+    """
+
+    __hash__ = None
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, Unhashable) and self.value == other.value
+
+
+class DictShelveCacher(ShelveCacher):
+    """
+    Saves a plain dictionary as a shelve.
+    """
+
+    def set_auto_save(self, val):
+        return super().set_auto_save(val)
+
+
+class DictJsonCacher(JsonCacher):
+    """
+    Saves a plain dictionary as JSON.
+    """
+
+    def set_auto_save(self, val):
+        return super().set_auto_save(val)
+
+
+def best_mean(func: Callable, number: int, repeat=5) -> float:
+    """
+    Get the best mean time (in seconds) of calling `func`.
+    """
+
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def make_args(first: int, count: int, size: int) -> tuple:
+    """
+    Get `count` arguments, each a tuple of `size` integers, or an
+    integer if `size` is zero. Arguments with a different `first`
+    differ from each other.
+    """
+
+    if size == 0:
+        return (first,) + tuple(range(count - 1))
+    return ((first,) * size,) + tuple(tuple(range(size)) for _ in range(count - 1))
+
+
+def directory_size(path: Path) -> int:
+
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+def hit_latency(number=10_000, repeat=5) -> float:
+    """
+    Get the best mean latency (in seconds) of a cache hit on a
+    small function, with the version of the package imported (see
+    `baseline_hit_latency` for another version).
+    """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        function_cacher = FunctionCacher(save_path=Path(tmp_dir), auto_load=False)
+
+        @function_cacher()
+        def add(one, two=1):
+            return one + two
+
+        add(1)
+        timings = timeit.repeat(lambda: add(1), number=number, repeat=repeat)
+
+    return min(timings) / number
+
+
+def baseline_hit_latency(source: Path, number=10_000) -> float:
+    """
+    Get `hit_latency` with the version of the package in `source`
+    (e.g. the `src` folder of a checkout), measured in a process of
+    its own.
+    """
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [str(source.resolve()), *filter(None, [env.get("PYTHONPATH")])]
+    )
+    completed = subprocess.run(
+        [sys.executable, __file__, "--hit-latency", str(number)],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(completed.stdout)
+
+
+def call_latency(arg_count: int, arg_size: int, number: int) -> dict[str, Any]:
+    """
+    Latency of hits and misses of `FunctionCacher` and `functools.lru_cache`
+    when called with `arg_count` arguments of size `arg_size`.
+    """
+
+    result: dict[str, Any] = {"arg_count": arg_count, "arg_size": arg_size}
+    hit_args = make_args(0, arg_count, arg_size)
+    miss_args = [make_args(i, arg_count, arg_size) for i in range(1, number + 1)]
+
+    lru_target = lru_cache(maxsize=None)(target)
+    lru_target(*hit_args)
+    result["lru_cache_hit"] = best_mean(lambda: lru_target(*hit_args), number)
+
+    def lru_misses():
+        lru_target.cache_clear()
+        start = time.perf_counter()
+        for args in miss_args:
+            lru_target(*args)
+        return time.perf_counter() - start
+
+    result["lru_cache_miss"] = min(lru_misses() for _ in range(3)) / number
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        function_cacher = FunctionCacher(save_path=Path(tmp_dir), auto_load=False)
+        cached_target = function_cacher()(target)
+        cached_target(*hit_args)
+        result["cacher_hit"] = best_mean(lambda: cached_target(*hit_args), number)
+
+        def cacher_misses():
+            function_cacher.clear_memory_cache()
+            start = time.perf_counter()
+            for args in miss_args:
+                cached_target(*args)
+            return time.perf_counter() - start
+
+        result["cacher_miss"] = min(cacher_misses() for _ in range(3)) / number
+
+    return result
+
+
+def lookup_cost(cache_size: int, indexed: bool, number: int) -> dict[str, Any]:
+    """
+    Latency of a hit on the least recently used of `cache_size` cached
+    invocations. If not `indexed`, the arguments cannot be fingerprinted
+    and are compared against each cached invocation instead.
+    """
+
+    def argument(value):
+        return value if indexed else Unhashable(value)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        function_cacher = FunctionCacher(
+            cache_size=cache_size, save_path=Path(tmp_dir), auto_load=False
+        )
+        cached_target = function_cacher()(target)
+        for i in range(cache_size):
+            cached_target(argument(i))
+
+        # each hit makes the invocation the most recently used,
+        # so look up the oldest ones in turn
+        arguments = [argument(i % cache_size) for i in range(number)]
+        iterator = iter(arguments)
+
+        def hit():
+            cached_target(next(iterator))
+
+        latency = float("inf")
+        for _ in range(3):
+            iterator = iter(arguments)
+            latency = min(latency, best_mean(hit, number, repeat=1))
+
+    return {"cache_size": cache_size, "indexed": indexed, "hit": latency}
+
+
+def save_load(layout: str, entry_count: int) -> dict[str, Any]:
+    """
+    Time of saving and loading a cache of `entry_count` entries, and the
+    size of the files, for the given `layout`: "shelve" (`ShelveCacher`),
+    "json" (`JsonCacher`) or "function_cacher" (each invocation as a
+    record of its own).
+    """
+
+    def entry(i):
+        return {"input": [i, str(i)], "output": list(range(10))}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        save_path = Path(tmp_dir)
+        if layout == "function_cacher":
+            cacher = FunctionCacher(save_path=save_path, auto_load=False)
+            cached_target = cacher()(target)
+            for i in range(entry_count):
+                cached_target(i, str(i))
+
+            def new_cacher():
+                return FunctionCacher(save_path=save_path, auto_load=False)
+
+        else:
+            cacher_class = {"shelve": DictShelveCacher, "json": DictJsonCacher}[layout]
+            cacher = cacher_class(save_path=save_path, auto_load=False)
+            cacher.cache = {str(i): entry(i) for i in range(entry_count)}
+
+            def new_cacher():
+                return cacher_class(save_path=save_path, auto_load=False)
+
+        start = time.perf_counter()
+        cacher.save()
+        save_time = time.perf_counter() - start
+        file_size = directory_size(save_path)
+
+        loader = new_cacher()
+        start = time.perf_counter()
+        loader.load_cache(inplace=True)
+        load_time = time.perf_counter() - start
+
+    return {
+        "layout": layout,
+        "entries": entry_count,
+        "save": save_time,
+        "load": load_time,
+        "file_size": file_size,
+    }
+
+
+def save_cost(entry_count: int, cache_size: int | None, number: int) -> dict[str, Any]:
+    """
+    Mean latency of a miss auto-saved to a cache of `entry_count`
+    cached invocations, over `number` misses, and the size of the
+    files afterwards. With a `cache_size`, each miss evicts an
+    invocation.
+    """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        save_path = Path(tmp_dir)
+        function_cacher = FunctionCacher(
+            cache_size=cache_size, save_path=save_path, auto_load=False
+        )
+        cached_target = function_cacher()(target)
+        for i in range(entry_count):
+            cached_target(i)
+        function_cacher.save()
+
+        function_cacher.auto_save = True
+        start = time.perf_counter()
+        for i in range(entry_count, entry_count + number):
+            cached_target(i)
+        latency = (time.perf_counter() - start) / number
+        file_size = directory_size(save_path)
+
+    return {
+        "entries": entry_count,
+        "cache_size": cache_size,
+        "saved_miss": latency,
+        "file_size": file_size,
+    }
+
+
+def realistic_outputs() -> dict[str, Any]:
+
+    return {
+        "records": [
+            {"id": i, "name": f"item {i}", "tags": ["a", "b"], "score": i / 3}
+            for i in range(1000)
+        ],
+        "floats": [i / 7 for i in range(100_000)],
+        "nested": {str(i): {str(j): [j] * 5 for j in range(20)} for i in range(50)},
+        "bytes": bytes(1_000_000),
+    }
+
+
+def copy_cost(number: int) -> list[dict[str, Any]]:
+    """
+    Time of copying realistic outputs into and out of the cache
+    with each copy policy.
+    """
+
+    # imported here as older versions have no copy policies, see
+    # `baseline_hit_latency`
+    from filecache.utils.copy_policy import (
+        COPY_POLICIES,
+        copy_to_cache,
+        copy_from_cache,
+    )
+
+    results = []
+    for name, output in realistic_outputs().items():
+        for policy in COPY_POLICIES:
+            stored = copy_to_cache(output, policy)
+            results.append(
+                {
+                    "output": name,
+                    "policy": policy,
+                    "copy_in": best_mean(
+                        lambda: copy_to_cache(output, policy), number, repeat=3
+                    ),
+                    "copy_out": best_mean(
+                        lambda: copy_from_cache(stored, policy), number, repeat=3
+                    ),
+                }
+            )
+    return results
+
+
+def run(quick=False, baseline: Path | None = None) -> dict[str, Any]:
+
+    number = 200 if quick else 2_000
+    arg_counts = (1, 4) if quick else (1, 4, 16)
+    arg_sizes = (0, 100) if quick else (0, 10, 100, 1000)
+    cache_sizes = (10, 100) if quick else (10, 100, 1_000, 10_000)
+    entry_counts = (10, 100) if quick else (10, 100, 1_000, 10_000)
+
+    return {
+        "python": sys.version,
+        "platform": platform.platform(),
+        "quick": quick,
+        "hit_latency": hit_latency(number=number),
+        "baseline_hit_latency": (
+            None if baseline is None else baseline_hit_latency(baseline, number)
+        ),
+        "call_latency": [
+            call_latency(arg_count, arg_size, number)
+            for arg_count in arg_counts
+            for arg_size in arg_sizes
+        ],
+        "lookup_cost": [
+            lookup_cost(cache_size, True, number) for cache_size in cache_sizes
+        ]
+        # comparing against each invocation is far slower
+        + [
+            lookup_cost(cache_size, False, 20)
+            for cache_size in cache_sizes
+            if cache_size <= 1_000
+        ],
+        "save_load": [
+            save_load(layout, entry_count)
+            for layout in ("shelve", "json", "function_cacher")
+            for entry_count in entry_counts
+        ],
+        "save_cost": [
+            save_cost(entry_count, None, 20 if quick else 200)
+            for entry_count in entry_counts
+        ]
+        # evicting on each miss should not grow the files
+        + [save_cost(10, 10, 200 if quick else 2_000)],
+        "copy": copy_cost(number=3 if quick else 10),
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--output", type=Path, help="file to write the results to as JSON"
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="run fewer and smaller benchmarks"
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        help="source folder of another version to also time cache hits with",
+    )
+    parser.add_argument("--hit-latency", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if not (args.hit_latency is None):
+        # run by `baseline_hit_latency`
+        print(hit_latency(number=args.hit_latency))
+        return
+    results = json.dumps(run(quick=args.quick, baseline=args.baseline), indent=4)
+    if args.output is None:
+        print(results)
+    else:
+        args.output.write_text(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,22 @@
 import abc
 import hashlib
 from pathlib import Path
-from typing import Self, Any, TypedDict, Callable
-from functools import wraps
+from typing import Self, Any, TypedDict, Callable, Literal
+from functools import wraps, partial
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import copy
+import threading
 
 from .utils.string import pascal_to_snake_case
+from .utils.write_behind import WriteBehind
 from .typing import Hasher
 from .exceptions import StateNotFoundError
 
 type CacheObject = Any
 type StateCacheObject = Any
+type AutoSave = bool | Literal["background"]
 
 
 class CacherMetadata(TypedDict):
@@ -38,8 +44,10 @@ class AbstractCacher(abc.ABC):
         save_path: Path = None,
         *,
         hasher: Callable[[], Hasher] = lambda: hashlib.sha256(usedforsecurity=False),
-        auto_save=False,
+        auto_save: AutoSave = False,
         auto_load=True,
+        max_save_delay: float = 1.0,
+        max_pending_changes: int = 100,
     ):
         """
 
@@ -53,7 +61,12 @@ class AbstractCacher(abc.ABC):
                 Factory returning a hashlib-type hasher.
             auto_save:
                 Whether the cache should be automatically saved
-                when a new value is set in it.
+                when a new value is set in it. If "background", the
+                change is only marked, and the cache is saved in a
+                background thread, coalescing changes made in the
+                meantime into a single save (see `max_save_delay`
+                and `max_pending_changes`). Pending changes are saved
+                with `.flush` or `.close`, and at interpreter exit.
 
                 NOTE: The behaviour for auto-save needs to be defined
                 in inheriting classes. The methods `.perform_auto_save` and
@@ -61,6 +74,12 @@ class AbstractCacher(abc.ABC):
             auto_load:
                 Whether an attempt should be made to automatically
                 load the cache from `save_path`.
+            max_save_delay:
+                With background auto-saving, max number of seconds
+                a change is left unsaved.
+            max_pending_changes:
+                With background auto-saving, max number of changes
+                left unsaved.
 
         """
 
@@ -73,6 +92,11 @@ class AbstractCacher(abc.ABC):
         self.save_path.parents[0].mkdir(parents=True, exist_ok=True)
         self._auto_save = False
         self.auto_save = auto_save
+        self.max_save_delay = max_save_delay
+        self.max_pending_changes = max_pending_changes
+        self._save_executor: ThreadPoolExecutor | None = None
+        self._write_behind: WriteBehind | None = None
+        self._write_behind_lock = threading.Lock()
 
         if auto_load:
             self.init_load()
@@ -92,22 +116,91 @@ class AbstractCacher(abc.ABC):
         return self._auto_save
 
     @abc.abstractmethod
-    def set_auto_save(self, val: bool):
-        if not isinstance(val, bool):
-            raise TypeError("auto_save should be a boolean")
+    def set_auto_save(self, val: AutoSave):
+        if not (isinstance(val, bool) or val == "background"):
+            raise TypeError('auto_save should be a boolean or "background"')
         self._auto_save = val
 
     @auto_save.setter
-    def auto_save(self, val: bool):
+    def auto_save(self, val: AutoSave):
         self.set_auto_save(val)
 
     def perform_auto_save(self):
         """
-        Perform an auto-save if the attribute is set to True.
+        Perform an auto-save if the attribute is set to True, or mark
+        a change to be saved in the background if it is "background".
         """
-        if self.auto_save:
+        if self.auto_save == "background":
+            self._mark_changed()
+        elif self.auto_save:
             self.save()
 
+    def _mark_changed(self):
+
+        with self._write_behind_lock:
+            if self._write_behind is None:
+                self._write_behind = WriteBehind(
+                    self._flush_state,
+                    max_delay=self.max_save_delay,
+                    max_pending=self.max_pending_changes,
+                    name=f"{self.name_as_snake}_write_behind",
+                )
+            self._write_behind.mark()
+
+    def _flush_state(self):
+        """
+        Save the state, called from the background thread.
+        """
+        self._snapshot_saver()()
+
+    def _snapshot_saver(self) -> Callable[[], object]:
+        """
+        Get a function saving the state as it is now, which can be
+        called while the cache is being modified, e.g. in another
+        thread. By default, saves a snapshot of the state (see
+        `.get_state_snapshot`).
+        """
+        return partial(self.save, state=self.get_state_snapshot())
+
+    def flush(self) -> Self:
+        """
+        Save the changes pending a background save, if any.
+        """
+        if not (self._write_behind is None):
+            self._write_behind.flush()
+        return self
+
+    def close(self):
+        """
+        Save the changes pending a background save and stop the
+        background threads.
+        """
+        with self._write_behind_lock:
+            write_behind, self._write_behind = self._write_behind, None
+        if not (write_behind is None):
+            write_behind.close()
+        if not (self._save_executor is None):
+            self._save_executor.shutdown()
+            self._save_executor = None
+
+    async def perform_auto_save_async(self):
+        """
+        Perform an auto-save if the attribute is set to True, without
+        blocking the event loop. The state as it is now is saved in
+        a separate thread (see `._snapshot_saver`).
+        Saves are performed one at a time, in order.
+        """
+        if self.auto_save == "background":
+            self._mark_changed()
+        elif self.auto_save:
+            if self._save_executor is None:
+                self._save_executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=self.name_as_snake
+                )
+            await asyncio.get_running_loop().run_in_executor(
+                self._save_executor, self._snapshot_saver()
+            )
+
     @staticmethod
     def auto_save_after():
         """
@@ -180,6 +273,15 @@ class AbstractCacher(abc.ABC):
 
         return {"metadata": self.metadata(), "cache": self.cache_to_state_cache()}
 
+    def get_state_snapshot(self) -> CacherState[StateCacheObject]:
+        """
+        Get the state such that later changes to the cache do not
+        affect it, allowing it to be saved while the cache is being
+        modified. By default, a deep copy of `.get_state()`.
+        """
+
+        return copy.deepcopy(self.get_state())
+
     @classmethod
     @abc.abstractmethod
     def new_cache(cls) -> CacheObject:
@@ -188,11 +290,12 @@ class AbstractCacher(abc.ABC):
         """
 
     @abc.abstractmethod
-    def save(self, path: Path | None = None) -> Self:
+    def save(self, path: Path | None = None, state: CacherState | None = None) -> Self:
         """
         Save the state.
 
-        If `path` is None, defaults to self.save_path.
+        If `path` is None, defaults to self.save_path. If `state` is None,
+        defaults to `.get_state()`.
         """
 
     @abc.abstractmethod
@@ -0,0 +1,159 @@
+"""
+BlobStore: Stores large values as content-addressed files of their own,
+so that they are written once and only read when needed.
+"""
+
+from pathlib import Path
+from collections.abc import Callable, Iterable
+from typing import Any, NamedTuple
+import hashlib
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+
+from .typing import Hasher
+
+_MAGIC = b"FCBLOB01"
+# offsets of buffers in a blob are aligned to this many bytes
+_ALIGNMENT = 64
+
+
+class BlobRef(NamedTuple):
+    """
+    Reference to a value stored in a `BlobStore`, by the digest of
+    its contents.
+    """
+
+    digest: str
+
+
+def _padding(offset: int) -> int:
+    return -offset % _ALIGNMENT
+
+
+class BlobStore:
+    """
+    Values are pickled (protocol 5) with the buffers of objects that
+    support out-of-band buffers (e.g. NumPy arrays and bytearrays)
+    written as is. Buffers are memory-mapped when read, so they are
+    only paged in from file as they are accessed.
+
+    Layout of a blob:
+        The magic bytes, the number of buffers, the length of the
+        pickle and each buffer, then the pickle and the buffers
+        at aligned offsets.
+
+    Each blob is named by the digest of its contents and never
+    rewritten, so blobs may be shared between references.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        hasher: Callable[[], Hasher] = lambda: hashlib.sha256(usedforsecurity=False),
+    ):
+
+        self.directory = directory
+        self.hasher = hasher
+
+    def path(self, ref: BlobRef) -> Path:
+        return self.directory / ref.digest[:2] / ref.digest
+
+    def write(self, value: Any) -> BlobRef:
+        """
+        Store `value`, unless a blob with the same contents already exists.
+        """
+
+        buffers: list[pickle.PickleBuffer] = []
+        data = pickle.dumps(value, protocol=5, buffer_callback=buffers.append)
+        raws = [buffer.raw() for buffer in buffers]
+
+        header = bytearray(_MAGIC)
+        header += struct.pack("<I", len(raws))
+        header += struct.pack(f"<{len(raws) + 1}Q", len(data), *map(len, raws))
+        header += bytes(_padding(len(header)))
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        hasher = self.hasher()
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, prefix=".tmp")
+        try:
+            with open(fd, "wb") as f:
+                offset = 0
+                for part in [header, data, *raws]:
+                    padding = bytes(_padding(offset))
+                    for chunk in (padding, part):
+                        f.write(chunk)
+                        hasher.update(chunk)
+                    offset += len(padding) + len(part)
+
+            ref = BlobRef(hasher.hexdigest())
+            path = self.path(ref)
+            if path.exists():
+                os.remove(tmp_name)
+            else:
+                path.parent.mkdir(exist_ok=True)
+                os.replace(tmp_name, path)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+        return ref
+
+    def read(self, ref: BlobRef) -> Any:
+        """
+        Read the value referred to by `ref`.
+
+        Raises:
+            FileNotFoundError:
+                The blob does not exist.
+        """
+
+        with open(self.path(ref), "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+
+        if view[: len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"Not a blob: {self.path(ref)}")
+        offset = len(_MAGIC)
+        (buffer_count,) = struct.unpack_from("<I", view, offset)
+        offset += 4
+        lengths = struct.unpack_from(f"<{buffer_count + 1}Q", view, offset)
+        offset += 8 * len(lengths)
+        offset += _padding(offset)
+
+        parts = []
+        for length in lengths:
+            offset += _padding(offset)
+            parts.append(view[offset : offset + length])
+            offset += length
+        return pickle.loads(parts[0], buffers=parts[1:])
+
+    def copy_from(self, other: "BlobStore", ref: BlobRef):
+        """
+        Copy the blob referred to by `ref` from `other`, unless
+        it exists already.
+        """
+
+        path = self.path(ref)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(other.path(ref), path)
+
+    def delete(self, refs: Iterable[BlobRef]):
+        """
+        Delete the blobs referred to by `refs`, if they exist.
+        """
+
+        for ref in refs:
+            self.path(ref).unlink(missing_ok=True)
+
+    def clear(self):
+        """
+        Delete all blobs.
+        """
+
+        shutil.rmtree(self.directory, ignore_errors=True)
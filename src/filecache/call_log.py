@@ -0,0 +1,121 @@
+"""
+CallLog: Records invocations of cached functions to a file, so that
+they can be computed again later (see `FunctionCacher.warm`).
+"""
+
+from pathlib import Path
+from collections.abc import Hashable, Iterator
+from typing import Any
+import hashlib
+import logging
+import pickle
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class CallLog:
+    """
+    Appends each invocation recorded to a file as a pickled
+    `(function name, bound arguments, key)` tuple, where the key is the
+    fingerprint of the arguments, or a digest of their pickle if they
+    could not be fingerprinted. Invocations with the same key are only
+    recorded once, including those recorded to the file before the
+    `CallLog` was created.
+    """
+
+    def __init__(self, path: Path):
+
+        self.path = path
+        self._lock = threading.Lock()
+        # read from file on the first invocation recorded
+        self._recorded: set[tuple[str, Hashable]] | None = None
+
+    def record(self, name: str, bound_args: dict[str, Any], key: Hashable | None):
+        """
+        Record an invocation of the function with unique name `name`
+        with `bound_args`, whose fingerprint is `key` (None if the
+        arguments could not be fingerprinted). Invocations whose
+        arguments cannot be pickled are not recorded.
+        """
+
+        if not (key is None):
+            with self._lock:
+                if (name, key) in self._recorded_keys():
+                    return
+            try:
+                data = pickle.dumps(
+                    (name, bound_args, key), protocol=pickle.HIGHEST_PROTOCOL
+                )
+            except (pickle.PicklingError, TypeError, AttributeError):
+                # the fingerprint may hold values that cannot be pickled
+                key = None
+        if key is None:
+            try:
+                key = hashlib.sha256(
+                    pickle.dumps(bound_args, protocol=pickle.HIGHEST_PROTOCOL),
+                    usedforsecurity=False,
+                ).hexdigest()
+                data = pickle.dumps(
+                    (name, bound_args, key), protocol=pickle.HIGHEST_PROTOCOL
+                )
+            except (pickle.PicklingError, TypeError, AttributeError):
+                logger.debug("Arguments of %s cannot be recorded", name)
+                return
+
+        with self._lock:
+            recorded = self._recorded_keys()
+            if (name, key) in recorded:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # a single write, so that appends from other processes
+            # do not interleave
+            with open(self.path, "ab") as f:
+                f.write(data)
+            recorded.add((name, key))
+
+    def _recorded_keys(self) -> set[tuple[str, Hashable]]:
+        """
+        Get the `(name, key)` of the invocations recorded, reading them
+        from file the first time. Called with `._lock` held.
+        """
+
+        if self._recorded is None:
+            self._recorded = set()
+            if self.path.exists():
+                self._recorded.update(
+                    (name, key) for name, _, key in self._read_records(self.path)
+                )
+        return self._recorded
+
+    @staticmethod
+    def read(path: Path) -> Iterator[tuple[str, dict[str, Any]]]:
+        """
+        Read the invocations recorded at `path`, oldest first. Reading
+        stops at a record that cannot be read, e.g. one cut short by
+        a crash while writing, or one referring to a class that can
+        no longer be imported.
+        """
+
+        for name, bound_args, _ in CallLog._read_records(path):
+            yield name, bound_args
+
+    @staticmethod
+    def _read_records(
+        path: Path,
+    ) -> Iterator[tuple[str, dict[str, Any], Hashable | None]]:
+        """
+        Read the records at `path` as `(name, bound arguments, key)`,
+        see `.read`.
+        """
+
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+                except (pickle.UnpicklingError, AttributeError, ImportError):
+                    # the position in the file is lost with the record
+                    logger.warning("Stopped reading %s at a bad record", path)
+                    return
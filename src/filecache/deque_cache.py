@@ -1,10 +1,11 @@
-from collections import deque
+from collections import OrderedDict
 from typing import Any, Self, Generator, override
-from collections.abc import Callable
+from collections.abc import Callable, Hashable, Iterable, Iterator
 from contextlib import contextmanager
-import datetime as dt
+import itertools
 
 from .invalidation_dict import InvalidationDict
+from .eviction import EvictionPolicy
 
 
 def maxlen(value: int | None) -> int | None:
@@ -20,13 +21,200 @@ def _compare_deque_objects(one, two):
 
 
 type ComparisonFunc[one, two] = Callable[[one, two], bool]
+type IndexKeyFunc[T] = Callable[[T], Hashable | None]
 
 
-class DequeCache[T](InvalidationDict[str, deque[T]]):
+class RecencyDeque[T]:
     """
-    Dictionary that holds cached items in deques. Allows deques'
-    max length to be changed dynamically. In the deques, most recently
-    used item should be on the left.
+    Deque of distinct items, most recently used first, supporting the
+    operations of `collections.deque` used by `DequeCache`. Items are
+    compared by identity, and can be moved to the front, removed or
+    replaced in constant time wherever they are in the deque. Adding
+    an item that is already in the deque moves it instead.
+    """
+
+    __slots__ = ("_items", "_positions", "_counter", "_maxlen")
+
+    def __init__(self, iterable: Iterable[T] = (), maxlen: int | None = None):
+
+        # least recently used first, by a key that stays the same
+        # when the item is replaced
+        self._items: OrderedDict[int, T] = OrderedDict()
+        # keys of the items by their id
+        self._positions: dict[int, int] = {}
+        self._counter = itertools.count()
+        self._maxlen = maxlen
+        self.extend(iterable)
+
+    @property
+    def maxlen(self) -> int | None:
+        return self._maxlen
+
+    def _full(self) -> bool:
+        return not (self._maxlen is None) and len(self._items) >= self._maxlen
+
+    def _insert(self, item: T) -> int:
+
+        key = next(self._counter)
+        self._items[key] = item
+        self._positions[id(item)] = key
+        return key
+
+    def _pop(self, last: bool) -> T:
+
+        if len(self._items) == 0:
+            raise IndexError("pop from an empty deque")
+        _, item = self._items.popitem(last=last)
+        del self._positions[id(item)]
+        return item
+
+    def appendleft(self, item: T):
+        """
+        Add `item` as the most recently used item, dropping the least
+        recently used one if full.
+        """
+
+        if self.move_to_front(item):
+            return
+        if self._full():
+            self._pop(last=False)
+        self._insert(item)
+
+    def append(self, item: T):
+        """
+        Add `item` as the least recently used item, dropping the most
+        recently used one if full.
+        """
+
+        if id(item) in self._positions:
+            self._items.move_to_end(self._positions[id(item)], last=False)
+            return
+        if self._full():
+            self._pop(last=True)
+        self._items.move_to_end(self._insert(item), last=False)
+
+    def extendleft(self, iterable: Iterable[T]):
+        for item in iterable:
+            self.appendleft(item)
+
+    def extend(self, iterable: Iterable[T]):
+        for item in iterable:
+            self.append(item)
+
+    def pop(self) -> T:
+        """
+        Remove and return the least recently used item.
+        """
+        return self._pop(last=False)
+
+    def popleft(self) -> T:
+        """
+        Remove and return the most recently used item.
+        """
+        return self._pop(last=True)
+
+    def move_to_front(self, item: T) -> bool:
+        """
+        Make `item` the most recently used item.
+
+        Returns:
+            Whether `item` is in the deque.
+        """
+
+        key = self._positions.get(id(item))
+        if key is None:
+            return False
+        self._items.move_to_end(key)
+        return True
+
+    def discard(self, item: T) -> bool:
+        """
+        Remove `item`.
+
+        Returns:
+            Whether `item` was in the deque.
+        """
+
+        key = self._positions.pop(id(item), None)
+        if key is None:
+            return False
+        del self._items[key]
+        return True
+
+    def remove(self, item: T):
+        if not self.discard(item):
+            raise ValueError("item not in deque")
+
+    def replace(self, item: T, new_item: T) -> bool:
+        """
+        Replace `item` with `new_item`, keeping its position.
+
+        Returns:
+            Whether `item` was in the deque.
+        """
+
+        key = self._positions.pop(id(item), None)
+        if key is None:
+            return False
+        self._items[key] = new_item
+        self._positions[id(new_item)] = key
+        return True
+
+    def clear(self):
+        self._items.clear()
+        self._positions.clear()
+
+    def copy(self) -> Self:
+
+        copied = type(self).__new__(type(self))
+        copied._items = self._items.copy()
+        copied._positions = self._positions.copy()
+        # keys of items added to either are unique within each
+        copied._counter = itertools.count(next(self._counter))
+        copied._maxlen = self._maxlen
+        return copied
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[T]:
+        return reversed(self._items.values())
+
+    def __reversed__(self) -> Iterator[T]:
+        return iter(self._items.values())
+
+    def __contains__(self, item) -> bool:
+        return id(item) in self._positions
+
+    def __getitem__(self, index: int) -> T:
+
+        if index == 0 or index == -1:
+            values = self._items.values()
+            try:
+                return next(reversed(values) if index == 0 else iter(values))
+            except StopIteration:
+                raise IndexError("deque index out of range")
+        return list(self)[index]
+
+    def __reduce__(self):
+        return type(self), (list(self), self._maxlen)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({list(self)!r}, maxlen={self._maxlen})"
+
+
+class DequeCache[T](InvalidationDict[str, RecencyDeque[T]]):
+    """
+    Dictionary that holds cached items in deques (see `RecencyDeque`).
+    Allows deques' max length to be changed dynamically. In the deques,
+    most recently used item should be on the left.
+
+    Items added with `.add_item` can additionally be indexed by a hashable
+    key (see `index_key`), allowing them to be found in constant time
+    with `.find_indexed_item`.
+
+    When a deque is full, adding an item evicts the least recently used
+    one, or the one selected by `eviction_policy` if set.
     """
 
     def __init__(
@@ -34,6 +222,8 @@ class DequeCache[T](InvalidationDict[str, deque[T]]):
         max_size: int | None = None,
         compare_deque_obj: ComparisonFunc | None = None,
         *args,
+        index_key: IndexKeyFunc[T] | None = None,
+        eviction_policy: EvictionPolicy[T] | None = None,
         **kwargs,
     ):
         """
@@ -46,6 +236,14 @@ class DequeCache[T](InvalidationDict[str, deque[T]]):
                 will be the object in the deque, first value is up
                 to the user, whatever is needed in the comparison
                 function.
+            index_key:
+                Function returning the key an item in a deque is indexed
+                by, or None if the item should not be indexed. Should
+                be picklable (e.g. a module-level function) for the
+                cache to be picklable. If None, no items are indexed.
+            eviction_policy:
+                Policy selecting the item to evict from a full deque.
+                If None, the least recently used item is evicted.
         """
 
         super().__init__(*args, **kwargs)
@@ -55,13 +253,25 @@ class DequeCache[T](InvalidationDict[str, deque[T]]):
             _compare_deque_objects if compare_deque_obj is None else compare_deque_obj
         )
         self._move_newest_to_front = True
+        self.index_key = index_key
+        self._index: dict[Any, dict[Hashable, T]] = {}
+        self.eviction_policy = eviction_policy
+        # called with the key and the item when an item is evicted
+        self.on_evict: Callable[[Any, T], object] | None = None
+        # called with the key and the item when an item is added,
+        # removed (including evicted) or moved to the front, e.g. to
+        # keep track of the changes to save. Replacing an item is not
+        # reported.
+        self.on_add: Callable[[Any, T], object] | None = None
+        self.on_remove: Callable[[Any, T], object] | None = None
+        self.on_access: Callable[[Any, T], object] | None = None
 
     @property
     def max_size(self) -> int | None:
         return self._max_size
 
-    def _deque_factory(self) -> deque[T]:
-        return deque(maxlen=self._max_size)
+    def _deque_factory(self) -> RecencyDeque[T]:
+        return RecencyDeque(maxlen=self._max_size)
 
     @max_size.setter
     def max_size(self, value: int | None):
@@ -72,10 +282,157 @@ class DequeCache[T](InvalidationDict[str, deque[T]]):
             self._max_size = int(value)
 
         for key in self:
+            if not (self._max_size is None):
+                while len(self[key]) > self._max_size:
+                    self._evict(key)
             new_deque = self._deque_factory()
             # Maintain order by reversing, extending from left
             new_deque.extendleft(reversed(self[key]))
             self[key] = new_deque
+            self.rebuild_index(key)
+
+    def rebuild_index(self, key=None):
+        """
+        Rebuild the index of the items in the deque at `key`, or of
+        all deques if `key` is None.
+        """
+
+        keys = list(self) if key is None else [key]
+        for key in keys:
+            self._index.pop(key, None)
+            if self.index_key is None:
+                continue
+            # iterate from the right so that the most recent item wins
+            for item in reversed(self[key]):
+                self._add_to_index(key, item)
+
+    def _add_to_index(self, key, item: T):
+
+        if self.index_key is None:
+            return
+        index_key = self.index_key(item)
+        if not (index_key is None):
+            self._index.setdefault(key, {})[index_key] = item
+
+    def _remove_from_index(self, key, item: T):
+
+        if self.index_key is None:
+            return
+        index_key = self.index_key(item)
+        key_index = self._index.get(key, {})
+        if not (index_key is None) and key_index.get(index_key) is item:
+            del key_index[index_key]
+
+    def touch_item(self, item: T):
+        """
+        Let the eviction policy know that `item` has been accessed
+        or changed.
+        """
+
+        if not (self.eviction_policy is None):
+            self.eviction_policy.touch(item)
+
+    def _evict(self, key) -> T:
+        """
+        Evict an item from the deque at `key`, which is not empty.
+        """
+
+        deq = self[key]
+        if self.eviction_policy is None:
+            item = deq.pop()
+            self._remove_from_index(key, item)
+            if not (self.on_remove is None):
+                self.on_remove(key, item)
+        else:
+            item = self.eviction_policy.select_victim(deq)
+            self.remove_item(key, item)
+        if not (self.on_evict is None):
+            self.on_evict(key, item)
+        return item
+
+    def _move_to_front(self, key, item: T):
+
+        self.touch_item(item)
+        if not self._move_newest_to_front:
+            return
+        deq = self[key]
+        if deq[0] is item:
+            return
+        if deq.move_to_front(item):
+            self.get_and_update(key)
+            if not (self.on_access is None):
+                self.on_access(key, item)
+
+    def add_item(self, key, item: T) -> T:
+        """
+        Add `item` to the front of the deque at `key`, indexing it
+        if applicable. Does not update the access time of `key`.
+        """
+
+        deq = self[key]
+        if not (deq.maxlen is None) and len(deq) >= deq.maxlen:
+            self._evict(key)
+        deq.appendleft(item)
+        self._add_to_index(key, item)
+        self.touch_item(item)
+        if not (self.on_add is None):
+            self.on_add(key, item)
+        return item
+
+    def append_item(self, key, item: T) -> bool:
+        """
+        Add `item` to the back of the deque at `key` (as the least
+        recently used item) if the deque is not full and no item with
+        the same index key is in the deque.
+
+        Returns:
+            Whether the item was added.
+        """
+
+        deq = self[key]
+        if not (deq.maxlen is None) and len(deq) >= deq.maxlen:
+            return False
+        index_key = None if self.index_key is None else self.index_key(item)
+        if not (index_key is None):
+            key_index = self._index.setdefault(key, {})
+            if index_key in key_index:
+                return False
+            key_index[index_key] = item
+        deq.append(item)
+        self.touch_item(item)
+        if not (self.on_add is None):
+            self.on_add(key, item)
+        return True
+
+    def remove_item(self, key, item: T) -> bool:
+        """
+        Remove `item` (compared by identity) from the deque at `key`.
+
+        Returns:
+            Whether the item was found.
+        """
+
+        if not self[key].discard(item):
+            return False
+        self._remove_from_index(key, item)
+        if not (self.on_remove is None):
+            self.on_remove(key, item)
+        return True
+
+    def replace_item(self, key, item: T, new_item: T) -> bool:
+        """
+        Replace `item` (compared by identity) in the deque at `key`
+        with `new_item`, keeping its position.
+
+        Returns:
+            Whether the item was found.
+        """
+
+        if not self[key].replace(item, new_item):
+            return False
+        self._remove_from_index(key, item)
+        self._add_to_index(key, new_item)
+        return True
 
     @contextmanager
     def no_moving_recent_to_front(self) -> Generator[Self, None, None]:
@@ -121,22 +478,101 @@ class DequeCache[T](InvalidationDict[str, deque[T]]):
         comp_function = (
             comp_function if not (comp_function is None) else self.compare_deque_objects
         )
-        for i, deq_ob in enumerate(self[key]):
+        for deq_ob in self[key]:
             if comp_function(comp_value, deq_ob):
-                # move the accessed object to the front
-                if self._move_newest_to_front:
-                    del self[key][i]
-                    self.get_and_update(key).appendleft(deq_ob)
-                return deq_ob
+                break
+        else:
+            raise LookupError("No matching deque value found")
 
-        raise LookupError("No matching deque value found")
+        self.touch_item(deq_ob)
+        # move the accessed object to the front
+        if self._move_newest_to_front:
+            self[key].move_to_front(deq_ob)
+            self.get_and_update(key)
+            if not (self.on_access is None):
+                self.on_access(key, deq_ob)
+        return deq_ob
 
-    def __getitem__(self, key) -> deque[T]:
+    def find_indexed_item(self, key, index_key: Hashable) -> T:
+        """
+        Find the item in the deque pointed to by `key` that is indexed
+        by `index_key`.
+
+        Raises:
+            LookupError:
+                When no item is indexed by `index_key`.
+        """
+
+        try:
+            item = self._index[key][index_key]
+        except KeyError:
+            raise LookupError("No matching deque value found")
+
+        # move the accessed object to the front
+        self._move_to_front(key, item)
+        return item
+
+    def snapshot(self) -> Self:
+        """
+        Get a copy of the cache with copies of the deques, sharing the
+        items themselves. Later changes to the deques do not affect
+        the copy.
+        """
+
+        snapshot = type(self).__new__(type(self))
+        snapshot.__dict__.update(self.__dict__)
+        snapshot._last_accessed = self._last_accessed.copy()
+        snapshot._index = {key: index.copy() for key, index in self._index.items()}
+        for key, deq in self.items():
+            dict.__setitem__(snapshot, key, deq.copy())
+        return snapshot
+
+    def __getitem__(self, key) -> RecencyDeque[T]:
         if not key in self:
             super().__setitem__(key, self._deque_factory())
         return super().__getitem__(key)
 
+    def __delitem__(self, key):
+        removed = list(self.get(key, ()))
+        super().__delitem__(key)
+        self._index.pop(key, None)
+        self._report_removed(key, removed)
+
+    def _report_removed(self, key, items: list[T]):
+
+        if not (self.on_remove is None):
+            for item in items:
+                self.on_remove(key, item)
+
+    def __getstate__(self):
+        # the index is rebuilt on unpickling instead
+        state = self.__dict__.copy()
+        state.pop("_index", None)
+        # likely methods of the owner
+        for hook in ("on_evict", "on_add", "on_remove", "on_access"):
+            state.pop(hook, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # caches pickled before `RecencyDeque` was added hold deques
+        for key, deq in list(self.items()):
+            if not isinstance(deq, RecencyDeque):
+                dict.__setitem__(self, key, RecencyDeque(deq, maxlen=deq.maxlen))
+        # caches pickled before indexing was added lack the attribute
+        if not "index_key" in state:
+            self.index_key = None
+        if not "eviction_policy" in state:
+            self.eviction_policy = None
+        self.on_evict = None
+        self.on_add = self.on_remove = self.on_access = None
+        self._index = {}
+        self.rebuild_index()
+
     @override
     def invalidate(self, key):
+        removed = list(self[key])
         self[key].clear()
+        self._index.pop(key, None)
+        self._report_removed(key, removed)
         return self
@@ -0,0 +1,185 @@
+"""
+Policies deciding which item a full `DequeCache` deque evicts.
+"""
+
+from collections.abc import Callable, Hashable, Iterable, MutableMapping
+from typing import Any
+import abc
+import heapq
+import itertools
+
+
+class EvictionPolicy[T](abc.ABC):
+    """
+    Decides which item to evict from a full deque. Without a policy,
+    `DequeCache` evicts the least recently used item.
+    """
+
+    @abc.abstractmethod
+    def touch(self, item: T):
+        """
+        Called when `item` is added to a deque, accessed, or its
+        eviction-relevant data changes.
+        """
+        ...
+
+    @abc.abstractmethod
+    def priority(self, item: T) -> float:
+        """
+        Priority of `item`, items with lower priority being evicted
+        first. Used to compare items across deques.
+        """
+        ...
+
+    @abc.abstractmethod
+    def select_victim(self, items: Iterable[T]) -> T:
+        """
+        Select the item to evict out of `items`, which is not empty.
+        Called once for each evicted item.
+        """
+        ...
+
+
+class GreedyDualSize(EvictionPolicy[MutableMapping[str, Any]]):
+    """
+    GreedyDual-Size eviction: items that are expensive to recompute per
+    byte of their size are kept over cheap, large ones, while items not
+    accessed in a while lose priority as the cache ages.
+
+    Each item's priority is the aging value of the cache plus its cost
+    per byte, set each time the item is touched. The item with the lowest
+    priority is evicted, and its priority becomes the new aging value.
+
+    Items are mappings with the cost under `cost_key` and the size in
+    bytes under `size_key`, the priority being stored under
+    `priority_key`. Items with no cost are treated as free to recompute.
+    """
+
+    def __init__(self, cost_key="cost", size_key="size", priority_key="priority"):
+
+        self.cost_key = cost_key
+        self.size_key = size_key
+        self.priority_key = priority_key
+        # the "L" value of the algorithm
+        self.aging = 0.0
+
+    def cost_per_byte(self, item: MutableMapping[str, Any]) -> float:
+
+        cost = item.get(self.cost_key)
+        if cost is None:
+            return 0.0
+        size = item.get(self.size_key)
+        return cost / max(1, 1 if size is None else size)
+
+    def touch(self, item):
+        item[self.priority_key] = self.aging + self.cost_per_byte(item)
+
+    def priority(self, item: MutableMapping[str, Any]) -> float:
+
+        priority = item.get(self.priority_key)
+        if priority is None:
+            # not touched since being loaded, for example
+            priority = self.aging + self.cost_per_byte(item)
+        return priority
+
+    def select_victim(self, items):
+
+        victim = min(items, key=self.priority)
+        self.aging = max(self.aging, self.priority(victim))
+        return victim
+
+
+class EvictionQueue[T]:
+    """
+    Items across deques in the order they should be evicted in, such
+    that victims can be taken one at a time without sorting all items
+    (e.g. to fit a budget). Items are compared by identity.
+
+    Items are pushed again when they are accessed or their priority
+    changes, the entries pushed before being skipped once popped.
+    """
+
+    def __init__(self, priority: Callable[[T], float] | None = None):
+        """
+        Arguments:
+            priority:
+                Priority of an item, items with lower priority being
+                evicted first (see `EvictionPolicy.priority`). If None,
+                the item pushed least recently is evicted first.
+        """
+
+        self.priority = priority
+        # priority, push, heap entry (as items replacing others keep
+        # their push), deque key and item
+        self._heap: list[tuple[float, int, int, Hashable, T]] = []
+        # the latest push of each item and its priority then, by its id
+        self._latest: dict[int, tuple[int, float]] = {}
+        self._pushes = itertools.count()
+        self._entries = itertools.count()
+
+    def _key(self, push: int, item: T) -> float:
+        return push if self.priority is None else self.priority(item)
+
+    def push(self, key: Hashable, item: T):
+        """
+        Add `item` of the deque at `key`, or update its position.
+        """
+
+        push = next(self._pushes)
+        self._push(self._key(push, item), push, key, item)
+
+    def _push(self, priority: float, push: int, key: Hashable, item: T):
+
+        self._latest[id(item)] = (push, priority)
+        heapq.heappush(self._heap, (priority, push, next(self._entries), key, item))
+        if len(self._heap) > 2 * len(self._latest) + 64:
+            # mostly entries pushed before
+            self._heap = [entry for entry in self._heap if self._is_latest(entry)]
+            heapq.heapify(self._heap)
+
+    def _is_latest(self, entry: tuple[float, int, int, Hashable, T]) -> bool:
+
+        latest = self._latest.get(id(entry[-1]))
+        return not (latest is None) and latest[0] == entry[1]
+
+    def replace(self, key: Hashable, item: T, new_item: T):
+        """
+        Replace `item` of the deque at `key` with `new_item`, keeping
+        its position.
+        """
+
+        latest = self._latest.pop(id(item), None)
+        if not (latest is None):
+            push, priority = latest
+            self._push(priority, push, key, new_item)
+
+    def discard(self, item: T):
+        self._latest.pop(id(item), None)
+
+    def pop(self) -> tuple[Hashable, T] | None:
+        """
+        Remove the item to evict first.
+
+        Returns:
+            The key of its deque and the item, or None if empty.
+        """
+
+        while len(self._heap) > 0:
+            entry = heapq.heappop(self._heap)
+            if not self._is_latest(entry):
+                continue
+            priority, push, _, key, item = entry
+            current = self._key(push, item)
+            if current != priority:
+                # changed without being pushed again
+                self._push(current, push, key, item)
+                continue
+            del self._latest[id(item)]
+            return key, item
+        return None
+
+    def __contains__(self, item: T) -> bool:
+        return id(item) in self._latest
+
+    def __len__(self) -> int:
+        return len(self._latest)
@@ -2,3 +2,6 @@ class StateNotFoundError(Exception): ...
 
 
 class DatabaseReadError(Exception): ...
+
+
+class FingerprintError(Exception): ...
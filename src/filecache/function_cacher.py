@@ -5,10 +5,24 @@ file.
 """
 
 from functools import wraps
-from typing import NamedTuple, Any, TypedDict, Self
-from collections.abc import Callable
+from contextlib import nullcontext, ExitStack
+from enum import Enum
+from concurrent.futures import (
+    Executor,
+    Future,
+    ThreadPoolExecutor,
+    ProcessPoolExecutor,
+)
+import asyncio
+import inspect
+import threading
+import time
+import uuid
+from typing import NamedTuple, Any, TypedDict, Self, NotRequired, Literal
+from collections.abc import Callable, Hashable, Iterable
 from collections import deque
-import copy
+from pathlib import Path
+import dbm
 import datetime as dt
 
 import logging
@@ -16,10 +30,76 @@ import logging
 logger = logging.getLogger(__name__)
 
 from .shelve_cacher import ShelveCacher
-from .utils.inspect import function_hash as hash_function, bind_arguments, unique_name
+from .invocation_store import InvocationStore, StoreChange, CompressionTotals
+from .blob_store import BlobStore, BlobRef
+from .call_log import CallLog
+from .utils.inspect import (
+    function_hash as hash_function,
+    bind_arguments,
+    ArgumentBinder,
+    unique_name,
+    source_file,
+    modified_time,
+)
 from .deque_cache import DequeCache
+from .metrics import (
+    Metrics,
+    MetricsCallback,
+    CacheStats,
+    CacherStats,
+    CompressionStats,
+)
+from .profiler import Profiler, PhaseTimer
+from .eviction import EvictionPolicy, EvictionQueue, GreedyDualSize
 from .abstract_cacher import CacherState
 from .utils.compare import compare_dict_values, CompareFuncs
+from .utils.copy_policy import (
+    CopyPolicy,
+    Unfrozen,
+    copy_to_cache,
+    copy_from_cache,
+    validate_copy_policy,
+)
+from .utils.lock import file_lock, file_locking_available
+from .utils.shelve import clear_shelve
+from .utils.size import estimate_size
+from .utils.compression import Codec, validate_codec
+from .utils.fingerprint import (
+    fingerprint_arguments,
+    FingerprinterRegistry,
+    default_fingerprinters,
+)
+from .typing import Hasher
+from .exceptions import FingerprintError, StateNotFoundError
+
+
+class NotComputed(Enum):
+    """
+    Sentinel type of `NOT_COMPUTED`.
+    """
+
+    NOT_COMPUTED = "NOT_COMPUTED"
+
+    def __repr__(self):
+        return self.value
+
+
+NOT_COMPUTED = NotComputed.NOT_COMPUTED
+"""
+Output of an invocation that is yet to be computed, so that None can
+be cached like any other output.
+"""
+
+
+class CachedException(NamedTuple):
+    """
+    Cached in place of the output of an invocation that raised
+    `exception` (see `cache_exceptions` of `FunctionCacher`), so
+    that the invocation is not computed again until it expires.
+    The exception is kept without its traceback.
+    """
+
+    exception: Exception
 
 
 class CacheLookup(NamedTuple):
@@ -32,22 +112,256 @@ class CacheLookup(NamedTuple):
         output:
             Contains the previous output from the function
             with the same input arguments.
+        entry:
+            The cached invocation, or if `output` is `NOT_COMPUTED`,
+            the invocation to add to the cache once its output is
+            computed.
+        stale:
+            Whether `output` has expired but may still be returned
+            while the invocation is computed again.
     """
 
     function_hash: str
     input: dict
-    output: Any = None
+    output: Any = NOT_COMPUTED
+    entry: "InputOutputDict | None" = None
+    stale: bool = False
 
 
 class InputOutputDict(TypedDict):
+    """
+    Invocations that are yet to be read from file (see the `lazy`
+    argument of `FunctionCacher`) have only `key` and `id`.
+
+    Attributes:
+        input:
+            The bound input arguments.
+        output:
+            The output from the function, or a `BlobRef` to it if
+            saved out of line and not read yet, or a `CachedException`
+            if the invocation raised. `NOT_COMPUTED` until computed,
+            before the invocation is added to the cache.
+        key:
+            Fingerprint of `input` that the invocation is indexed by,
+            or None if `input` could not be fingerprinted.
+        id:
+            Unique id of the invocation.
+        cost:
+            Wall-clock time in seconds it took to compute `output`.
+        size:
+            Estimated serialized size of `output` in bytes.
+        priority:
+            Priority set by the eviction policy, if any.
+        expires:
+            Time (in seconds since the epoch) after which the
+            invocation is no longer valid, or None if it stays valid.
+    """
 
     input: Any
     output: Any
+    key: NotRequired[Hashable | None]
+    id: NotRequired[str]
+    cost: NotRequired[float]
+    size: NotRequired[int]
+    priority: NotRequired[float]
+    expires: NotRequired[float | None]
+
+
+type Eviction = Literal["lru", "greedy_dual_size"]
+EVICTIONS: tuple[Eviction, ...] = ("lru", "greedy_dual_size")
 
 
 type Cache = DequeCache[InputOutputDict]
 
 
+def _invocation_index_key(input_output: InputOutputDict) -> Hashable | None:
+    return input_output.get("key")
+
+
+def _is_unread(input_output: InputOutputDict) -> bool:
+    """
+    Whether the invocation is yet to be read from file.
+    """
+    return not "input" in input_output
+
+
+def _in_memory(input_output: InputOutputDict) -> bool:
+    """
+    Whether the output of the invocation is held in memory.
+    """
+    return not _is_unread(input_output) and not isinstance(
+        input_output["output"], BlobRef
+    )
+
+
+def _is_placeholder(input_output: InputOutputDict) -> bool:
+    """
+    Whether the invocation was never computed, e.g. one left in the cache
+    by earlier versions, which added invocations before computing them
+    and marked them with an output of None.
+    """
+    return not _is_unread(input_output) and (
+        input_output["output"] is NOT_COMPUTED
+        or (input_output["output"] is None and not "cost" in input_output)
+    )
+
+
+def _unread(input_output: InputOutputDict) -> InputOutputDict:
+    """
+    Copy of the invocation without the parts read from file.
+    """
+    return {
+        key: value
+        for key, value in input_output.items()
+        if not key in ("input", "output")
+    }
+
+
+def _expired(
+    input_output: InputOutputDict, now: float | None = None, grace: float = 0.0
+) -> bool:
+    """
+    Whether the invocation expired more than `grace` seconds ago.
+    """
+
+    expires = input_output.get("expires")
+    if expires is None:
+        return False
+    return expires + grace <= (time.time() if now is None else now)
+
+
+def _validate_ttl(ttl: dt.timedelta | None):
+
+    if not (ttl is None or isinstance(ttl, dt.timedelta)):
+        raise TypeError("ttl should be a timedelta")
+    if not (ttl is None) and ttl < dt.timedelta():
+        raise ValueError("ttl should be positive")
+    return ttl
+
+
+# fraction of the byte budgets evicted down to once exceeded, such that
+# the next few invocations fit without evicting again
+_LOW_WATERMARK = 0.9
+
+
+def _exceeds(size: int, budget: int | None, fraction: float = 1.0) -> bool:
+    return not (budget is None) and size > budget * fraction
+
+
+def _with_ttl(invoke: Callable) -> Callable:
+    """
+    Create the `with_ttl` attribute of a wrapper function invoking
+    the function with `invoke(args, kwargs, ttl)`.
+    """
+
+    def with_ttl(ttl: dt.timedelta) -> Callable:
+        """
+        Get a function invoking the wrapped function such that the
+        output, if computed, stays valid for `ttl`.
+        """
+
+        _validate_ttl(ttl)
+        return lambda *args, **kwargs: invoke(args, kwargs, ttl)
+
+    return with_ttl
+
+
+def _timed_call(func: Callable, args: tuple, kwargs: dict) -> tuple[Any, float]:
+    """
+    Call `func` with `args` and `kwargs`, bypassing the cacher if `func`
+    is a wrapper function (e.g. in a worker process, where `func` is
+    pickled by reference to the wrapper).
+
+    Returns:
+        The output and the seconds it took to compute.
+    """
+
+    func = getattr(func, "__wrapped__", func)
+    start = time.perf_counter()
+    output = func(*args, **kwargs)
+    return output, time.perf_counter() - start
+
+
+_EPOCH = dt.datetime.min.replace(tzinfo=dt.timezone.utc)
+
+
+class WrappedFunction:
+    """
+    State kept by a `FunctionCacher` for each function it wraps.
+
+    The hash of the function is computed once when the function is
+    wrapped, and only computed again if the file the function is
+    defined in has been modified since (or `.rehash` is called).
+
+    Attributes:
+        func:
+            The wrapped function.
+        name:
+            Unique name of the function.
+        binder:
+            Binds call arguments to the signature of the function.
+        copy_policy:
+            How outputs of the function are copied, or None to use
+            the policy of the cacher.
+        ttl:
+            How long outputs of the function stay valid, or None to
+            use `valid_for` of the cacher.
+        compare_funcs:
+            Functions comparing arguments of the function, or None
+            to use those of the cacher.
+        wrapper:
+            The wrapper function returned by the cacher.
+        lock:
+            Lock guarding the cached invocations of the function
+            when the cacher is thread-safe.
+    """
+
+    def __init__(
+        self,
+        func: Callable,
+        hasher: Callable[[], Hasher],
+        copy_policy: CopyPolicy | None = None,
+        ttl: dt.timedelta | None = None,
+        compare_funcs: CompareFuncs = None,
+    ):
+
+        self.func = func
+        self.name = unique_name(func)
+        self.binder = ArgumentBinder(func)
+        self.copy_policy = (
+            None if copy_policy is None else validate_copy_policy(copy_policy)
+        )
+        self.ttl = _validate_ttl(ttl)
+        self.compare_funcs = compare_funcs
+        self.wrapper: Callable | None = None
+        self.lock = threading.Lock()
+        self._hasher = hasher
+        self._source_file = source_file(func)
+        self._source_mtime: int | None = None
+        self._function_hash: str = ""
+        self.rehash()
+
+    def rehash(self) -> str:
+        """
+        Compute the hash of the function again.
+        """
+
+        self._source_mtime = modified_time(self._source_file)
+        self._function_hash = hash_function(self.func, hasher=self._hasher())
+        return self._function_hash
+
+    @property
+    def function_hash(self) -> str:
+        """
+        The hash of the function, recomputed if the source file
+        has been modified.
+        """
+
+        if modified_time(self._source_file) != self._source_mtime:
+            self.rehash()
+        return self._function_hash
+
+
 # TODO:
 # Another issue maybe how to work with methods. Just add an option
 # to the wrapper for wrapping a method instead?
@@ -64,7 +378,30 @@ class FunctionCacher(ShelveCacher):
     """
 
     def __init__(
-        self, cache_size: int | None = None, valid_for=dt.timedelta.max, *args, **kwargs
+        self,
+        cache_size: int | None = None,
+        valid_for=dt.timedelta.max,
+        *args,
+        fingerprinters: FingerprinterRegistry | None = None,
+        copy: CopyPolicy = "deep",
+        thread_safe=False,
+        shared=False,
+        lazy=False,
+        eviction: Eviction = "lru",
+        max_memory_bytes: int | None = None,
+        max_disk_bytes: int | None = None,
+        size_estimator: Callable[[Any], int] = estimate_size,
+        stale_while_revalidate: dt.timedelta | None = None,
+        metrics=False,
+        metrics_callback: MetricsCallback | None = None,
+        profile=False,
+        blob_threshold: int | None = None,
+        compression: Codec | None = None,
+        compression_threshold: int = 1024,
+        call_log: Path | None = None,
+        cache_exceptions: tuple[type[Exception], ...] = (),
+        exception_ttl=dt.timedelta(minutes=1),
+        **kwargs,
     ):
         """
 
@@ -72,23 +409,346 @@ class FunctionCacher(ShelveCacher):
             cache_size:
                 How large the LRU caches should be.
             valid_for:
-                How long cached values are valid.
+                How long cached values are valid, by default. Each
+                invocation expires this long after it was computed,
+                unless a different `ttl` is given for the function
+                or the call (see `__call__`). Expired invocations are
+                removed when looked up or by `.remove_expired`.
+            fingerprinters:
+                Fingerprinters used to index invocations by the contents
+                of argument types that are not hashable by default (see
+                `utils.fingerprint`). Fingerprinters can also be
+                registered on `.fingerprinters` later. Fingerprinters
+                registered in `utils.fingerprint.default_fingerprinters`
+                are used as a fallback.
+            copy:
+                How outputs are copied when stored in and returned
+                from the cache:
+                    - "deep": deepcopy on both (the default)
+                    - "none": no copying, the cached object is shared
+                      with the caller
+                    - "shallow": shallow copy on both
+                    - "pickle": pickle round-trip on both, often faster
+                      than deepcopy
+                    - "freeze": convert to an immutable version once
+                      when stored (see `utils.copy_policy.freeze`),
+                      returning the same object on each hit (values
+                      that cannot be frozen are deep-copied on both)
+            thread_safe:
+                Whether wrapped functions may be invoked from multiple
+                threads. Invocations of each function are then guarded
+                by a lock of their own, and concurrent invocations
+                with the same input share a single computation.
+                Saving works on a snapshot of the cache.
+            shared:
+                Whether the cache file is shared between processes
+                (e.g. workers of a server). Access to the file is
+                guarded by an advisory lock, saving appends the changes
+                after the ones saved by other processes instead of
+                overwriting them, and
+                on a miss, invocations saved by other processes are
+                looked up before computing. Not available on platforms
+                without `fcntl`.
+            lazy:
+                Whether to load only the index of the cached invocations
+                from file, reading each invocation from file the first
+                time it is looked up. `.get_cached_data` reads all the
+                invocations of the function.
+            eviction:
+                Which invocation of a function to evict once
+                `cache_size` invocations are cached:
+                    - "lru": the least recently used one (the default)
+                    - "greedy_dual_size": the one that is cheapest to
+                      compute again per byte of output, aged by how
+                      recently it was used (see `eviction.GreedyDualSize`)
+            max_memory_bytes:
+                Max total estimated size of the outputs held in memory,
+                across all functions. When exceeded, invocations are
+                evicted in the order given by `eviction` down to 90%
+                of the budget, those saved
+                to file being only dropped from memory, to be read
+                again when looked up.
+            max_disk_bytes:
+                Max total estimated size of the outputs cached, in
+                memory or on file, across all functions. When exceeded,
+                invocations are evicted in the order given by `eviction`
+                down to 90% of the budget.
+                With a shared cache, only counts the invocations known
+                to this cacher.
+            size_estimator:
+                Function estimating the size of each output in bytes
+                when cached, for the budgets, `eviction`, `.stats`
+                and `blob_threshold`. By default a cheap estimate
+                (see `utils.size.estimate_size`); `utils.size.pickled_size`
+                is exact, but pickles each output computed.
+            stale_while_revalidate:
+                How long after expiring an invocation's output is still
+                returned, while the invocation is computed again in
+                the background (in a single worker thread for regular
+                functions, or as a task for coroutine functions). If
+                None, expired invocations are computed again by the
+                caller.
+            metrics:
+                Whether to record counters and latencies (see `.stats`).
+                Off by default, as recording adds to the latency of
+                each invocation.
+            metrics_callback:
+                Called with the name of the metric, the name of the
+                function (None if not specific to one) and the value
+                each time a metric is recorded, e.g. for exporting the
+                metrics. Requires `metrics`.
+            profile:
+                Whether to time each phase of invocations of the wrapped
+                functions (see `profiler.PHASES`), reported by
+                `.profiler.report()`. Can also be turned on later by
+                setting `.profiler` to a `profiler.Profiler`.
+            blob_threshold:
+                Outputs with an estimated size of at least this many
+                bytes are saved to files of their own next to the save
+                path (see `blob_store.BlobStore`), named by their
+                contents, instead of inside the log. Such outputs
+                are only read from file when looked up. If None, all
+                outputs are saved inside the log.
+            compression:
+                Codec ("zlib", "bz2" or "lzma") each invocation saved
+                inside the log is compressed with, or None to not
+                compress them. Outputs saved out of line are not
+                compressed. The ratio achieved is reported by `.stats`.
+            compression_threshold:
+                Invocations whose pickled size is less than this many
+                bytes are not compressed.
+            call_log:
+                File to record the computed invocations to (see
+                `call_log.CallLog`), e.g. for computing them again
+                with `.warm` after the functions have changed.
+            cache_exceptions:
+                Types of exceptions that are cached when raised by the
+                wrapped functions, such that invocations raising them
+                raise them again without being computed until they
+                expire (see `CachedException`). Exceptions that cannot
+                be pickled are not cached. Cached exceptions are saved
+                with the next save.
+            exception_ttl:
+                How long cached exceptions stay valid.
         """
 
+        if shared and not file_locking_available():
+            raise NotImplementedError("Shared caches require file locking")
+
+        # needed when loading the cache during initialisation
+        self.shared = shared
+        self.lazy = lazy
+        if not eviction in EVICTIONS:
+            raise ValueError(f"eviction should be one of {EVICTIONS}")
+        self.eviction = eviction
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.size_estimator = size_estimator
+        # sizes of the outputs counted against the budgets
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        # and per function, by function hash, for `.stats`
+        self._function_bytes: dict[str, list[int]] = {}
+        self._budget_check_due = False
+        # the invocations in memory and all the invocations, in the order
+        # they are evicted in to fit the budgets (see `._recount_bytes`)
+        self._eviction_queues: (
+            tuple[EvictionQueue[InputOutputDict], EvictionQueue[InputOutputDict]] | None
+        ) = None
+        self.stale_while_revalidate = _validate_ttl(stale_while_revalidate)
+        self.metrics = Metrics(metrics_callback) if metrics else None
+        self.profiler = Profiler() if profile else None
+        self._wrapped_functions: dict[Callable, WrappedFunction] = {}
+        self.blob_threshold = blob_threshold
+        self.compression = None if compression is None else validate_codec(compression)
+        self.compression_threshold = compression_threshold
+        self._compression_totals = CompressionTotals()
+        self.call_log = None if call_log is None else CallLog(call_log)
+        self.cache_exceptions = cache_exceptions
+        self.exception_ttl = _validate_ttl(exception_ttl)
+        # the latest change to each invocation since the cache was last
+        # loaded from or saved to `.save_path`, in order, by invocation
+        # id: the function hash, and the invocation or None if removed
+        self._changes: dict[str, tuple[str, InputOutputDict | None]] = {}
+        # whether `._changes` are all that differs between the cache
+        # and the one saved to `.save_path`
+        self._synced = False
+        self._store: InvocationStore | None = None
+        # set by `._load_invocations`
+        self._loaded_log = False
+        self._unloaded: list[tuple[str, str]] = []
+        self.fingerprinters = (
+            FingerprinterRegistry(parent=default_fingerprinters)
+            if fingerprinters is None
+            else fingerprinters
+        )
         super().__init__(*args, **kwargs)
         self.cache: Cache  # needs a little help with the typing
+        if self.cache.eviction_policy is None:
+            self.cache.eviction_policy = self._new_eviction_policy()
+        self.cache.on_evict = self._on_evict
+        self._track_changes()
+        if not self._synced:
+            # nothing saved that the cache could differ from
+            self._synced = not (
+                self._own_store().exists() or dbm.whichdb(self.save_path) is not None
+            )
         self.valid_for = valid_for
         self.cache_size = cache_size
         self.compare_funcs: CompareFuncs = None
+        self.copy_policy = copy
+        self.thread_safe = thread_safe
 
-        self._function_name_to_hash: dict[str, str] = {}
+        # invocations being computed and the futures their outputs are
+        # set to, by function hash
+        self._in_flight: dict[str, list[tuple[InputOutputDict, Future]]] = {}
+        self._save_lock = threading.Lock()
+        # ids of invocations being computed again in the background
+        self._revalidating: set[str] = set()
+        self._revalidate_lock = threading.Lock()
+        self._revalidate_executor: ThreadPoolExecutor | None = None
+        self._revalidate_tasks: set[asyncio.Task] = set()
+        # coroutine invocations being computed for their callers
+        self._compute_tasks: set[asyncio.Task] = set()
 
     def set_auto_save(self, val):
         return super().set_auto_save(val)
 
+    @property
+    def copy_policy(self) -> CopyPolicy:
+        return self._copy_policy
+
+    @copy_policy.setter
+    def copy_policy(self, val: CopyPolicy):
+        self._copy_policy = validate_copy_policy(val)
+
+    @property
+    def _guarded(self) -> bool:
+        """
+        Whether the cache is accessed from multiple threads, either by
+        the wrapped functions, background saving or revalidation.
+        """
+        return (
+            self.thread_safe
+            or self.auto_save == "background"
+            or not (self.stale_while_revalidate is None)
+        )
+
+    def _lock(self, wrapped: WrappedFunction):
+
+        return wrapped.lock if self._guarded else nullcontext()
+
+    def _get_copy_policy(self, wrapped: WrappedFunction) -> CopyPolicy:
+
+        if wrapped.copy_policy is None:
+            return self.copy_policy
+        return wrapped.copy_policy
+
+    def _new_eviction_policy(self) -> EvictionPolicy[InputOutputDict] | None:
+
+        if self.eviction == "greedy_dual_size":
+            return GreedyDualSize()
+        return None
+
+    def _copy_in(self, wrapped: WrappedFunction, output):
+        """
+        Copy `output` of `wrapped` to be stored in the cache.
+        """
+
+        copy_policy = self._get_copy_policy(wrapped)
+        if self.metrics is None:
+            return copy_to_cache(output, copy_policy)
+        start = time.perf_counter()
+        copied = copy_to_cache(output, copy_policy)
+        self.metrics.observe("copy", time.perf_counter() - start, wrapped.name)
+        return copied
+
+    def _copy_out(self, wrapped: WrappedFunction, output):
+        """
+        Copy `output` of `wrapped` to be returned from the cache,
+        or raise a copy of the exception if `output` is a
+        `CachedException`.
+        """
+
+        if isinstance(output, CachedException):
+            raise copy_from_cache(output.exception, "pickle")
+        copy_policy = self._get_copy_policy(wrapped)
+        if self.metrics is None:
+            return copy_from_cache(output, copy_policy)
+        start = time.perf_counter()
+        copied = copy_from_cache(output, copy_policy)
+        self.metrics.observe("copy", time.perf_counter() - start, wrapped.name)
+        return copied
+
+    def _computed_output(self, wrapped: WrappedFunction, output, copied):
+        """
+        Output of `wrapped` to return to the caller that computed it,
+        given the copy of it stored in the cache: the stored copy if
+        frozen, such that misses and hits return the same immutable
+        value, otherwise the output itself.
+        """
+
+        if self._get_copy_policy(wrapped) == "freeze" and not isinstance(
+            copied, Unfrozen
+        ):
+            return copied
+        return output
+
+    def _function_name(self, function_hash: str) -> str:
+        """
+        Name of the wrapped function with hash `function_hash`,
+        or the hash if there is none.
+        """
+
+        for wrapped in list(self._wrapped_functions.values()):
+            if wrapped._function_hash == function_hash:
+                return wrapped.name
+        return function_hash
+
+    def _count(self, name: str, function_hash: str, value=1):
+
+        if not (self.metrics is None):
+            self.metrics.count(name, self._function_name(function_hash), value)
+
+    def _on_evict(self, function_hash: str, input_output: InputOutputDict):
+        self._count("evictions", function_hash)
+
+    def _track_changes(self):
+        """
+        Keep track of the changes to the cache to save (see `._changes`)
+        and of the sizes of the outputs cached (see `._recount_bytes`).
+        """
+
+        self.cache.on_add = self._on_add
+        self.cache.on_access = self._on_change
+        self.cache.on_remove = self._on_remove
+        self._recount_bytes()
+
+    def _on_add(self, function_hash: str, input_output: InputOutputDict):
+        self._count_bytes(function_hash, input_output)
+        self._on_change(function_hash, input_output)
+
+    def _on_change(self, function_hash: str, input_output: InputOutputDict):
+        self._record_change(function_hash, input_output["id"], input_output)
+        self._queue_for_eviction(function_hash, input_output)
+
+    def _on_remove(self, function_hash: str, input_output: InputOutputDict):
+        self._record_change(function_hash, input_output["id"], None)
+        self._count_bytes(function_hash, input_output, -1)
+        if not (self._eviction_queues is None):
+            for queue in self._eviction_queues:
+                queue.discard(input_output)
+
+    def _record_change(
+        self, function_hash: str, entry_id: str, input_output: InputOutputDict | None
+    ):
+
+        self._changes.pop(entry_id, None)
+        self._changes[entry_id] = (function_hash, input_output)
+
     @classmethod
     def new_cache(cls):
-        return DequeCache[InputOutputDict]()
+        return DequeCache[InputOutputDict](index_key=_invocation_index_key)
 
     @property
     def cache_size(self):
@@ -106,43 +766,824 @@ class FunctionCacher(ShelveCacher):
     def valid_for(self, val):
         self.cache.valid_for = val
 
+    def _get_wrapped(self, func: Callable) -> WrappedFunction | None:
+        """
+        Get the state of `func`, which may be either the original
+        function or the wrapper returned by the cacher.
+        """
+
+        wrapped = self._wrapped_functions.get(func)
+        if wrapped is None:
+            wrapped = self._wrapped_functions.get(getattr(func, "__wrapped__", None))
+        return wrapped
+
     def hash_function(self, func):
-        return hash_function(func, hasher=self.hasher())
+        """
+        Get the hash of `func`. For functions wrapped by this cacher,
+        the previously computed hash is reused.
+        """
+
+        wrapped = self._get_wrapped(func)
+        if wrapped is None:
+            return hash_function(func, hasher=self.hasher())
+        return self._current_hash(wrapped)
+
+    def _current_hash(self, wrapped: WrappedFunction) -> str:
+
+        function_hash = wrapped.function_hash
+        # initialise the cache if the hash changed
+        self.cache[function_hash]
+        return function_hash
+
+    def rehash(self, func: Callable | None = None):
+        """
+        Compute the hash of `func` again, e.g. after its source
+        has been changed without the modification time of its file
+        changing. If `func` is None, rehash all wrapped functions.
+        """
+
+        if func is None:
+            wrapped_functions = self._wrapped_functions.values()
+        else:
+            wrapped = self._get_wrapped(func)
+            if wrapped is None:
+                raise LookupError("Function is not wrapped by this cacher")
+            wrapped_functions = [wrapped]
+
+        for wrapped in wrapped_functions:
+            self.cache[wrapped.rehash()]
+        return self
+
+    def _fingerprint_input(self, bound_args: dict) -> Hashable | None:
+
+        try:
+            return fingerprint_arguments(bound_args, self.hasher, self.fingerprinters)
+        except FingerprintError:
+            return None
 
     def lookup_function(
         self, func: Callable, args, kwargs, compare_funcs: CompareFuncs = None
     ) -> CacheLookup:
         """
         Look for an invocation of `func()` invoked with
-        `args` and `kwargs`, initialising the entry if not found.
-        Mainly used internally.
+        `args` and `kwargs`, initialising the entry to add to the cache
+        once computed if not found. Mainly used internally.
         """
 
-        function_hash = self.hash_function(func)
-        bound_args = bind_arguments(func, args, kwargs)
+        return self._lookup_function(
+            func, self._get_wrapped(func), args, kwargs, compare_funcs
+        )
+
+    def _lookup_function(
+        self,
+        func: Callable,
+        wrapped: WrappedFunction | None,
+        args,
+        kwargs,
+        compare_funcs: CompareFuncs = None,
+        timer: PhaseTimer | None = None,
+    ) -> CacheLookup:
+
+        if self.metrics is None:
+            return self._lookup(func, wrapped, args, kwargs, compare_funcs, timer)
+
+        start = time.perf_counter()
+        lookup = self._lookup(func, wrapped, args, kwargs, compare_funcs, timer)
+        name = unique_name(func) if wrapped is None else wrapped.name
+        self.metrics.observe("lookup", time.perf_counter() - start, name)
+        self.metrics.count("misses" if lookup.output is NOT_COMPUTED else "hits", name)
+        return lookup
+
+    def _lookup(
+        self,
+        func: Callable,
+        wrapped: WrappedFunction | None,
+        args,
+        kwargs,
+        compare_funcs: CompareFuncs = None,
+        timer: PhaseTimer | None = None,
+    ) -> CacheLookup:
+
+        if wrapped is None:
+            function_hash = hash_function(func, hasher=self.hasher())
+            if not (timer is None):
+                timer.lap("hash")
+            bound_args = bind_arguments(func, args, kwargs)
+        else:
+            function_hash = self._current_hash(wrapped)
+            if not (timer is None):
+                timer.lap("hash")
+            bound_args = wrapped.binder.bind(args, kwargs)
+        if not (timer is None):
+            timer.lap("bind")
+
+        compare_funcs = compare_funcs or self.compare_funcs
+        # comparison functions may match arguments that differ, so
+        # arguments are not looked up by fingerprint when given
+        index_key = None if compare_funcs else self._fingerprint_input(bound_args)
+        if not (timer is None):
+            timer.lap("fingerprint")
+        # looking up by index, or comparing against each invocation
+        lookup_phase = "compare" if index_key is None else "index"
+
+        if self.lazy and index_key is None:
+            # compared against the input of each invocation it can match
+            self._read_invocations(
+                function_hash,
+                [
+                    input_output
+                    for input_output in self.cache[function_hash]
+                    if compare_funcs or input_output.get("key") is None
+                ],
+            )
 
         # look for previous output that matches the function and call signature
-        if function_hash in self.cache:
+        try:
             try:
-                compare_funcs = compare_funcs or self.compare_funcs
-                input_output: InputOutputDict = self.cache.find_cached_item(
-                    function_hash,
-                    bound_args,
-                    lambda one, two: not any(
-                        compare_dict_values(one, two["input"], compare_funcs).values()
-                    ),
+                input_output = self._find_invocation(
+                    self.cache, function_hash, bound_args, index_key, compare_funcs
                 )
-                previous_output = input_output["output"]
-                return CacheLookup(function_hash, bound_args, previous_output)
+                if not _in_memory(input_output) and not (
+                    self._read_invocations(function_hash, [input_output])
+                    and self._read_blobs(function_hash, [input_output])
+                ):
+                    raise LookupError("Invocation no longer on file")
             except LookupError:
-                logger.debug("No previous value found")
-                pass
+                # might have been computed by another process
+                if not (self.shared and self._pull_shared(function_hash, index_key)):
+                    raise
+                input_output = self._find_invocation(
+                    self.cache, function_hash, bound_args, index_key, compare_funcs
+                )
+            stale = _expired(input_output)
+            if stale and (
+                # exceptions are not raised again while computing again
+                isinstance(input_output["output"], CachedException)
+                or _expired(input_output, grace=self._stale_grace())
+            ):
+                self.cache.remove_item(function_hash, input_output)
+                self._count("expirations", function_hash)
+                raise LookupError("Invocation expired")
+            previous_output = input_output["output"]
+            if not (timer is None):
+                timer.lap(lookup_phase)
+            return CacheLookup(
+                function_hash, bound_args, previous_output, input_output, stale
+            )
+        except LookupError:
+            logger.debug("No previous value found")
+
+        # added to the cache once computed (see `._store_output`), so that
+        # invocations that raise do not evict others
+        input_output: InputOutputDict = {
+            "input": bound_args,
+            "output": NOT_COMPUTED,
+            "key": index_key,
+            "id": uuid.uuid4().hex,
+        }
+        if not (timer is None):
+            timer.lap(lookup_phase)
+        return CacheLookup(function_hash, bound_args, NOT_COMPUTED, input_output)
+
+    @staticmethod
+    def _find_invocation(
+        cache: Cache,
+        function_hash: str,
+        bound_args: dict,
+        index_key: Hashable | None,
+        compare_funcs: CompareFuncs,
+    ) -> InputOutputDict:
+        """
+        Find the invocation of the function with hash `function_hash`
+        in `cache` that matches `bound_args`.
+
+        Raises:
+            LookupError:
+                No matching invocation was found.
+        """
 
-        # shouldn't update the access time as output isn't actually set
-        self.cache[function_hash].appendleft({"input": bound_args, "output": None})
-        return CacheLookup(function_hash, bound_args, None)
+        if not (index_key is None):
+            return cache.find_indexed_item(function_hash, index_key)
 
-    def __call__(self, compare_funcs: CompareFuncs = None):
+        # not indexable or compared by `compare_funcs`, fall back to
+        # comparing against each invocation
+        return cache.find_cached_item(
+            function_hash,
+            bound_args,
+            lambda one, two: FunctionCacher._matches(two, one, None, compare_funcs),
+        )
+
+    @staticmethod
+    def _matches(
+        input_output: InputOutputDict,
+        bound_args: dict,
+        index_key: Hashable | None,
+        compare_funcs: CompareFuncs,
+    ) -> bool:
+        """
+        Whether `input_output` is an invocation with `bound_args`,
+        fingerprinted as `index_key`.
+        """
+
+        if not (index_key is None):
+            return input_output.get("key") == index_key
+        if not compare_funcs and not (input_output.get("key") is None):
+            # arguments that can be fingerprinted equal no others
+            return False
+        differences = compare_dict_values(
+            bound_args, input_output["input"], compare_funcs
+        )
+        return not any(differences.values())
+
+    def _read_invocations(
+        self, function_hash: str, invocations: list[InputOutputDict]
+    ) -> bool:
+        """
+        Read those of `invocations` of the function with hash
+        `function_hash` that are yet to be read from file, in place.
+        Invocations no longer on file are removed from the cache.
+
+        Returns:
+            Whether all of `invocations` have been read.
+        """
+
+        unread = {
+            input_output["id"]: input_output
+            for input_output in invocations
+            if _is_unread(input_output)
+        }
+        if len(unread) == 0:
+            return True
+
+        store = self._own_store()
+        with self._file_lock(self.save_path, shared=True):
+            records = store.read_entries(unread)
+
+        for entry_id, input_output in unread.items():
+            if entry_id in records:
+                input_output.update(records[entry_id])
+                self._count_bytes(function_hash, input_output, disk=False)
+                self._queue_for_eviction(function_hash, input_output, disk=False)
+            else:
+                self.cache.remove_item(function_hash, input_output)
+        return len(records) == len(unread)
+
+    def _blob_store(self, path: Path | None = None) -> BlobStore:
+        """
+        Store of the outputs saved out of line next to `path`, in a
+        directory of its own such that clearing the cache at `path`
+        leaves the blobs of caches saved next to it.
+        """
+
+        path = self.save_path if path is None else path
+        return BlobStore(path.with_name(f"{path.name}.blobs"), self.hasher)
+
+    def _read_blobs(
+        self, function_hash: str, invocations: list[InputOutputDict]
+    ) -> bool:
+        """
+        Read the outputs of those of `invocations` of the function with
+        hash `function_hash` that are saved out of line, in place.
+        Invocations whose output is no longer on file are removed
+        from the cache.
+
+        Returns:
+            Whether the outputs of all of `invocations` have been read.
+        """
+
+        store = self._blob_store()
+        read = True
+        for input_output in invocations:
+            if _is_unread(input_output) or _in_memory(input_output):
+                continue
+            try:
+                input_output["output"] = store.read(input_output["output"])
+            except FileNotFoundError:
+                self.cache.remove_item(function_hash, input_output)
+                read = False
+                continue
+            self._count_bytes(function_hash, input_output, disk=False)
+            self._queue_for_eviction(function_hash, input_output, disk=False)
+        return read
+
+    @property
+    def _budgeted(self) -> bool:
+        return not (self.max_memory_bytes is None and self.max_disk_bytes is None)
+
+    def _over_budget(self, fraction: float = 1.0) -> bool:
+
+        return _exceeds(self._memory_bytes, self.max_memory_bytes, fraction) or (
+            _exceeds(self._disk_bytes, self.max_disk_bytes, fraction)
+        )
+
+    def _count_bytes(
+        self, function_hash: str, input_output: InputOutputDict, sign=1, disk=True
+    ):
+        """
+        Count the size of the output of `input_output` of the function
+        with hash `function_hash` against the memory budget if in memory,
+        and against the disk budget if `disk`, adding it if `sign` is 1
+        or subtracting it if -1.
+        """
+
+        size = sign * (input_output.get("size") or 0)
+        function_bytes = self._function_bytes.setdefault(function_hash, [0, 0])
+        if _in_memory(input_output):
+            self._memory_bytes += size
+            function_bytes[0] += size
+        if disk:
+            self._disk_bytes += size
+            function_bytes[1] += size
+        if size > 0 and self._over_budget():
+            self._budget_check_due = True
+
+    def _queue_for_eviction(
+        self, function_hash: str, input_output: InputOutputDict, disk=True
+    ):
+        """
+        Add `input_output` of the function with hash `function_hash` to
+        the eviction queues, or move it to its new position (e.g. after
+        being accessed). Only queued for memory if not `disk`.
+        """
+
+        if self._eviction_queues is None:
+            return
+        memory_queue, disk_queue = self._eviction_queues
+        if _in_memory(input_output):
+            memory_queue.push(function_hash, input_output)
+        if disk:
+            disk_queue.push(function_hash, input_output)
+
+    def _recount_bytes(self):
+        """
+        Count the sizes of all the cached outputs against the budgets
+        again, and queue the invocations for eviction if there are any
+        budgets, such that the sizes are kept up to date as invocations
+        are added and removed.
+        """
+
+        self._memory_bytes = self._disk_bytes = 0
+        self._function_bytes = {}
+        budgeted = self._budgeted
+        if budgeted:
+            policy = self.cache.eviction_policy
+            priority = None if policy is None else policy.priority
+            self._eviction_queues = (EvictionQueue(priority), EvictionQueue(priority))
+        else:
+            self._eviction_queues = None
+
+        # least recently used function first, back of the deque first
+        last_accessed = self.cache._last_accessed
+        for function_hash in sorted(
+            self.cache, key=lambda key: last_accessed.get(key, _EPOCH)
+        ):
+            for input_output in reversed(self.cache[function_hash]):
+                if _in_memory(input_output):
+                    if input_output.get("size") is None:
+                        # cached before sizes were recorded
+                        input_output["size"] = self.size_estimator(
+                            input_output["output"]
+                        )
+                self._count_bytes(function_hash, input_output)
+                self._queue_for_eviction(function_hash, input_output)
+
+    def stats(self) -> CacherStats:
+        """
+        Get the recorded counters and latencies (see `metrics.COUNTERS`
+        and `metrics.TIMINGS`, empty if `metrics` is False), along with
+        the number of cached invocations and the estimated size of
+        their outputs, in total and per function, and the compression
+        achieved when saving (see `compression`).
+        """
+
+        # number of invocations, memory bytes, disk bytes by function
+        sizes: dict[str, list[int]] = {}
+        with self._all_locks():
+            for function_hash, deq in self.cache.items():
+                name = self._function_name(function_hash)
+                function_sizes = sizes.setdefault(name, [0, 0, 0])
+                memory, disk = self._function_bytes.get(function_hash, (0, 0))
+                function_sizes[0] += len(deq)
+                function_sizes[1] += memory
+                function_sizes[2] += disk
+
+        metrics = Metrics() if self.metrics is None else self.metrics
+
+        def cache_stats(name: str | None, entries, memory_bytes, disk_bytes):
+            return CacheStats(
+                **metrics.scope_stats(name),
+                entries=entries,
+                memory_bytes=memory_bytes,
+                disk_bytes=disk_bytes,
+            )
+
+        functions = {
+            name: cache_stats(name, *sizes.get(name, [0, 0, 0]))
+            for name in sizes.keys() | set(metrics.functions)
+        }
+        totals = [sum(column) for column in zip([0, 0, 0], *sizes.values())]
+        compression = self._compression_totals
+        return CacherStats(
+            **cache_stats(None, *totals),
+            functions=functions,
+            compression=CompressionStats(
+                **compression._asdict(),
+                ratio=(
+                    compression.uncompressed_bytes / compression.compressed_bytes
+                    if compression.entries > 0
+                    else 1.0
+                ),
+            ),
+        )
+
+    def remove_expired(self) -> int:
+        """
+        Remove the expired invocations of all functions, apart from
+        those that may still be returned while being computed again
+        (see `stale_while_revalidate`). Invocations yet to be read from
+        file are only removed once read.
+
+        Returns:
+            The number of invocations removed.
+        """
+
+        removed = 0
+        now = time.time()
+        with self._all_locks():
+            for function_hash, deq in list(self.cache.items()):
+                for input_output in [
+                    input_output
+                    for input_output in deq
+                    if _expired(input_output, now, self._stale_grace())
+                ]:
+                    self.cache.remove_item(function_hash, input_output)
+                    self._count("expirations", function_hash)
+                    removed += 1
+        return removed
+
+    def enforce_byte_budgets(self):
+        """
+        Evict invocations across all functions until the outputs fit in
+        `_LOW_WATERMARK` of `.max_memory_bytes` and `.max_disk_bytes`.
+        Called automatically when the budgets have been exceeded.
+        """
+
+        with self._all_locks():
+            if self._eviction_queues is None:
+                self._recount_bytes()
+            self._budget_check_due = False
+            if self._eviction_queues is None or not self._over_budget():
+                return
+
+            memory_queue, disk_queue = self._eviction_queues
+            policy = self.cache.eviction_policy
+            while True:
+                if _exceeds(self._disk_bytes, self.max_disk_bytes, _LOW_WATERMARK):
+                    victim = disk_queue.pop()
+                    if victim is None:
+                        break
+                    function_hash, input_output = victim
+                    if not (policy is None):
+                        # let the policy know of the eviction
+                        policy.select_victim([input_output])
+                    self.cache.remove_item(function_hash, input_output)
+                elif _exceeds(
+                    self._memory_bytes, self.max_memory_bytes, _LOW_WATERMARK
+                ):
+                    victim = memory_queue.pop()
+                    if victim is None:
+                        break
+                    function_hash, input_output = victim
+                    if self._is_saved(input_output):
+                        # read again from file when needed
+                        self._count_bytes(function_hash, input_output, -1, disk=False)
+                        unread = _unread(input_output)
+                        self.cache.replace_item(function_hash, input_output, unread)
+                        disk_queue.replace(function_hash, input_output, unread)
+                    else:
+                        self.cache.remove_item(function_hash, input_output)
+                else:
+                    break
+                self._count("evictions", function_hash)
+
+    def _stale_grace(self) -> float:
+
+        if self.stale_while_revalidate is None:
+            return 0.0
+        return self.stale_while_revalidate.total_seconds()
+
+    def _start_revalidating(self, lookup: CacheLookup) -> bool:
+        """
+        Mark the stale invocation found by `lookup` as being computed
+        again.
+
+        Returns:
+            Whether it was not being computed again already.
+        """
+
+        entry_id = lookup.entry["id"]
+        with self._revalidate_lock:
+            if entry_id in self._revalidating:
+                return False
+            self._revalidating.add(entry_id)
+            return True
+
+    def _revalidate(
+        self,
+        wrapped: WrappedFunction,
+        lookup: CacheLookup,
+        args,
+        kwargs,
+        ttl: dt.timedelta | None = None,
+    ):
+        """
+        Compute the stale invocation found by `lookup` again in the
+        background worker, unless already being computed.
+        """
+
+        if not self._start_revalidating(lookup):
+            return
+        with self._revalidate_lock:
+            if self._revalidate_executor is None:
+                self._revalidate_executor = ThreadPoolExecutor(
+                    max_workers=1,
+                    thread_name_prefix=f"{self.name_as_snake}_revalidate",
+                )
+        self._revalidate_executor.submit(
+            self._refresh, wrapped, lookup, args, kwargs, ttl
+        )
+
+    def _refresh(
+        self,
+        wrapped: WrappedFunction,
+        lookup: CacheLookup,
+        args,
+        kwargs,
+        ttl: dt.timedelta | None = None,
+    ):
+
+        entry_id = lookup.entry["id"]
+        try:
+            start = time.perf_counter()
+            output = wrapped.func(*args, **kwargs)
+            self._store_refreshed(
+                wrapped, lookup, output, time.perf_counter() - start, ttl
+            )
+            self.perform_auto_save()
+        except Exception:
+            logger.exception(f"Revalidating {wrapped.name} failed")
+        finally:
+            with self._revalidate_lock:
+                self._revalidating.discard(entry_id)
+
+    def _revalidate_async(
+        self,
+        wrapped: WrappedFunction,
+        lookup: CacheLookup,
+        args,
+        kwargs,
+        ttl: dt.timedelta | None = None,
+    ):
+        """
+        Compute the stale invocation found by `lookup` again in
+        a background task, unless already being computed.
+        """
+
+        if not self._start_revalidating(lookup):
+            return
+        task = asyncio.get_running_loop().create_task(
+            self._refresh_async(wrapped, lookup, args, kwargs, ttl)
+        )
+        # keep a reference until done
+        self._revalidate_tasks.add(task)
+        task.add_done_callback(self._revalidate_tasks.discard)
+
+    async def _refresh_async(
+        self,
+        wrapped: WrappedFunction,
+        lookup: CacheLookup,
+        args,
+        kwargs,
+        ttl: dt.timedelta | None = None,
+    ):
+
+        entry_id = lookup.entry["id"]
+        try:
+            start = time.perf_counter()
+            output = await wrapped.func(*args, **kwargs)
+            self._store_refreshed(
+                wrapped, lookup, output, time.perf_counter() - start, ttl
+            )
+            await self.perform_auto_save_async()
+        except Exception:
+            logger.exception(f"Revalidating {wrapped.name} failed")
+        finally:
+            with self._revalidate_lock:
+                self._revalidating.discard(entry_id)
+
+    def _store_refreshed(
+        self,
+        wrapped: WrappedFunction,
+        lookup: CacheLookup,
+        output,
+        cost: float,
+        ttl: dt.timedelta | None = None,
+    ):
+        """
+        Replace the output of the stale invocation found by `lookup`.
+        """
+
+        output = self._copy_in(wrapped, output)
+        size = self.size_estimator(output)
+        expires = self._expiry(wrapped, ttl)
+        with self._lock(wrapped):
+            # changed, so saved again as a new record
+            self._record_change(lookup.function_hash, lookup.entry["id"], None)
+            lookup.entry["id"] = uuid.uuid4().hex
+            self._store_output(lookup, output, cost, expires, size)
+        self._record_call(lookup)
+        if self._budget_check_due:
+            self.enforce_byte_budgets()
+
+    def _expiry(
+        self, wrapped: WrappedFunction, ttl: dt.timedelta | None = None
+    ) -> float | None:
+        """
+        Expiry time of an invocation of `wrapped` computed now, with
+        `ttl` given for the call.
+        """
+
+        if ttl is None:
+            ttl = self.valid_for if wrapped.ttl is None else wrapped.ttl
+        if ttl == dt.timedelta.max:
+            return None
+        return time.time() + ttl.total_seconds()
+
+    def _store_output(
+        self,
+        lookup: CacheLookup,
+        output,
+        cost: float,
+        expires: float | None = None,
+        size: int | None = None,
+    ):
+        """
+        Set the output of the invocation initialised by `lookup`, which
+        took `cost` seconds to compute and is valid until `expires`, adding
+        the invocation to the cache if not found by `lookup`. If `size`
+        is None, the size of `output` is estimated here.
+        """
+
+        if not (self.metrics is None):
+            self.metrics.observe(
+                "compute", cost, self._function_name(lookup.function_hash)
+            )
+        entry = lookup.entry
+        cached = not (lookup.output is NOT_COMPUTED) and (
+            entry in self.cache[lookup.function_hash]
+        )
+        if cached:
+            # counted again with the new output
+            self._count_bytes(lookup.function_hash, entry, -1)
+        entry["output"] = output
+        entry["cost"] = cost
+        entry["expires"] = expires
+        entry["size"] = self.size_estimator(output) if size is None else size
+        if lookup.output is NOT_COMPUTED:
+            self.cache.add_item(lookup.function_hash, entry)
+            self._count("inserts", lookup.function_hash)
+        else:
+            # the priority may depend on the cost and size
+            self.cache.touch_item(entry)
+            if cached:
+                self._count_bytes(lookup.function_hash, entry)
+                self._on_change(lookup.function_hash, entry)
+        self.cache.get_and_update(lookup.function_hash)
+
+    def _record_call(self, lookup: CacheLookup):
+        """
+        Record the invocation computed after `lookup` to `.call_log`,
+        outside the lock of the function as it writes to file.
+        """
+
+        if not (self.call_log is None):
+            self.call_log.record(
+                self._function_name(lookup.function_hash),
+                lookup.input,
+                lookup.entry.get("key"),
+            )
+
+    def _store_exception(
+        self, lookup: CacheLookup, exception: BaseException, cost: float
+    ) -> bool:
+        """
+        Cache `exception` raised by the invocation initialised by `lookup`
+        after `cost` seconds, if it is of one of `.cache_exceptions`.
+
+        Returns:
+            Whether the exception was cached.
+        """
+
+        if not isinstance(exception, self.cache_exceptions) or not isinstance(
+            exception, Exception
+        ):
+            return False
+        try:
+            # without the traceback, which refers to the frames of the call
+            cached = CachedException(copy_from_cache(exception, "pickle"))
+        except Exception:
+            logger.debug("Exception cannot be cached", exc_info=True)
+            return False
+        expires = time.time() + self.exception_ttl.total_seconds()
+        self._store_output(lookup, cached, cost, expires)
+        return True
+
+    def _lookup_in_flight(
+        self,
+        wrapped: WrappedFunction,
+        args,
+        kwargs,
+        compare_funcs: CompareFuncs,
+        timer: PhaseTimer | None = None,
+    ) -> tuple[CacheLookup, Future | None, bool]:
+        """
+        Look up an invocation of `wrapped`. If not found, either join
+        the computation of the invocation already in progress or start
+        a new one.
+
+        Returns:
+            The lookup, the future the output is set to (None if
+            found) and whether the caller should compute the output.
+        """
+
+        with self._lock(wrapped):
+            lookup = self._lookup_function(
+                wrapped.func, wrapped, args, kwargs, compare_funcs, timer
+            )
+            if not (lookup.output is NOT_COMPUTED):
+                return lookup, None, False
+
+            in_flight_entries = self._in_flight.setdefault(lookup.function_hash, [])
+            compare_funcs = compare_funcs or self.compare_funcs
+            index_key = lookup.entry["key"]
+            for entry, in_flight in in_flight_entries:
+                if self._matches(entry, lookup.input, index_key, compare_funcs):
+                    return lookup._replace(entry=entry), in_flight, False
+
+            in_flight = Future()
+            in_flight_entries.append((lookup.entry, in_flight))
+            return lookup, in_flight, True
+
+    def _finish_in_flight(
+        self,
+        wrapped: WrappedFunction,
+        lookup: CacheLookup,
+        in_flight: Future,
+        output: Any = None,
+        exception: BaseException | None = None,
+        cost: float = 0.0,
+        ttl: dt.timedelta | None = None,
+    ):
+        """
+        Store the output of an invocation started with `._lookup_in_flight`
+        and pass it (or the exception raised) to invocations waiting for it.
+        """
+
+        # estimated outside the lock, can take a while for large outputs
+        size = self.size_estimator(output) if exception is None else None
+        expires = self._expiry(wrapped, ttl)
+        with self._lock(wrapped):
+            in_flight_entries = [
+                (entry, future)
+                for entry, future in self._in_flight[lookup.function_hash]
+                if not entry is lookup.entry
+            ]
+            if len(in_flight_entries) > 0:
+                self._in_flight[lookup.function_hash] = in_flight_entries
+            else:
+                del self._in_flight[lookup.function_hash]
+            if exception is None:
+                self._store_output(lookup, output, cost, expires, size)
+            else:
+                self._store_exception(lookup, exception, cost)
+        if exception is None:
+            self._record_call(lookup)
+        if self._budget_check_due:
+            self.enforce_byte_budgets()
+
+        if exception is None:
+            in_flight.set_result(output)
+        elif isinstance(exception, (asyncio.CancelledError, KeyboardInterrupt)):
+            in_flight.cancel()
+        else:
+            in_flight.set_exception(exception)
+
+    def __call__(
+        self,
+        compare_funcs: CompareFuncs = None,
+        copy: CopyPolicy | None = None,
+        ttl: dt.timedelta | None = None,
+    ):
         """
         Arguments:
             compare_funcs:
@@ -151,54 +1592,774 @@ class FunctionCacher(ShelveCacher):
                 should take a matching pair of function arguments and
                 compare them, returning None if not comparable by the
                 function, or False or True if the compare equal.
+            copy:
+                Copy policy for the outputs of this function. If None,
+                defaults to the policy of the cacher (see `__init__`).
+            ttl:
+                How long outputs of this function stay valid. If None,
+                defaults to `valid_for` of the cacher. Can also be
+                given per call with `wrapper_func.with_ttl(ttl)(*args)`.
         """
 
         def inner_wrapper(func):
 
-            # initialise the cache
-            function_hash = self.hash_function(func)
-            self.cache[function_hash]
-            self._function_name_to_hash[unique_name(func)] = function_hash
+            # hash once here and initialise the cache
+            wrapped = WrappedFunction(func, self.hasher, copy, ttl, compare_funcs)
+            self._wrapped_functions[func] = wrapped
+            self.hash_function(func)
 
-            @wraps(func)
-            def wrapper_func(*args, **kwargs):
+            if inspect.iscoroutinefunction(func):
+                wrapped.wrapper = self._async_wrapper(func, wrapped, compare_funcs)
+                return wrapped.wrapper
 
-                function_hash, _, output = self.lookup_function(
-                    func, args, kwargs, compare_funcs
+            def invoke(args, kwargs, ttl: dt.timedelta | None = None):
+
+                timer = (
+                    None if self.profiler is None else self.profiler.timer(wrapped.name)
                 )
-                if not (output is None):
-                    return copy.deepcopy(output)
-
-                output = func(*args, **kwargs)
-                # the new invocation should be the first item
-                # (most recently used)
-                self.cache.get_and_update(function_hash)[0] |= {
-                    "output": copy.deepcopy(output)
-                }
+                if self._guarded:
+                    return self._call_thread_safe(
+                        wrapped, args, kwargs, compare_funcs, ttl, timer
+                    )
+
+                lookup = self._lookup_function(
+                    func, wrapped, args, kwargs, compare_funcs, timer
+                )
+                if not (lookup.output is NOT_COMPUTED):
+                    if lookup.stale:
+                        self._revalidate(wrapped, lookup, args, kwargs, ttl)
+                    if self._budget_check_due:
+                        self.enforce_byte_budgets()
+                    if timer is None:
+                        return self._copy_out(wrapped, lookup.output)
+                    timer.lap("budget")
+                    output = self._copy_out(wrapped, lookup.output)
+                    timer.lap("copy")
+                    timer.finish(hit=True)
+                    return output
+
+                start = time.perf_counter()
+                try:
+                    output = func(*args, **kwargs)
+                except Exception as exc:
+                    self._store_exception(lookup, exc, time.perf_counter() - start)
+                    raise
+                cost = time.perf_counter() - start
+                if not (timer is None):
+                    timer.lap("compute")
+                copied = self._copy_in(wrapped, output)
+                if not (timer is None):
+                    timer.lap("copy")
+                self._store_output(lookup, copied, cost, self._expiry(wrapped, ttl))
+                self._record_call(lookup)
+                if not (timer is None):
+                    timer.lap("store")
+                if self._budget_check_due:
+                    self.enforce_byte_budgets()
+                if not (timer is None):
+                    timer.lap("budget")
                 self.perform_auto_save()
-                return output
+                if not (timer is None):
+                    timer.lap("save")
+                    timer.finish(hit=False)
+                return self._computed_output(wrapped, output, copied)
+
+            @wraps(func)
+            def wrapper_func(*args, **kwargs):
+                return invoke(args, kwargs)
 
+            wrapper_func.with_ttl = _with_ttl(invoke)
+            wrapped.wrapper = wrapper_func
             return wrapper_func
 
         return inner_wrapper
 
+    def _call_thread_safe(
+        self,
+        wrapped: WrappedFunction,
+        args,
+        kwargs,
+        compare_funcs: CompareFuncs,
+        ttl: dt.timedelta | None = None,
+        timer: PhaseTimer | None = None,
+    ):
+        """
+        Invoke `wrapped` such that the cache may be accessed from
+        multiple threads.
+        """
+
+        lookup, in_flight, compute = self._lookup_in_flight(
+            wrapped, args, kwargs, compare_funcs, timer
+        )
+        if in_flight is None:
+            if lookup.stale:
+                self._revalidate(wrapped, lookup, args, kwargs, ttl)
+            if self._budget_check_due:
+                self.enforce_byte_budgets()
+            if not (timer is None):
+                timer.lap("budget")
+            output = self._copy_out(wrapped, lookup.output)
+            if not (timer is None):
+                timer.lap("copy")
+                timer.finish(hit=True)
+            return output
+        if not compute:
+            output = in_flight.result()
+            if not (timer is None):
+                timer.lap("compute")
+            output = self._copy_out(wrapped, output)
+            if not (timer is None):
+                timer.lap("copy")
+                timer.finish(hit=False)
+            return output
+
+        start = time.perf_counter()
+        try:
+            output = wrapped.func(*args, **kwargs)
+        except BaseException as exc:
+            cost = time.perf_counter() - start
+            self._finish_in_flight(wrapped, lookup, in_flight, exception=exc, cost=cost)
+            raise
+
+        cost = time.perf_counter() - start
+        if not (timer is None):
+            timer.lap("compute")
+        copied = self._copy_in(wrapped, output)
+        if not (timer is None):
+            timer.lap("copy")
+        self._finish_in_flight(wrapped, lookup, in_flight, copied, cost=cost, ttl=ttl)
+        if not (timer is None):
+            timer.lap("store")
+        self.perform_auto_save()
+        if not (timer is None):
+            timer.lap("save")
+            timer.finish(hit=False)
+        return self._computed_output(wrapped, output, copied)
+
+    def _async_wrapper(
+        self, func: Callable, wrapped: WrappedFunction, compare_funcs: CompareFuncs
+    ):
+        """
+        Wrap the coroutine function `func`, caching the awaited results.
+        Concurrent invocations with the same input share a single
+        computation.
+        """
+
+        async def invoke(args, kwargs, ttl: dt.timedelta | None = None):
+
+            timer = None if self.profiler is None else self.profiler.timer(wrapped.name)
+            lookup, in_flight, compute = self._lookup_in_flight(
+                wrapped, args, kwargs, compare_funcs, timer
+            )
+            if in_flight is None:
+                if lookup.stale:
+                    self._revalidate_async(wrapped, lookup, args, kwargs, ttl)
+                if self._budget_check_due:
+                    self.enforce_byte_budgets()
+                if not (timer is None):
+                    timer.lap("budget")
+                output = self._copy_out(wrapped, lookup.output)
+                if not (timer is None):
+                    timer.lap("copy")
+                    timer.finish(hit=True)
+                return output
+            if not compute:
+                output = await asyncio.shield(asyncio.wrap_future(in_flight))
+                if not (timer is None):
+                    timer.lap("compute")
+                output = self._copy_out(wrapped, output)
+                if not (timer is None):
+                    timer.lap("copy")
+                    timer.finish(hit=False)
+                return output
+
+            # in a task of its own, such that cancelling the caller does
+            # not cancel the invocations waiting for the output
+            task = asyncio.ensure_future(
+                self._compute_async(
+                    wrapped, lookup, in_flight, args, kwargs, ttl, timer
+                )
+            )
+            self._compute_tasks.add(task)
+            task.add_done_callback(self._compute_tasks.discard)
+            return await asyncio.shield(task)
+
+        @wraps(func)
+        async def wrapper_func(*args, **kwargs):
+            return await invoke(args, kwargs)
+
+        wrapper_func.with_ttl = _with_ttl(invoke)
+        return wrapper_func
+
+    async def _compute_async(
+        self,
+        wrapped: WrappedFunction,
+        lookup: CacheLookup,
+        in_flight: Future,
+        args,
+        kwargs,
+        ttl: dt.timedelta | None = None,
+        timer: PhaseTimer | None = None,
+    ):
+        """
+        Compute the invocation of the coroutine function of `wrapped`
+        started with `._lookup_in_flight`, storing the output.
+        """
+
+        start = time.perf_counter()
+        try:
+            output = await wrapped.func(*args, **kwargs)
+        except BaseException as exc:
+            cost = time.perf_counter() - start
+            self._finish_in_flight(wrapped, lookup, in_flight, exception=exc, cost=cost)
+            raise
+
+        cost = time.perf_counter() - start
+        if not (timer is None):
+            timer.lap("compute")
+        copied = self._copy_in(wrapped, output)
+        if not (timer is None):
+            timer.lap("copy")
+        self._finish_in_flight(wrapped, lookup, in_flight, copied, cost=cost, ttl=ttl)
+        if not (timer is None):
+            timer.lap("store")
+        await self.perform_auto_save_async()
+        if not (timer is None):
+            timer.lap("save")
+            timer.finish(hit=False)
+        return self._computed_output(wrapped, output, copied)
+
+    def map(
+        self,
+        func: Callable,
+        iterable_of_args: Iterable[tuple],
+        executor: Executor | None = None,
+    ) -> list:
+        """
+        Invoke `func`, a function wrapped by this cacher, with each tuple
+        of positional arguments in `iterable_of_args`. Cached invocations
+        are looked up first, and only the invocations that are not cached
+        are computed, each once, in `executor` if given. The outputs are
+        then added to the cache, which is auto-saved once at the end.
+
+        With a `concurrent.futures.ProcessPoolExecutor`, `func` should be
+        the wrapper function, which is pickled by reference and called
+        unwrapped in the worker processes.
+
+        Returns:
+            The outputs in the order of `iterable_of_args`.
+
+        Raises:
+            LookupError:
+                `func` is not wrapped by this cacher.
+            TypeError:
+                `func` is a coroutine function.
+            Exception:
+                The first exception raised by an invocation (in the order
+                of `iterable_of_args`), after the other outputs have been
+                cached.
+        """
+
+        wrapped = self._get_wrapped(func)
+        if wrapped is None:
+            raise LookupError("Function is not wrapped by this cacher")
+        if inspect.iscoroutinefunction(wrapped.func):
+            raise TypeError("Cannot map coroutine functions")
+
+        calls = [(wrapped, func, tuple(args), {}) for args in iterable_of_args]
+        outputs, exceptions, computed = self._invoke_all(calls, executor)
+        if computed > 0:
+            self.perform_auto_save()
+        if len(exceptions) > 0:
+            raise exceptions[min(exceptions)]
+        return outputs
+
+    def _invoke_all(
+        self,
+        calls: list[tuple[WrappedFunction, Callable, tuple, dict[str, Any]]],
+        executor: Executor | None = None,
+    ) -> tuple[list, dict[int, BaseException], int]:
+        """
+        Invoke each `(wrapped, func, args, kwargs)` in `calls`, looking
+        up all of them first and computing the invocations not cached
+        with `func`, in `executor` if given (see `.map`).
+
+        Returns:
+            The outputs in the order of `calls` (None for those that
+            raised), the exceptions raised by index in `calls`, and the
+            number of invocations computed.
+        """
+
+        outputs: list = [None] * len(calls)
+        exceptions: dict[int, BaseException] = {}
+        # invocations to compute by entry id, with the indices of their outputs
+        computing: dict[int, tuple[CacheLookup, Future, list[int]]] = {}
+        # invocations computed elsewhere, by index of their output
+        waiting: dict[int, Future] = {}
+        for index, (wrapped, _, args, kwargs) in enumerate(calls):
+            lookup, in_flight, compute = self._lookup_in_flight(
+                wrapped, args, kwargs, wrapped.compare_funcs
+            )
+            if in_flight is None:
+                if lookup.stale:
+                    self._revalidate(wrapped, lookup, args, kwargs)
+                try:
+                    outputs[index] = self._copy_out(wrapped, lookup.output)
+                except Exception as exc:
+                    exceptions[index] = exc
+            elif compute:
+                computing[id(lookup.entry)] = (lookup, in_flight, [index])
+            elif id(lookup.entry) in computing:
+                computing[id(lookup.entry)][2].append(index)
+            else:
+                waiting[index] = in_flight
+        if self._budget_check_due:
+            self.enforce_byte_budgets()
+
+        results: dict[int, Future] = {}
+        for entry_id, (_, _, indices) in computing.items():
+            _, func, args, kwargs = calls[indices[0]]
+            if executor is None:
+                results[entry_id] = result = Future()
+                try:
+                    result.set_result(_timed_call(func, args, kwargs))
+                except Exception as exc:
+                    result.set_exception(exc)
+            else:
+                results[entry_id] = executor.submit(_timed_call, func, args, kwargs)
+
+        computed = 0
+        for entry_id, (lookup, in_flight, indices) in computing.items():
+            wrapped = calls[indices[0]][0]
+            try:
+                output, cost = results[entry_id].result()
+            except BaseException as exc:
+                self._finish_in_flight(wrapped, lookup, in_flight, exception=exc)
+                exceptions[indices[0]] = exc
+                continue
+            copied = self._copy_in(wrapped, output)
+            self._finish_in_flight(wrapped, lookup, in_flight, copied, cost=cost)
+            computed += 1
+            outputs[indices[0]] = self._computed_output(wrapped, output, copied)
+            for index in indices[1:]:
+                outputs[index] = self._copy_out(wrapped, copied)
+
+        for index, in_flight in waiting.items():
+            try:
+                outputs[index] = self._copy_out(calls[index][0], in_flight.result())
+            except BaseException as exc:
+                exceptions[index] = exc
+
+        return outputs, exceptions, computed
+
+    def warm(
+        self,
+        log_path: Path,
+        workers: int | None = None,
+        executor: Executor | None = None,
+    ) -> int:
+        """
+        Compute the invocations recorded at `log_path` (see `call_log`)
+        that are not cached, in a pool of `workers` processes (by default,
+        as many as there are CPUs) or in `executor` if given, then
+        auto-save the cache once.
+
+        Only invocations of functions wrapped by this cacher are computed,
+        so the modules defining the functions should be imported first.
+        As with `.map`, the functions should be importable from their
+        modules in the worker processes. Invocations that raise are
+        logged and left out.
+
+        Returns:
+            The number of invocations computed.
+        """
+
+        wrapped_by_name = {
+            wrapped.name: wrapped
+            for wrapped in list(self._wrapped_functions.values())
+            if not inspect.iscoroutinefunction(wrapped.func)
+        }
+        calls: list[tuple[WrappedFunction, Callable, tuple, dict[str, Any]]] = []
+        for name, bound_args in CallLog.read(log_path):
+            wrapped = wrapped_by_name.get(name)
+            if wrapped is None:
+                logger.debug("Skipping invocation of %s, not wrapped", name)
+                continue
+            signature = wrapped.binder.signature
+            if bound_args.keys() != signature.parameters.keys():
+                logger.debug("Skipping invocation of %s, signature changed", name)
+                continue
+            bound = inspect.BoundArguments(signature, bound_args)
+            calls.append((wrapped, wrapped.wrapper, bound.args, bound.kwargs))
+
+        if executor is None:
+            with ProcessPoolExecutor(workers) as executor:
+                _, exceptions, computed = self._invoke_all(calls, executor)
+        else:
+            _, exceptions, computed = self._invoke_all(calls, executor)
+        for index, exception in exceptions.items():
+            logger.warning(
+                "Computing an invocation of %s failed",
+                calls[index][0].name,
+                exc_info=exception,
+            )
+        if computed > 0:
+            self.perform_auto_save()
+        return computed
+
     def get_cached_data(self, func: Callable) -> deque[InputOutputDict]:
         """
-        Get the cached data of `func`.
+        Get the cached data of `func`, as a copy of its deque of cached
+        invocations, most recently used first.
         """
 
-        function_hash = self._function_name_to_hash[unique_name(func)]
-        return self.cache[function_hash]
+        function_hash = self.hash_function(func)
+        wrapped = self._get_wrapped(func)
+        with nullcontext() if wrapped is None else self._lock(wrapped):
+            self._read_invocations(function_hash, list(self.cache[function_hash]))
+            self._read_blobs(function_hash, list(self.cache[function_hash]))
+            deq = self.cache[function_hash]
+            return deque(deq, maxlen=deq.maxlen)
 
     def cache_to_state_cache(self) -> Cache:
         return self.cache
 
     def state_cache_to_cache(self, state_cache: Cache, *args, **kwargs) -> Cache:
-        return super().state_cache_to_cache(state_cache, *args, **kwargs)
+
+        cache: Cache = super().state_cache_to_cache(state_cache, *args, **kwargs)
+        for deq in cache.values():
+            if any(_is_placeholder(input_output) for input_output in deq):
+                computed = [
+                    input_output
+                    for input_output in deq
+                    if not _is_placeholder(input_output)
+                ]
+                deq.clear()
+                deq.extend(computed)
+            # index invocations cached before indexing was added
+            for input_output in deq:
+                if not "key" in input_output:
+                    input_output["key"] = self._fingerprint_input(input_output["input"])
+                if not "id" in input_output:
+                    input_output["id"] = uuid.uuid4().hex
+                # relative to the aging of the cacher that saved it
+                input_output.pop("priority", None)
+        cache.index_key = _invocation_index_key
+        cache.eviction_policy = self._new_eviction_policy()
+        cache.on_evict = self._on_evict
+        cache.rebuild_index()
+        return cache
 
     def get_state(self) -> CacherState[Cache]:
         return super().get_state()
 
+    def _all_locks(self) -> ExitStack:
+        """
+        Context manager holding the locks of all wrapped functions
+        if the cache is accessed from multiple threads.
+        """
+
+        stack = ExitStack()
+        if self._guarded:
+            for wrapped in list(self._wrapped_functions.values()):
+                stack.enter_context(wrapped.lock)
+        return stack
+
+    def get_state_snapshot(self) -> CacherState[Cache]:
+
+        with self._all_locks():
+            return {"metadata": self.metadata(), "cache": self.cache.snapshot()}
+
+    def save(self, path=None, state=None) -> Self:
+        """
+        Save the state. Each invocation is saved as a record of its own
+        in an append-only log (see `InvocationStore`). Saving to
+        `.save_path` appends only the changes made since the cache was
+        last loaded from or saved to it, whereas saving elsewhere, or
+        saving a given `state`, writes the whole cache.
+
+        If the cacher is thread-safe or saves in the background, the
+        changes are collected, or a snapshot of the state taken, while
+        holding the locks of the wrapped functions. If the cache is
+        shared, the changes are appended after the ones saved by other
+        processes, and the state is merged with the one on file.
+        """
+
+        path = self.save_path if path is None else path
+        start = time.perf_counter()
+        with self._save_lock:
+            own = path == self.save_path and state is None
+            with self._all_locks():
+                if own and self._synced and self._store.path == path:
+                    changes, self._changes = self._changes, {}
+                    collected = self._collect_changes(changes)
+                else:
+                    changes = None
+                    if state is None:
+                        state = {"metadata": self.metadata(), "cache": self.cache}
+                        if self._guarded:
+                            state["cache"] = self.cache.snapshot()
+                    if own:
+                        self._changes = {}
+            try:
+                with self._file_lock(path):
+                    if changes is None:
+                        self._save_state(path, state)
+                    else:
+                        self._save_changes(*collected)
+            except BaseException:
+                if not (changes is None):
+                    self._restore_changes(changes)
+                raise
+            if changes is None and path == self.save_path:
+                self._synced = own
+        if not (self.metrics is None):
+            self.metrics.observe("save", time.perf_counter() - start)
+        return self
+
+    def _snapshot_saver(self):
+        # the changes are collected when saving
+        return self.save
+
+    def _own_store(self) -> InvocationStore:
+        """
+        Store at `.save_path`, kept between saves so that only the
+        changes need to be appended.
+        """
+
+        if self._store is None or self._store.path != self.save_path:
+            self._store = InvocationStore(self.save_path)
+            self._synced = False
+        self._store.compression = self.compression
+        self._store.compression_threshold = self.compression_threshold
+        return self._store
+
+    def _is_saved(self, input_output: InputOutputDict) -> bool:
+        """
+        Whether the invocation is saved to `.save_path` as it is.
+        """
+
+        return not (self._store is None) and self._store.has(input_output["id"])
+
+    def _file_lock(self, path: Path, shared=False):
+        """
+        Context manager holding the lock of the file at `path` if the
+        cache is shared between processes.
+        """
+
+        if not self.shared:
+            return nullcontext()
+        return file_lock(self._shared_lock_path(path), shared=shared)
+
+    def _collect_changes(self, changes: dict[str, tuple[str, InputOutputDict | None]]):
+        """
+        Copy `changes` (see `._changes`), along with the rest of the state
+        that is saved, such that they can be saved while the cache is
+        being modified.
+        """
+
+        return (
+            [
+                (
+                    entry_id,
+                    function_hash,
+                    None if input_output is None else input_output.copy(),
+                )
+                for entry_id, (function_hash, input_output) in changes.items()
+            ],
+            self.cache.max_size,
+            self.cache.valid_for,
+            self.cache._last_accessed.copy(),
+        )
+
+    def _restore_changes(self, changes: dict[str, tuple[str, InputOutputDict | None]]):
+        """
+        Put back `changes` that failed to be saved, before the changes
+        made since.
+        """
+
+        with self._all_locks():
+            for entry_id, change in self._changes.items():
+                changes.pop(entry_id, None)
+                changes[entry_id] = change
+            self._changes = changes
+
+    def _save_changes(
+        self,
+        changes: list[tuple[str, str, InputOutputDict | None]],
+        max_size: int | None,
+        valid_for: dt.timedelta,
+        last_accessed: dict[str, dt.datetime],
+    ):
+        """
+        Append `changes` (id, function hash and invocation or None if
+        removed) to the log at `.save_path`.
+        """
+
+        store = self._own_store()
+        store.refresh()
+        store_changes: list[StoreChange] = []
+        for entry_id, function_hash, input_output in changes:
+            if input_output is None:
+                if store.has(entry_id):
+                    store_changes.append(StoreChange("delete", function_hash, entry_id))
+            elif store.has(entry_id):
+                store_changes.append(StoreChange("touch", function_hash, entry_id))
+            elif not _is_unread(input_output):
+                # otherwise deleted by other processes
+                [input_output] = self._save_blobs(self.save_path, [input_output])
+                store_changes.append(
+                    StoreChange("write", function_hash, entry_id, input_output)
+                )
+
+        totals, unreferenced = store.append(
+            self.metadata(), max_size, valid_for, last_accessed, store_changes
+        )
+        self._compression_totals += totals
+        self._blob_store().delete(map(BlobRef, unreferenced))
+
+    def _save_state(self, path: Path, state: CacherState[Cache]):
+        """
+        Write the whole cache in `state` to the log at `path`, or, if
+        the cache is shared, append the invocations not in the log.
+        """
+
+        cache = state["cache"]
+        # least recently used first
+        functions = {
+            function_hash: list(reversed(invocations))
+            for function_hash, invocations in cache.items()
+        }
+        unread = [
+            input_output["id"]
+            for invocations in functions.values()
+            for input_output in invocations
+            if _is_unread(input_output)
+        ]
+        if len(unread) > 0:
+            # saving elsewhere or in full, copy the invocations not read yet
+            records = self._own_store().read_entries(unread)
+            for function_hash, invocations in functions.items():
+                functions[function_hash] = [
+                    (
+                        records.get(input_output["id"])
+                        if _is_unread(input_output)
+                        else input_output
+                    )
+                    for input_output in invocations
+                    if not _is_unread(input_output) or input_output["id"] in records
+                ]
+
+        store = (
+            self._own_store()
+            if path == self.save_path
+            else InvocationStore(path, self.compression, self.compression_threshold)
+        )
+        if self.shared:
+            store.refresh()
+            changes = [
+                StoreChange("write", function_hash, input_output["id"], input_output)
+                for function_hash, invocations in functions.items()
+                for input_output in self._save_blobs(
+                    path,
+                    [
+                        input_output
+                        for input_output in invocations
+                        if not store.has(input_output["id"])
+                    ],
+                )
+            ]
+            totals, unreferenced = store.append(
+                self.metadata(),
+                cache.max_size,
+                cache.valid_for,
+                cache._last_accessed,
+                changes,
+            )
+        else:
+            totals, unreferenced = store.write(
+                self.metadata(),
+                cache.max_size,
+                cache.valid_for,
+                cache._last_accessed,
+                {
+                    function_hash: self._save_blobs(path, invocations)
+                    for function_hash, invocations in functions.items()
+                },
+            )
+        self._compression_totals += totals
+        self._blob_store(path).delete(map(BlobRef, unreferenced))
+        if not (dbm.whichdb(path) is None):
+            # saved before the log was introduced
+            clear_shelve(path)
+
+    def _save_blobs(
+        self, path: Path, invocations: list[InputOutputDict]
+    ) -> list[InputOutputDict]:
+        """
+        Save the outputs of `invocations` that exceed `.blob_threshold`
+        out of line next to `path`.
+
+        Returns:
+            `invocations`, with copies of those whose outputs were saved
+            out of line referring to them instead.
+        """
+
+        store = self._blob_store(path)
+        own_store = self._blob_store()
+        saved = []
+        for input_output in invocations:
+            output = input_output["output"]
+            if isinstance(output, BlobRef):
+                # saved before, and not read since
+                if store.directory != own_store.directory:
+                    store.copy_from(own_store, output)
+            elif not (self.blob_threshold is None) and (
+                (input_output.get("size") or self.size_estimator(output))
+                >= self.blob_threshold
+            ):
+                input_output = input_output | {"output": store.write(output)}
+            saved.append(input_output)
+        return saved
+
+    def _shared_lock_path(self, path: Path | None = None) -> Path:
+
+        path = self.save_path if path is None else path
+        return path.with_name(f"{path.name}.lock")
+
+    def _pull_shared(self, function_hash: str, index_key: Hashable | None) -> bool:
+        """
+        Add invocations of the function with hash `function_hash` whose
+        index key is `index_key` that have been saved by other processes
+        to the front of the cache.
+
+        Returns:
+            Whether any invocations were added.
+        """
+
+        store = self._own_store()
+        with self._file_lock(self.save_path, shared=True):
+            if not store.refresh():
+                return False
+            candidates = [
+                entry_id
+                for entry_id, entry in store.functions.get(function_hash, {}).items()
+                if entry.key == index_key
+            ]
+            if len(candidates) == 0:
+                return False
+            known = {
+                input_output.get("id") for input_output in self.cache[function_hash]
+            }
+            records = store.read_entries(
+                entry_id for entry_id in candidates if not entry_id in known
+            )
+
+        # least recently used first
+        for input_output in records.values():
+            self.cache.add_item(function_hash, input_output)
+        return len(records) > 0
+
     def load_cache(
         self,
         path=None,
@@ -207,15 +2368,87 @@ class FunctionCacher(ShelveCacher):
         overwrite_loaded_cache_attributes=False,
         **kwargs,
     ) -> Cache | Self:
-        return super().load_cache(
+
+        loaded = super().load_cache(
             path,
             *args,
             inplace=inplace,
             overwrite_loaded_cache_attributes=overwrite_loaded_cache_attributes,
             **kwargs,
         )
+        if inplace:
+            self._track_changes()
+            self._changes = {}
+            self._synced = (path is None or path == self.save_path) and self._loaded_log
+            if self._synced:
+                # left out as they did not fit
+                for function_hash, entry_id in self._unloaded:
+                    self._record_change(function_hash, entry_id, None)
+        return loaded
 
     def load(self, path=None) -> CacherState[Cache]:
+
+        path = self.save_path if path is None else path
+        start = time.perf_counter()
+        with self._file_lock(path, shared=True):
+            state = self._load_invocations(path)
+        if not (self.metrics is None):
+            self.metrics.observe("load", time.perf_counter() - start)
+        return state
+
+    def _load_invocations(self, path: Path) -> CacherState[Cache]:
+
+        store = self._own_store() if path == self.save_path else InvocationStore(path)
+        self._loaded_log = store.refresh()
+        self._unloaded = []
+        if not self._loaded_log:
+            return self._load_shelve(path)
+
+        # invocations not read are read from `.save_path` when needed
+        if self.lazy and path == self.save_path:
+            records = {
+                entry_id: {
+                    "key": entry.key,
+                    "id": entry_id,
+                    "cost": entry.cost,
+                    "size": entry.size,
+                }
+                for function_entries in store.functions.values()
+                for entry_id, entry in function_entries.items()
+            }
+        else:
+            records = store.read_entries(
+                entry_id
+                for function_entries in store.functions.values()
+                for entry_id in function_entries
+            )
+
+        cache = self.new_cache()
+        cache.max_size = store.max_size
+        cache.valid_for = store.valid_for
+        for function_hash, function_entries in store.functions.items():
+            cache[function_hash]
+            # most recently used first
+            for entry_id in reversed(function_entries):
+                if not (
+                    entry_id in records
+                    and cache.append_item(function_hash, records[entry_id])
+                ):
+                    self._unloaded.append((function_hash, entry_id))
+        cache._last_accessed.update(store.last_accessed)
+        return {"metadata": store.metadata, "cache": cache}
+
+    def _load_shelve(self, path: Path) -> CacherState[Cache]:
+        """
+        Load the state saved in the shelve at `path` before the log
+        was introduced (see `InvocationStore`).
+
+        Raises:
+            StateNotFoundError:
+        """
+
+        if dbm.whichdb(path) is None:
+            raise StateNotFoundError()
         return super().load(path)
 
     def overwrite_cache(self, loaded_cache: Cache, overwrite_loaded=False):
@@ -231,7 +2464,33 @@ class FunctionCacher(ShelveCacher):
 
         return loaded_cache
 
+    def close(self):
+        """
+        Wait for invocations being computed again in the background,
+        then save the changes pending a background save and stop the
+        background threads.
+        """
+
+        with self._revalidate_lock:
+            executor, self._revalidate_executor = self._revalidate_executor, None
+        if not (executor is None):
+            executor.shutdown()
+        super().close()
+
+    def clear_file_cache(self, path=None):
+        path = self.save_path if path is None else path
+        if path == self.save_path:
+            self._own_store().delete()
+            self._synced = False
+        else:
+            InvocationStore(path).delete()
+        self._blob_store(path).clear()
+        if not (dbm.whichdb(path) is None):
+            # saved before the log was introduced
+            super().clear_file_cache(path)
+        return self
+
     def clear_memory_cache(self):
         for key in self.cache:
-            self.cache[key].clear()
+            self.cache.invalidate(key)
         return self
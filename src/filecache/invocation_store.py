@@ -0,0 +1,618 @@
+"""
+InvocationStore: Stores invocations cached by a `FunctionCacher` in
+an append-only log, with each invocation as a record of its own. Saving
+the cache then only requires appending the changes made since the last
+save, and the log is compacted once most of it is no longer needed.
+"""
+
+from pathlib import Path
+from collections import Counter, OrderedDict
+from collections.abc import Hashable, Iterable
+from typing import Any, NamedTuple
+import datetime as dt
+import os
+import pickle
+import struct
+import uuid
+import zlib
+
+from .abstract_cacher import CacherMetadata
+from .blob_store import BlobRef
+from .utils.compression import Codec, compress, decompress, validate_codec
+
+_MAGIC = b"FCLOG001"
+# the magic bytes and the generation of the log, which changes each
+# time the log is rewritten
+_HEADER = struct.Struct(f"<{len(_MAGIC)}s16s")
+# the length of the header and the data of a record, and their checksums
+_FRAME = struct.Struct("<IIII")
+# the log is compacted once this many bytes at least are no longer needed
+_MIN_GARBAGE_BYTES = 1 << 16
+_EPOCH = dt.datetime.min.replace(tzinfo=dt.timezone.utc)
+
+
+class CompressionTotals(NamedTuple):
+    """
+    Number of invocations compressed, and their pickled size before
+    and after compression.
+    """
+
+    entries: int = 0
+    uncompressed_bytes: int = 0
+    compressed_bytes: int = 0
+
+    def __add__(self, other: "CompressionTotals") -> "CompressionTotals":
+        return CompressionTotals(*(one + two for one, two in zip(self, other)))
+
+
+class LogEntry(NamedTuple):
+    """
+    Where an invocation is saved in the log, and the parts of it needed
+    without reading it (see `function_cacher.InputOutputDict`).
+    """
+
+    function_hash: str
+    key: Hashable | None
+    cost: float | None
+    size: int | None
+    # digest of the output if saved out of line (see `blob_store.BlobStore`)
+    blob: str | None
+    codec: Codec | None
+    offset: int
+    length: int
+    data_length: int
+    data_checksum: int
+
+
+class StoreChange(NamedTuple):
+    """
+    A change to append to the log:
+        "write":
+            Write `entry`, an invocation of the function with hash
+            `function_hash`, as the most recently used one.
+        "touch":
+            Move the invocation with id `entry_id` to the front.
+        "delete":
+            Delete the invocation with id `entry_id`.
+    """
+
+    kind: str
+    function_hash: str
+    entry_id: str
+    entry: dict[str, Any] | None = None
+
+
+class InvocationStore:
+    """
+    Layout of the log (at the path of the store with ".log" appended):
+        The magic bytes and the generation of the log, then records
+        of the changes made to the cache, each framed by the length
+        and checksum of its pickled header and its data.
+
+    Records (by the first item of their header):
+        "settings":
+            The metadata of the cacher, max size of the deques and
+            validity period of the cache.
+        "accessed":
+            Access times of the deques in the cache that changed.
+        "entry":
+            An invocation, pickled (and compressed if worthwhile)
+            into the data of the record, with its id, function hash,
+            index key, cost, size, blob digest and codec in the
+            header, such that the index can be read without reading
+            the invocations. Invocations without a size are given the
+            length of their pickle.
+        "touch":
+            Ids of invocations moved to the front, in order.
+        "delete":
+            Ids of invocations deleted.
+
+    The order of the invocations of each function follows the order
+    of their records. A record left incomplete (e.g. by a crash) ends
+    the log, and is overwritten by the next append. Once the records
+    no longer needed outweigh the rest, the log is rewritten with only
+    the records needed, under a new generation.
+
+    Caches saved before this layout was introduced are in a shelve
+    at the path of the store, either with each invocation as a record
+    of its own ("metadata", "index" and "entry:{id}"), or with the
+    whole cache under "cache".
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        compression: Codec | None = None,
+        compression_threshold: int = 1024,
+    ):
+        """
+
+        Arguments:
+            path:
+                Path of the store.
+            compression:
+                Codec invocations are compressed with when written,
+                or None to not compress them. Invocations are read
+                regardless of the codec they were written with.
+            compression_threshold:
+                Invocations whose pickled size is less than this many
+                bytes are not compressed.
+        """
+
+        self.path = path
+        self.log_path = path.with_name(f"{path.name}.log")
+        self.compression = None if compression is None else validate_codec(compression)
+        self.compression_threshold = compression_threshold
+        self._reset(None)
+
+    def _reset(self, generation: bytes | None):
+
+        self._generation = generation
+        # end of the last complete record read or written
+        self._end = _HEADER.size
+        self.metadata: CacherMetadata | None = None
+        self.max_size: int | None = None
+        self.valid_for: dt.timedelta | None = None
+        self.last_accessed: dict[str, dt.datetime] = {}
+        # invocations of each function, least recently used first
+        self.functions: dict[str, OrderedDict[str, LogEntry]] = {}
+        self._entries: dict[str, LogEntry] = {}
+        self._live_bytes = 0
+        self._blob_references: Counter[str] = Counter()
+
+    def exists(self) -> bool:
+        return self.log_path.exists()
+
+    def has(self, entry_id: str) -> bool:
+        """
+        Whether the invocation with id `entry_id` is in the log, as of
+        the last time it was read or written.
+        """
+        return entry_id in self._entries
+
+    def refresh(self) -> bool:
+        """
+        Read the records appended to the log since it was last read,
+        or the whole log if it has been rewritten since.
+
+        Returns:
+            Whether the log exists.
+        """
+
+        try:
+            f = open(self.log_path, "rb")
+        except FileNotFoundError:
+            self._reset(None)
+            return False
+
+        with f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size or header[: len(_MAGIC)] != _MAGIC:
+                # never completely written
+                self._reset(None)
+                return False
+            _, generation = _HEADER.unpack(header)
+            size = os.fstat(f.fileno()).st_size
+            if generation != self._generation or size < self._end:
+                self._reset(generation)
+            if size > self._end:
+                self._scan(f, size)
+        return True
+
+    def _scan(self, f, size: int):
+        """
+        Apply the complete records in `f` after `._end`.
+        """
+
+        offset = self._end
+        f.seek(offset)
+        while offset + _FRAME.size <= size:
+            header_length, data_length, header_checksum, data_checksum = _FRAME.unpack(
+                f.read(_FRAME.size)
+            )
+            length = _FRAME.size + header_length + data_length
+            if offset + length > size:
+                break
+            header = f.read(header_length)
+            if zlib.crc32(header) != header_checksum:
+                break
+            try:
+                record = pickle.loads(header)
+            except Exception:
+                break
+            f.seek(data_length, os.SEEK_CUR)
+            self._apply(record, offset, length, data_length, data_checksum)
+            offset += length
+        self._end = offset
+
+    def _apply(
+        self,
+        record: tuple,
+        offset: int,
+        length: int,
+        data_length: int,
+        data_checksum: int,
+    ) -> list[str]:
+        """
+        Apply `record` to the index.
+
+        Returns:
+            The digests of the blobs no longer referenced.
+        """
+
+        match record:
+            case ("settings", metadata, max_size, valid_for):
+                self.metadata = metadata
+                self.max_size = max_size
+                self.valid_for = valid_for
+            case ("accessed", last_accessed):
+                # the latest wins when shared between processes
+                for function_hash, accessed in last_accessed.items():
+                    if accessed >= self.last_accessed.get(function_hash, accessed):
+                        self.last_accessed[function_hash] = accessed
+            case ("entry", entry_id, function_hash, key, cost, size, blob, codec):
+                unreferenced = self._discard(entry_id)
+                entry = LogEntry(
+                    function_hash,
+                    key,
+                    cost,
+                    size,
+                    blob,
+                    codec,
+                    offset,
+                    length,
+                    data_length,
+                    data_checksum,
+                )
+                self.functions.setdefault(function_hash, OrderedDict())[
+                    entry_id
+                ] = entry
+                self._entries[entry_id] = entry
+                self._live_bytes += length
+                if not (blob is None):
+                    self._blob_references[blob] += 1
+                return unreferenced
+            case ("touch", function_hash, entry_ids):
+                function_entries = self.functions.get(function_hash, {})
+                for entry_id in entry_ids:
+                    if entry_id in function_entries:
+                        function_entries.move_to_end(entry_id)
+            case ("delete", entry_ids):
+                unreferenced = []
+                for entry_id in entry_ids:
+                    unreferenced.extend(self._discard(entry_id))
+                return unreferenced
+        return []
+
+    def _discard(self, entry_id: str) -> list[str]:
+
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return []
+        del self.functions[entry.function_hash][entry_id]
+        self._live_bytes -= entry.length
+        if entry.blob is None:
+            return []
+        self._blob_references[entry.blob] -= 1
+        if self._blob_references[entry.blob] > 0:
+            return []
+        del self._blob_references[entry.blob]
+        return [entry.blob]
+
+    def read_entries(self, entry_ids: Iterable[str]) -> dict[str, dict[str, Any]]:
+        """
+        Read the invocations with ids `entry_ids`. Invocations that are
+        not found are left out.
+        """
+
+        entry_ids = list(entry_ids)
+        if len(entry_ids) == 0 or not self.refresh():
+            return {}
+
+        records = {}
+        with open(self.log_path, "rb") as f:
+            for entry_id in entry_ids:
+                entry = self._entries.get(entry_id)
+                if entry is None:
+                    continue
+                f.seek(entry.offset + entry.length - entry.data_length)
+                data = f.read(entry.data_length)
+                if zlib.crc32(data) != entry.data_checksum:
+                    continue
+                if not (entry.codec is None):
+                    data = decompress(data, entry.codec)
+                record = pickle.loads(data)
+                if record.get("size") is None:
+                    record["size"] = entry.size
+                records[entry_id] = record
+        return records
+
+    @staticmethod
+    def _frame(header: tuple, data: bytes = b"") -> bytes:
+
+        header = pickle.dumps(header, protocol=pickle.HIGHEST_PROTOCOL)
+        return (
+            _FRAME.pack(len(header), len(data), zlib.crc32(header), zlib.crc32(data))
+            + header
+            + data
+        )
+
+    def _encode_entry(
+        self, function_hash: str, entry: dict[str, Any]
+    ) -> tuple[tuple, bytes, CompressionTotals]:
+        """
+        Pickle `entry`, compressing it if it is large enough and
+        compresses at all.
+
+        Returns:
+            The header and data of its record, and the compression
+            achieved.
+        """
+
+        data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        size = entry.get("size")
+        if size is None:
+            # not estimated when cached
+            size = len(data)
+        codec = None
+        totals = CompressionTotals()
+        if not (self.compression is None) and len(data) >= self.compression_threshold:
+            compressed = compress(data, self.compression)
+            if len(compressed) < len(data):
+                codec = self.compression
+                totals = CompressionTotals(1, len(data), len(compressed))
+                data = compressed
+
+        output = entry.get("output")
+        header = (
+            "entry",
+            entry["id"],
+            function_hash,
+            entry.get("key"),
+            entry.get("cost"),
+            size,
+            output.digest if isinstance(output, BlobRef) else None,
+            codec,
+        )
+        return header, data, totals
+
+    def _encode_changes(
+        self,
+        metadata: CacherMetadata,
+        max_size: int | None,
+        valid_for: dt.timedelta,
+        last_accessed: dict[str, dt.datetime],
+        changes: Iterable[StoreChange],
+    ) -> tuple[list[tuple[tuple, bytes]], CompressionTotals]:
+        """
+        Headers and data of the records to append for `changes`, with
+        consecutive touches and deletes batched into a record each.
+        """
+
+        records: list[tuple[tuple, bytes]] = []
+        if (metadata, max_size, valid_for) != (
+            self.metadata,
+            self.max_size,
+            self.valid_for,
+        ):
+            records.append((("settings", metadata, max_size, valid_for), b""))
+        accessed = {
+            function_hash: accessed
+            for function_hash, accessed in last_accessed.items()
+            if accessed > self.last_accessed.get(function_hash, _EPOCH)
+        }
+        if len(accessed) > 0:
+            records.append((("accessed", accessed), b""))
+
+        totals = CompressionTotals()
+        batch: tuple | None = None
+        for change in changes:
+            match change.kind:
+                case "write":
+                    header, data, entry_totals = self._encode_entry(
+                        change.function_hash, change.entry
+                    )
+                    records.append((header, data))
+                    totals += entry_totals
+                    batch = None
+                    continue
+                case "touch":
+                    kind = ("touch", change.function_hash)
+                case "delete":
+                    kind = ("delete",)
+                case _:
+                    raise ValueError(f"Unknown change {change.kind!r}")
+            if batch is None or batch[:-1] != kind:
+                batch = (*kind, [])
+                records.append((batch, b""))
+            batch[-1].append(change.entry_id)
+        return records, totals
+
+    def append(
+        self,
+        metadata: CacherMetadata,
+        max_size: int | None,
+        valid_for: dt.timedelta,
+        last_accessed: dict[str, dt.datetime],
+        changes: Iterable[StoreChange],
+    ) -> tuple[CompressionTotals, list[str]]:
+        """
+        Append `changes` to the log, along with the settings and access
+        times if changed, after reading the records appended by others.
+        Compacts the log if worthwhile.
+
+        Returns:
+            The compression achieved for the invocations written, and
+            the digests of the blobs no longer referenced.
+        """
+
+        self.refresh()
+        records, totals = self._encode_changes(
+            metadata, max_size, valid_for, last_accessed, changes
+        )
+        if len(records) == 0:
+            return totals, []
+
+        new_log = self._generation is None
+        if new_log:
+            self._reset(uuid.uuid4().bytes)
+        frames = [self._frame(header, data) for header, data in records]
+        with open(self.log_path, "wb" if new_log else "r+b") as f:
+            if new_log:
+                f.write(_HEADER.pack(_MAGIC, self._generation))
+            else:
+                f.seek(self._end)
+            f.write(b"".join(frames))
+            # drops a record left incomplete
+            f.truncate()
+
+        unreferenced = []
+        for (header, data), frame in zip(records, frames):
+            unreferenced.extend(
+                self._apply(header, self._end, len(frame), len(data), zlib.crc32(data))
+            )
+            self._end += len(frame)
+
+        garbage = self._end - _HEADER.size - self._live_bytes
+        if garbage > max(self._live_bytes, _MIN_GARBAGE_BYTES):
+            unreferenced.extend(self.compact())
+        return totals, unreferenced
+
+    def compact(self) -> list[str]:
+        """
+        Rewrite the log with only the records needed, keeping at most
+        the max size of the deques of the most recently used invocations
+        of each function (which may have been exceeded by other processes
+        sharing the log).
+
+        Returns:
+            The digests of the blobs no longer referenced.
+        """
+
+        self.refresh()
+        unreferenced = []
+        for function_entries in list(self.functions.values()):
+            if not (self.max_size is None):
+                for entry_id in list(function_entries)[: -self.max_size]:
+                    unreferenced.extend(self._discard(entry_id))
+
+        with open(self.log_path, "rb") as old:
+
+            def raw_records():
+                for function_entries in self.functions.values():
+                    for entry_id, entry in function_entries.items():
+                        old.seek(entry.offset)
+                        yield entry_id, entry, old.read(entry.length)
+
+            rewritten = self._write_log(raw_records())
+        self._replace_log(*rewritten)
+        return unreferenced
+
+    def write(
+        self,
+        metadata: CacherMetadata,
+        max_size: int | None,
+        valid_for: dt.timedelta,
+        last_accessed: dict[str, dt.datetime],
+        functions: dict[str, list[dict[str, Any]]],
+    ) -> tuple[CompressionTotals, list[str]]:
+        """
+        Replace the log with the invocations in `functions`, least
+        recently used first, by function hash.
+
+        Returns:
+            The compression achieved for the invocations written, and
+            the digests of the blobs no longer referenced.
+        """
+
+        self.refresh()
+        referenced = set(self._blob_references)
+        self._reset(self._generation)
+        self.metadata = metadata
+        self.max_size = max_size
+        self.valid_for = valid_for
+        self.last_accessed = last_accessed.copy()
+
+        totals = CompressionTotals()
+
+        def encoded_records():
+            nonlocal totals
+            for function_hash, entries in functions.items():
+                self.functions[function_hash] = OrderedDict()
+                for entry in entries:
+                    header, data, entry_totals = self._encode_entry(
+                        function_hash, entry
+                    )
+                    totals += entry_totals
+                    frame = self._frame(header, data)
+                    yield entry["id"], LogEntry(
+                        *header[2:],
+                        offset=0,
+                        length=len(frame),
+                        data_length=len(data),
+                        data_checksum=zlib.crc32(data),
+                    ), frame
+
+        self._replace_log(*self._write_log(encoded_records()))
+        return totals, list(referenced - set(self._blob_references))
+
+    def _write_log(
+        self, records: Iterable[tuple[str, LogEntry, bytes]]
+    ) -> tuple[bytes, int, dict[str, LogEntry]]:
+        """
+        Write a new log next to the log with the settings, the access
+        times and the invocation `records` (id, entry and framed record).
+
+        Returns:
+            The generation and end of the new log, and its entries.
+        """
+
+        generation = uuid.uuid4().bytes
+        entries: dict[str, LogEntry] = {}
+        try:
+            with open(self._tmp_path(), "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, generation))
+                f.write(
+                    self._frame(
+                        ("settings", self.metadata, self.max_size, self.valid_for)
+                    )
+                )
+                f.write(self._frame(("accessed", self.last_accessed)))
+                for entry_id, entry, frame in records:
+                    entries[entry_id] = entry._replace(offset=f.tell())
+                    f.write(frame)
+                end = f.tell()
+        except BaseException:
+            self._tmp_path().unlink(missing_ok=True)
+            raise
+        return generation, end, entries
+
+    def _replace_log(self, generation: bytes, end: int, entries: dict[str, LogEntry]):
+        """
+        Replace the log with the one written by `._write_log`.
+        """
+
+        os.replace(self._tmp_path(), self.log_path)
+        self._generation = generation
+        self._end = end
+        self._entries = entries
+        self._live_bytes = 0
+        self._blob_references = Counter()
+        functions = {function_hash: OrderedDict() for function_hash in self.functions}
+        for entry_id, entry in entries.items():
+            functions[entry.function_hash][entry_id] = entry
+            self._live_bytes += entry.length
+            if not (entry.blob is None):
+                self._blob_references[entry.blob] += 1
+        self.functions = functions
+
+    def _tmp_path(self) -> Path:
+        return self.log_path.with_name(f"{self.log_path.name}.tmp")
+
+    def delete(self):
+        """
+        Delete the log.
+        """
+
+        self.log_path.unlink(missing_ok=True)
+        self._reset(None)
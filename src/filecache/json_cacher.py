@@ -31,7 +31,7 @@ class JsonCacher(AbstractCacher):
     def get_state(self) -> CacherState[dict]:
         return super().get_state()
 
-    def save(self, path: Path = None, json_kwargs: dict = None):
+    def save(self, path: Path = None, json_kwargs: dict = None, state=None):
         """
         Save the state as a json file.
         """
@@ -39,10 +39,11 @@ class JsonCacher(AbstractCacher):
         json_kwargs = dict(indent=4) | ({} if json_kwargs is None else json_kwargs)
         path = self.save_path if path is None else path
         json_kwargs = {} if json_kwargs is None else json_kwargs
+        state = self.get_state() if state is None else state
 
         path.parents[0].mkdir(parents=True, exist_ok=True)
         with open(path, "w") as f:
-            json.dump(self.get_state(), f, **json_kwargs)
+            json.dump(state, f, **json_kwargs)
 
         return self
 
@@ -0,0 +1,247 @@
+"""
+Counters and latency histograms recorded by a cacher.
+"""
+
+from bisect import bisect_left
+from collections.abc import Callable
+from typing import TypedDict
+import threading
+
+COUNTERS = ("hits", "misses", "evictions", "expirations", "inserts")
+TIMINGS = ("lookup", "compute", "copy", "save", "load")
+
+# upper bounds of the histogram buckets in seconds, from 1 us to ~2 min
+BUCKET_BOUNDS: tuple[float, ...] = tuple(1e-6 * 2**i for i in range(28))
+
+# name of the metric, name of the function (None for the whole cacher)
+# and the value (count or seconds)
+type MetricsCallback = Callable[[str, str | None, float], object]
+
+
+class HistogramSummary(TypedDict):
+    """
+    Attributes:
+        count:
+            Number of observations.
+        total:
+            Sum of the observations.
+        max:
+            Largest observation.
+        p50, p90, p99:
+            Upper bounds of the buckets the percentiles fall in.
+        buckets:
+            Number of observations by the upper bound of their bucket,
+            leaving out empty buckets. Observations above the largest
+            bound are under `inf`.
+    """
+
+    count: int
+    total: float
+    max: float
+    p50: float
+    p90: float
+    p99: float
+    buckets: dict[float, int]
+
+
+class Histogram:
+    """
+    Histogram of latencies in exponentially growing buckets
+    (see `BUCKET_BOUNDS`).
+    """
+
+    def __init__(self):
+
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Upper bound of the bucket the `fraction` percentile falls in.
+        """
+
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def summary(self) -> HistogramSummary:
+
+        bounds = BUCKET_BOUNDS + (float("inf"),)
+        return {
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "buckets": {
+                bound: count for bound, count in zip(bounds, self.counts) if count > 0
+            },
+        }
+
+
+class ScopeStats(TypedDict):
+
+    counters: dict[str, int]
+    timings: dict[str, HistogramSummary]
+
+
+class CacheStats(ScopeStats):
+    """
+    Attributes:
+        entries:
+            Number of cached invocations.
+        memory_bytes:
+            Estimated size of the outputs held in memory.
+        disk_bytes:
+            Estimated size of all cached outputs, in memory or on file.
+    """
+
+    entries: int
+    memory_bytes: int
+    disk_bytes: int
+
+
+class CompressionStats(TypedDict):
+    """
+    Attributes:
+        entries:
+            Number of invocations saved compressed.
+        uncompressed_bytes:
+            Pickled size of those invocations.
+        compressed_bytes:
+            Size of those invocations once compressed.
+        ratio:
+            `uncompressed_bytes` divided by `compressed_bytes`,
+            or 1 if nothing was compressed.
+    """
+
+    entries: int
+    uncompressed_bytes: int
+    compressed_bytes: int
+    ratio: float
+
+
+class CacherStats(CacheStats):
+    """
+    Attributes:
+        functions:
+            Stats of each function by name. Invocations of functions
+            that are not wrapped (e.g. from before the source of
+            a function changed) are under the hash of the function.
+        compression:
+            Compression achieved for the invocations saved by the
+            cacher.
+    """
+
+    functions: dict[str, CacheStats]
+    compression: CompressionStats
+
+
+class Metrics:
+    """
+    Counters (see `COUNTERS`) and latency histograms (see `TIMINGS`)
+    recorded in total and per function. Safe to record from multiple
+    threads.
+    """
+
+    def __init__(self, callback: MetricsCallback | None = None):
+        """
+
+        Arguments:
+            callback:
+                Called with the name of the metric, the name of the
+                function (None if not specific to one) and the value
+                each time something is recorded, e.g. for exporting
+                the metrics elsewhere.
+        """
+
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._counters: dict[str | None, dict[str, int]] = {}
+        self._histograms: dict[str | None, dict[str, Histogram]] = {}
+
+    def _scopes(self, function: str | None) -> tuple[str | None, ...]:
+        return (None,) if function is None else (None, function)
+
+    def count(self, name: str, function: str | None = None, value=1):
+        """
+        Add `value` to the counter `name`, in total and for `function`.
+        """
+
+        with self._lock:
+            for scope in self._scopes(function):
+                counters = self._counters.get(scope)
+                if counters is None:
+                    counters = self._counters[scope] = dict.fromkeys(COUNTERS, 0)
+                counters[name] = counters.get(name, 0) + value
+        if not (self.callback is None):
+            self.callback(name, function, value)
+
+    def observe(self, name: str, seconds: float, function: str | None = None):
+        """
+        Add `seconds` to the histogram `name`, in total and for `function`.
+        """
+
+        with self._lock:
+            for scope in self._scopes(function):
+                histograms = self._histograms.get(scope)
+                if histograms is None:
+                    histograms = self._histograms[scope] = {}
+                histogram = histograms.get(name)
+                if histogram is None:
+                    histogram = histograms[name] = Histogram()
+                histogram.observe(seconds)
+        if not (self.callback is None):
+            self.callback(name, function, seconds)
+
+    def scope_stats(self, function: str | None = None) -> ScopeStats:
+        """
+        The counters and histograms recorded for `function`, or in
+        total if None.
+        """
+
+        with self._lock:
+            counters = self._counters.get(function, {})
+            histograms = self._histograms.get(function, {})
+            return {
+                "counters": {name: counters.get(name, 0) for name in COUNTERS},
+                "timings": {
+                    name: histogram.summary() for name, histogram in histograms.items()
+                },
+            }
+
+    @property
+    def functions(self) -> list[str]:
+        """
+        Names of the functions anything has been recorded for.
+        """
+
+        with self._lock:
+            return [
+                scope
+                for scope in self._counters.keys() | self._histograms.keys()
+                if not (scope is None)
+            ]
+
+    def reset(self):
+
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
@@ -0,0 +1,236 @@
+"""
+Breakdown of the time spent in each phase of cached invocations.
+"""
+
+from typing import TypedDict
+import threading
+import time
+
+# phases of an invocation in the order they happen
+PHASES = (
+    "hash",
+    "bind",
+    "fingerprint",
+    "index",
+    "compare",
+    "compute",
+    "copy",
+    "store",
+    "budget",
+    "save",
+)
+
+# share of the overhead of the cacher a phase should take up
+# before a change is suggested for it
+SUGGESTION_SHARE = 0.3
+
+SUGGESTIONS = {
+    "copy": (
+        "Copying outputs dominates: if callers do not modify the outputs, "
+        "consider the 'freeze', 'shallow' or 'none' copy policy."
+    ),
+    "compare": (
+        "Arguments are compared against each cached invocation in turn: "
+        "register fingerprinters for their types so that lookups use the index."
+    ),
+    "fingerprint": (
+        "Fingerprinting arguments dominates: consider a cheaper fingerprinter "
+        "for the large arguments."
+    ),
+    "save": (
+        "Saving after each computed invocation dominates: consider "
+        "auto_save='background', or saving manually."
+    ),
+}
+
+
+class PhaseProfile(TypedDict):
+    """
+    Attributes:
+        count:
+            Number of invocations that went through the phase.
+        total:
+            Total seconds spent in the phase.
+        mean:
+            Mean seconds spent in the phase per invocation that
+            went through it.
+    """
+
+    count: int
+    total: float
+    mean: float
+
+
+class FunctionProfile(TypedDict):
+    """
+    Attributes:
+        calls:
+            Number of profiled invocations.
+        hits:
+            Number of those that returned a cached output.
+        overhead:
+            Total seconds spent in phases other than "compute".
+        phases:
+            Profile of each phase an invocation went through.
+        suggestions:
+            Changes that may reduce the overhead.
+    """
+
+    calls: int
+    hits: int
+    overhead: float
+    phases: dict[str, PhaseProfile]
+    suggestions: list[str]
+
+
+class PhaseTimer:
+    """
+    Times the consecutive phases of a single invocation, each phase
+    lasting from the end of the previous one.
+    """
+
+    __slots__ = ("profiler", "function", "last", "times")
+
+    def __init__(self, profiler: "Profiler", function: str):
+
+        self.profiler = profiler
+        self.function = function
+        self.times: dict[str, float] = {}
+        self.last = time.perf_counter()
+
+    def lap(self, phase: str):
+        """
+        End `phase`, adding to its time if it was already lapped.
+        """
+
+        now = time.perf_counter()
+        self.times[phase] = self.times.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def finish(self, hit: bool):
+        """
+        Record the timed phases of the invocation.
+        """
+
+        self.profiler.record(self.function, self.times, hit)
+
+
+class Profiler:
+    """
+    Collects the time spent in each phase (see `PHASES`) of cached
+    invocations, per function. Safe to record from multiple threads.
+    """
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+        # calls and hits by function
+        self._calls: dict[str, list[int]] = {}
+        # count and total seconds by function and phase
+        self._phases: dict[str, dict[str, list]] = {}
+
+    def timer(self, function: str) -> PhaseTimer:
+        """
+        Start timing an invocation of `function`.
+        """
+
+        return PhaseTimer(self, function)
+
+    def record(self, function: str, times: dict[str, float], hit: bool):
+        """
+        Record an invocation of `function` which spent `times`
+        seconds in each phase.
+        """
+
+        with self._lock:
+            calls = self._calls.get(function)
+            if calls is None:
+                calls = self._calls[function] = [0, 0]
+                self._phases[function] = {}
+            calls[0] += 1
+            calls[1] += hit
+            phases = self._phases[function]
+            for phase, seconds in times.items():
+                totals = phases.get(phase)
+                if totals is None:
+                    totals = phases[phase] = [0, 0.0]
+                totals[0] += 1
+                totals[1] += seconds
+
+    def report(self) -> dict[str, FunctionProfile]:
+        """
+        Get the profile of each function invoked so far.
+        """
+
+        with self._lock:
+            calls = {function: list(counts) for function, counts in self._calls.items()}
+            phases = {
+                function: {
+                    phase: list(totals) for phase, totals in function_phases.items()
+                }
+                for function, function_phases in self._phases.items()
+            }
+
+        report = {}
+        for function, (function_calls, hits) in calls.items():
+            function_phases = {
+                phase: PhaseProfile(count=count, total=total, mean=total / count)
+                for phase in PHASES
+                if phase in phases[function]
+                for count, total in [phases[function][phase]]
+            }
+            overhead = sum(
+                profile["total"]
+                for phase, profile in function_phases.items()
+                if phase != "compute"
+            )
+            suggestions = [
+                suggestion
+                for phase, suggestion in SUGGESTIONS.items()
+                if phase in function_phases
+                and overhead > 0
+                and function_phases[phase]["total"] / overhead >= SUGGESTION_SHARE
+            ]
+            report[function] = FunctionProfile(
+                calls=function_calls,
+                hits=hits,
+                overhead=overhead,
+                phases=function_phases,
+                suggestions=suggestions,
+            )
+        return report
+
+    def format_report(self) -> str:
+        """
+        Get the report (see `.report`) as a human-readable table.
+        """
+
+        lines = []
+        for function, profile in self.report().items():
+            lines.append(
+                f"{function}: {profile['calls']} calls, {profile['hits']} hits,"
+                f" {profile['overhead'] * 1e6:.1f} us overhead"
+            )
+            lines.append(
+                f"    {'phase':<12}{'count':>10}{'total (us)':>14}"
+                f"{'mean (us)':>12}{'overhead':>10}"
+            )
+            for phase, phase_profile in profile["phases"].items():
+                share = (
+                    ""
+                    if phase == "compute" or profile["overhead"] == 0
+                    else f"{phase_profile['total'] / profile['overhead']:.0%}"
+                )
+                lines.append(
+                    f"    {phase:<12}{phase_profile['count']:>10}"
+                    f"{phase_profile['total'] * 1e6:>14.1f}"
+                    f"{phase_profile['mean'] * 1e6:>12.2f}{share:>10}"
+                )
+            lines.extend(f"    - {suggestion}" for suggestion in profile["suggestions"])
+        return "\n".join(lines)
+
+    def reset(self):
+
+        with self._lock:
+            self._calls.clear()
+            self._phases.clear()
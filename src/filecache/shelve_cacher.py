@@ -28,11 +28,12 @@ class ShelveCacher(AbstractCacher):
     def state_cache_to_cache(self, state_cache, *args, **kwargs) -> dict:
         return super().state_cache_to_cache(state_cache)
 
-    def save(self, path=None) -> Self:
+    def save(self, path=None, state=None) -> Self:
 
         path = self.save_path if path is None else path
+        state = self.get_state() if state is None else state
 
-        save_dict(path, self.get_state())
+        save_dict(path, state)
         return self
 
     def load(self, path=None) -> CacherState[dict]:
@@ -39,6 +39,9 @@ def compare_dict_values(
         if all_instance_of(dict, dict1, dict2):
             return not any(compare_dict_values(dict1, dict2, comparison_funcs).values())
 
+    comparison_funcs = [] if comparison_funcs is None else comparison_funcs
+    all_comparison_funcs = [dict_equality] + comparison_funcs
+
     comp = {}
     for key, value in dict1.items():
 
@@ -47,9 +50,7 @@ def compare_dict_values(
             comp[key] = True
             continue
 
-        comparison_funcs = [] if comparison_funcs is None else comparison_funcs
-        comparison_funcs = [dict_equality] + comparison_funcs
-        for comparison_func in comparison_funcs:
+        for comparison_func in all_comparison_funcs:
             result = comparison_func(value, value_in_other)
             if not (result is None):
                 if not isinstance(result, bool):
@@ -0,0 +1,34 @@
+"""
+Compression codecs from the standard library.
+"""
+
+from typing import Literal
+import bz2
+import lzma
+import zlib
+
+type Codec = Literal["zlib", "bz2", "lzma"]
+
+CODECS: tuple[Codec, ...] = ("zlib", "bz2", "lzma")
+
+_MODULES = {"zlib": zlib, "bz2": bz2, "lzma": lzma}
+
+
+def validate_codec(codec: Codec) -> Codec:
+    """
+    Raises:
+        ValueError:
+            `codec` is not a known codec.
+    """
+
+    if not codec in CODECS:
+        raise ValueError(f"codec should be one of {CODECS}")
+    return codec
+
+
+def compress(data: bytes, codec: Codec) -> bytes:
+    return _MODULES[validate_codec(codec)].compress(data)
+
+
+def decompress(data: bytes, codec: Codec) -> bytes:
+    return _MODULES[validate_codec(codec)].decompress(data)
@@ -0,0 +1,149 @@
+"""
+Policies for copying values into and out of a cache.
+"""
+
+from typing import Any, Literal, NamedTuple
+import copy
+import pickle
+
+type CopyPolicy = Literal["deep", "none", "shallow", "pickle", "freeze"]
+
+COPY_POLICIES: tuple[CopyPolicy, ...] = ("deep", "none", "shallow", "pickle", "freeze")
+
+
+def validate_copy_policy(policy: CopyPolicy) -> CopyPolicy:
+    """
+    Raises:
+        ValueError:
+            `policy` is not a known copy policy.
+    """
+
+    if not policy in COPY_POLICIES:
+        raise ValueError(f"copy policy should be one of {COPY_POLICIES}")
+    return policy
+
+
+class FrozenDict(dict):
+    """
+    Dictionary that cannot be modified.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("FrozenDict cannot be modified")
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+
+_IMMUTABLE_TYPES = (int, float, complex, str, bytes, bool, type(None), frozenset)
+
+
+class Unfrozen(NamedTuple):
+    """
+    Value stored under the "freeze" policy that could not be frozen in
+    whole, deep-copied once stored and again each time it is returned.
+    """
+
+    value: Any
+
+
+def _freeze(value: Any) -> tuple[Any, bool]:
+    """
+    Get an immutable version of `value` (see `freeze`), and whether
+    all of it could be frozen.
+    """
+
+    if isinstance(value, _IMMUTABLE_TYPES):
+        return value, True
+    if type(value) in (list, tuple) or (
+        isinstance(value, tuple) and hasattr(type(value), "_make")
+    ):
+        items = [_freeze(item) for item in value]
+        frozen = tuple(item for item, _ in items)
+        if not (type(value) in (list, tuple)):
+            # a named tuple
+            frozen = type(value)._make(frozen)
+        return frozen, all(complete for _, complete in items)
+    if type(value) in (dict, FrozenDict):
+        items = [(key, _freeze(val)) for key, val in value.items()]
+        return (
+            FrozenDict((key, frozen) for key, (frozen, _) in items),
+            all(complete for _, (_, complete) in items),
+        )
+    if type(value) is set:
+        items = [_freeze(item) for item in value]
+        return (
+            frozenset(item for item, _ in items),
+            all(complete for _, complete in items),
+        )
+    if type(value) is bytearray:
+        return bytes(value), True
+    if hasattr(value, "setflags") and hasattr(value, "copy"):
+        value = value.copy()
+        value.setflags(write=False)
+        return value, True
+    return copy.deepcopy(value), False
+
+
+def freeze(value: Any) -> Any:
+    """
+    Get an immutable version of `value`. Lists and tuples become tuples
+    (named tuples staying of their type), dicts `FrozenDict`s, sets
+    frozensets and bytearrays bytes, with their contents frozen as
+    well. Arrays (objects with `.setflags`, e.g. NumPy arrays) are
+    copied and made read-only. Other values, including subclasses of
+    the types above, cannot be frozen and are deep-copied instead.
+    """
+
+    return _freeze(value)[0]
+
+
+def _pickle_copy(value: Any) -> Any:
+    return pickle.loads(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def copy_to_cache(value: Any, policy: CopyPolicy) -> Any:
+    """
+    Copy `value` for storing in a cache according to `policy`.
+    """
+
+    match policy:
+        case "deep":
+            return copy.deepcopy(value)
+        case "none":
+            return value
+        case "shallow":
+            return copy.copy(value)
+        case "pickle":
+            return _pickle_copy(value)
+        case "freeze":
+            frozen, complete = _freeze(value)
+            return frozen if complete else Unfrozen(frozen)
+        case _:
+            validate_copy_policy(policy)
+
+
+def copy_from_cache(value: Any, policy: CopyPolicy) -> Any:
+    """
+    Copy `value` stored in a cache for returning it according to `policy`.
+    """
+
+    match policy:
+        case "deep":
+            return copy.deepcopy(value)
+        case "none":
+            return value
+        case "freeze":
+            if isinstance(value, Unfrozen):
+                # parts of it could be modified by the caller
+                return copy.deepcopy(value.value)
+            return value
+        case "shallow":
+            return copy.copy(value)
+        case "pickle":
+            return _pickle_copy(value)
+        case _:
+            validate_copy_policy(policy)
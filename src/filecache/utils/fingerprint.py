@@ -0,0 +1,264 @@
+"""
+Canonical, hashable fingerprints of values. Values that compare equal
+have equal fingerprints, which allows using fingerprints as dictionary
+keys in place of the values themselves.
+
+Values of types registered in a `FingerprinterRegistry` are fingerprinted
+by a digest of their contents instead, which allows fingerprinting large
+or unhashable values (e.g. arrays) cheaply.
+"""
+
+from collections.abc import Hashable, Buffer, Callable
+from typing import Any
+import hashlib
+import pickle
+
+from ..typing import Hasher
+from ..exceptions import FingerprintError
+from .inspect import unique_name
+
+# types whose instances are used as their own fingerprint
+_ATOMIC_TYPES = frozenset((int, float, complex, str, bool, type(None)))
+
+type Fingerprinter = Callable[[Any, Hasher], None]
+type HasherFactory = Callable[[], Hasher]
+
+
+def _default_hasher() -> Hasher:
+    return hashlib.sha256(usedforsecurity=False)
+
+
+class FingerprinterRegistry:
+    """
+    Registry of fingerprinters: functions that stream the contents of
+    an object into a hasher. Fingerprinters are looked up by the type
+    of the object, including its base classes and abstract base classes
+    it is registered to (e.g. `collections.abc.Buffer`).
+    """
+
+    def __init__(self, parent: "FingerprinterRegistry | None" = None):
+        """
+        Arguments:
+            parent:
+                Registry to look fingerprinters up from when not
+                found in this one.
+        """
+
+        self.parent = parent
+        self._fingerprinters: dict[type, Fingerprinter] = {}
+
+    def register(self, cls: type, fingerprinter: Fingerprinter | None = None):
+        """
+        Register `fingerprinter` for `cls`. Can also be used as a
+        decorator by leaving out `fingerprinter`.
+        """
+
+        if fingerprinter is None:
+
+            def decorator(fingerprinter: Fingerprinter):
+                self.register(cls, fingerprinter)
+                return fingerprinter
+
+            return decorator
+
+        self._fingerprinters[cls] = fingerprinter
+        return fingerprinter
+
+    def lookup(self, cls: type) -> Fingerprinter | None:
+        """
+        Get the fingerprinter for `cls`, or None if there is none.
+        """
+
+        for base in cls.__mro__:
+            if base in self._fingerprinters:
+                return self._fingerprinters[base]
+        # abstract base classes, most recently registered first
+        for registered, fingerprinter in reversed(self._fingerprinters.items()):
+            if issubclass(cls, registered):
+                return fingerprinter
+
+        return None if self.parent is None else self.parent.lookup(cls)
+
+
+class _HasherWriter:
+    """
+    File-like object that writes into a hasher.
+    """
+
+    def __init__(self, hasher: Hasher):
+        self.write = hasher.update
+
+
+def stream_bytes(value: bytes | bytearray, hasher: Hasher):
+    hasher.update(value)
+
+
+def stream_buffer(value: Buffer, hasher: Hasher):
+    """
+    Stream an object supporting the buffer protocol, including its
+    format and shape.
+    """
+
+    try:
+        view = memoryview(value)
+    except (ValueError, TypeError, BufferError) as exc:
+        # e.g. arrays of datetimes, whose format is not supported
+        raise FingerprintError(
+            f"Cannot fingerprint buffer of {type(value).__qualname__}"
+        ) from exc
+    with view:
+        if "O" in view.format:
+            # the buffer holds pointers to objects, not their contents
+            raise FingerprintError("Cannot fingerprint buffer of objects")
+        hasher.update(f"{view.format}{view.shape}".encode())
+        hasher.update(view if view.c_contiguous else view.tobytes())
+
+
+def stream_state(value: Any, hasher: Hasher):
+    """
+    Stream the pickled state (from `__getstate__`) of an object. Buffers
+    in the state (e.g. arrays) are streamed directly rather than
+    being pickled.
+
+    The state may include more than the contents of the object (e.g.
+    cached values), such that objects comparing equal can stream
+    different states, though objects streaming the same state do
+    compare equal.
+    """
+
+    def buffer_callback(buffer: pickle.PickleBuffer):
+        try:
+            hasher.update(buffer.raw())
+            return False
+        except BufferError:
+            # not contiguous, pickle in-band instead
+            return True
+
+    try:
+        pickle.Pickler(
+            _HasherWriter(hasher), protocol=5, buffer_callback=buffer_callback
+        ).dump(value.__getstate__())
+    except (pickle.PicklingError, TypeError, AttributeError) as exc:
+        raise FingerprintError(
+            f"Cannot fingerprint state of {type(value).__qualname__}"
+        ) from exc
+
+
+def _has_custom_state(value: Any) -> bool:
+    return not (type(value).__getstate__ is object.__getstate__)
+
+
+default_fingerprinters = FingerprinterRegistry()
+default_fingerprinters.register(bytes, stream_bytes)
+default_fingerprinters.register(bytearray, stream_bytes)
+default_fingerprinters.register(memoryview, stream_buffer)
+default_fingerprinters.register(Buffer, stream_buffer)
+
+
+def register_fingerprinter(cls: type, fingerprinter: Fingerprinter | None = None):
+    """
+    Register `fingerprinter` for `cls` in the default registry, see
+    `FingerprinterRegistry.register`.
+    """
+
+    return default_fingerprinters.register(cls, fingerprinter)
+
+
+def digest(
+    value: Any, fingerprinter: Fingerprinter, hasher: HasherFactory = _default_hasher
+) -> Hashable:
+    """
+    Get the fingerprint of `value` as the digest of its contents.
+    """
+
+    hasher_obj = hasher()
+    fingerprinter(value, hasher_obj)
+    return ("digest", unique_name(type(value)), hasher_obj.hexdigest())
+
+
+def fingerprint(
+    value: Any,
+    hasher: HasherFactory = _default_hasher,
+    fingerprinters: FingerprinterRegistry | None = None,
+) -> Hashable:
+    """
+    Get a hashable fingerprint of `value`. Lists, tuples, dicts and sets
+    are fingerprinted by their contents. Values with a fingerprinter in
+    `fingerprinters` are fingerprinted by a digest of their contents,
+    as are unhashable values with a custom `__getstate__`. Other
+    hashable values are their own fingerprint.
+
+    Arguments:
+        value:
+        hasher:
+            Factory returning a hashlib-type hasher used for digests.
+        fingerprinters:
+            Defaults to `default_fingerprinters`.
+
+    Raises:
+        FingerprintError:
+            `value` (or a value contained in it) cannot be fingerprinted.
+    """
+
+    if type(value) in _ATOMIC_TYPES:
+        return value
+
+    fingerprinters = (
+        default_fingerprinters if fingerprinters is None else fingerprinters
+    )
+
+    def inner(value):
+        return fingerprint(value, hasher, fingerprinters)
+
+    # containers are tagged so that e.g. lists and tuples with the same
+    # items (which do not compare equal) get different fingerprints
+    if isinstance(value, list):
+        return ("list", tuple(map(inner, value)))
+    if isinstance(value, tuple):
+        return ("tuple", tuple(map(inner, value)))
+    if isinstance(value, dict):
+        return (
+            "dict",
+            frozenset((inner(key), inner(val)) for key, val in value.items()),
+        )
+    if isinstance(value, (set, frozenset)):
+        return ("set", frozenset(map(inner, value)))
+
+    fingerprinter = fingerprinters.lookup(type(value))
+    if not (fingerprinter is None):
+        return digest(value, fingerprinter, hasher)
+
+    try:
+        hash(value)
+    except TypeError as exc:
+        if _has_custom_state(value):
+            return digest(value, stream_state, hasher)
+        raise FingerprintError(
+            f"Cannot fingerprint value of type {type(value).__qualname__}"
+        ) from exc
+    return value
+
+
+def fingerprint_arguments(
+    bound_args: dict[str, Any],
+    hasher: HasherFactory = _default_hasher,
+    fingerprinters: FingerprinterRegistry | None = None,
+) -> Hashable:
+    """
+    Get a fingerprint of bound function arguments (see
+    `utils.inspect.bind_arguments`).
+
+    Arguments:
+        bound_args:
+        hasher:
+        fingerprinters:
+            See `fingerprint`.
+
+    Raises:
+        FingerprintError:
+    """
+
+    return tuple(
+        (name, fingerprint(value, hasher, fingerprinters))
+        for name, value in bound_args.items()
+    )
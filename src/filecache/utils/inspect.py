@@ -1,7 +1,9 @@
 import inspect as base_inspect
 from collections.abc import Callable
 from hashlib import sha256
+from pathlib import Path
 from typing import Any
+import os
 
 from ..typing import Hasher
 
@@ -23,6 +25,34 @@ def function_hash(function: Callable, *, hasher: Hasher | None = None) -> str:
     return function_hash
 
 
+def source_file(function: Callable) -> Path | None:
+    """
+    Get the path of the file `function` is defined in, or None if
+    there is no such file (e.g. builtins or interactively defined
+    functions).
+    """
+
+    try:
+        file = base_inspect.getsourcefile(function)
+    except TypeError:
+        return None
+    return None if file is None else Path(file)
+
+
+def modified_time(path: Path | None) -> int | None:
+    """
+    Get the modification time of `path` in nanoseconds, or None
+    if `path` is None or cannot be accessed.
+    """
+
+    if path is None:
+        return None
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
 def bind_arguments(
     func: Callable, args, kwargs, ignore_in_kwargs: tuple[str, ...] = ()
 ):
@@ -51,6 +81,63 @@ def bind_arguments(
     return bound_args.arguments
 
 
+class ArgumentBinder:
+    """
+    Binds arguments to the call signature of a function like
+    `bind_arguments`, but with the signature and defaults of the
+    function computed only once.
+
+    Purely positional and purely keyword calls to functions with only
+    positional-or-keyword parameters are bound without going through
+    `inspect.Signature.bind`.
+    """
+
+    def __init__(self, func: Callable):
+
+        self.signature = base_inspect.signature(func)
+        parameters = self.signature.parameters.values()
+        self.names = tuple(param.name for param in parameters)
+        self._name_set = frozenset(self.names)
+        self.defaults = {
+            param.name: param.default
+            for param in parameters
+            if not (param.default is param.empty)
+        }
+        self._fast = all(
+            param.kind is param.POSITIONAL_OR_KEYWORD for param in parameters
+        )
+
+    def bind(self, args, kwargs) -> dict[str, Any]:
+        """
+        Bind `args` and `kwargs`, applying defaults for missing
+        arguments.
+        """
+
+        if self._fast:
+            if not kwargs and len(args) <= len(self.names):
+                bound_args = dict(zip(self.names, args))
+                if len(bound_args) == len(self.names):
+                    return bound_args
+                missing = self.names[len(args) :]
+                if all(name in self.defaults for name in missing):
+                    for name in missing:
+                        bound_args[name] = self.defaults[name]
+                    return bound_args
+            elif not args and kwargs.keys() <= self._name_set:
+                try:
+                    return {
+                        name: kwargs[name] if name in kwargs else self.defaults[name]
+                        for name in self.names
+                    }
+                except KeyError:
+                    # missing a required argument, let the signature raise
+                    pass
+
+        bound_args = self.signature.bind(*args, **kwargs)
+        bound_args.apply_defaults()
+        return bound_args.arguments
+
+
 def unique_name(obj: Callable | Any):
     """
     Return a unique name for `obj`.
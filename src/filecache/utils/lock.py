@@ -0,0 +1,47 @@
+"""
+Advisory locking of files between processes.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # not available on e.g. Windows
+    fcntl = None
+
+
+def file_locking_available() -> bool:
+    return not (fcntl is None)
+
+
+@contextmanager
+def file_lock(path: Path, shared=False):
+    """
+    Hold an advisory lock on the file at `path` (created if it does not
+    exist), blocking until the lock is acquired.
+
+    Arguments:
+        path:
+        shared:
+            Whether to acquire a shared lock, which can be held by
+            multiple processes at once, instead of an exclusive one.
+
+    Raises:
+        NotImplementedError:
+            File locking is not available on the platform.
+    """
+
+    if not file_locking_available():
+        raise NotImplementedError("File locking is not available on this platform")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield path
+    finally:
+        # closing releases the lock
+        os.close(fd)
@@ -0,0 +1,82 @@
+"""
+Estimates of the size of values.
+"""
+
+from collections.abc import Mapping
+from collections import deque
+import itertools
+import pickle
+import sys
+
+# items of a container looked at, the rest being assumed to be
+# of the same average size
+_SAMPLE_ITEMS = 32
+# levels of containers looked into
+_MAX_DEPTH = 4
+
+_CONTAINER_TYPES = (list, tuple, set, frozenset, deque)
+
+
+def _sample_size(items, length: int, depth: int) -> int:
+
+    sample = list(itertools.islice(items, _SAMPLE_ITEMS))
+    if len(sample) == 0:
+        return 0
+    total = sum(_estimate(item, depth) for item in sample)
+    return total * length // len(sample)
+
+
+def _estimate(value, depth: int) -> int:
+
+    size = sys.getsizeof(value, 0)
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        # buffers (e.g. NumPy arrays), including views of other buffers
+        return max(size, nbytes)
+    if depth == 0:
+        return size
+    if isinstance(value, _CONTAINER_TYPES):
+        return size + _sample_size(iter(value), len(value), depth - 1)
+    if isinstance(value, Mapping):
+        return size + _sample_size(
+            itertools.chain.from_iterable(value.items()), 2 * len(value), depth - 1
+        )
+    attributes = getattr(value, "__dict__", None)
+    if isinstance(attributes, dict):
+        return size + _estimate(attributes, depth - 1)
+    return size
+
+
+def estimate_size(value) -> int:
+    """
+    Cheaply estimate the size of `value` in bytes, without serializing
+    it: the size of the object (`sys.getsizeof`), or of its buffer if
+    it has `nbytes` (e.g. NumPy arrays), plus those of the items of
+    containers and the attributes of objects, a few levels deep. Only
+    a sample of the items of large containers is looked at, such that
+    the time taken does not grow with the size of `value`.
+    """
+
+    return _estimate(value, _MAX_DEPTH)
+
+
+def pickled_size(value) -> int:
+    """
+    Get the serialized size of `value` in bytes, that is, the length
+    of its pickle. Buffers that support out-of-band pickling (e.g.
+    NumPy arrays) are counted by their size without being copied.
+    Values that cannot be pickled are estimated with `estimate_size`.
+    Exact, but takes as long as pickling `value`.
+    """
+
+    buffers_size = 0
+
+    def count_buffer(buffer: pickle.PickleBuffer):
+        nonlocal buffers_size
+        buffers_size += buffer.raw().nbytes
+
+    try:
+        pickled = pickle.dumps(value, protocol=5, buffer_callback=count_buffer)
+    except Exception:
+        return estimate_size(value)
+    return len(pickled) + buffers_size
@@ -0,0 +1,161 @@
+"""
+Coalescing of saves into a background thread.
+"""
+
+from collections.abc import Callable
+import atexit
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehind:
+    """
+    Calls `flush` in a background thread once changes have been marked,
+    coalescing the changes marked in the meantime into a single call.
+
+    A flush happens `max_delay` seconds after the first change marked
+    since the previous flush, or as soon as `max_pending` changes are
+    pending, whichever comes first. Pending changes are also flushed
+    at interpreter exit.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[], object],
+        max_delay: float = 1.0,
+        max_pending: int = 100,
+        name: str | None = None,
+    ):
+        """
+
+        Arguments:
+            flush:
+                Called to write the pending changes.
+            max_delay:
+                Max number of seconds a change is left pending.
+            max_pending:
+                Max number of changes left pending.
+            name:
+                Name of the background thread.
+        """
+
+        if max_delay < 0:
+            raise ValueError("max_delay should be non-negative")
+        if max_pending < 1:
+            raise ValueError("max_pending should be positive")
+
+        self._flush = flush
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.name = name
+
+        self._condition = threading.Condition()
+        # held while flushing, so that flushes happen one at a time
+        self._flush_lock = threading.Lock()
+        self._pending = 0
+        self._first_pending = 0.0
+        self._closed = False
+        self._thread: threading.Thread | None = None
+        atexit.register(self.close)
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of changes marked since the last flush.
+        """
+        return self._pending
+
+    def mark(self, count=1):
+        """
+        Mark `count` changes as pending.
+
+        Raises:
+            RuntimeError:
+                Already closed.
+        """
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot mark changes after closing")
+            first = self._pending == 0
+            if first:
+                self._first_pending = time.monotonic()
+            self._pending += count
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._thread.start()
+            # otherwise the thread is already waiting for the delay
+            if first or self._pending >= self.max_pending:
+                self._condition.notify()
+
+    def flush(self):
+        """
+        Flush the pending changes, if any, in the calling thread.
+        """
+
+        with self._flush_lock:
+            with self._condition:
+                pending = self._pending
+                self._pending = 0
+            if pending == 0:
+                return
+            try:
+                self._flush()
+            except BaseException:
+                # try again with the next flush
+                with self._condition:
+                    if self._pending == 0:
+                        self._first_pending = time.monotonic()
+                    self._pending += pending
+                raise
+
+    def close(self):
+        """
+        Stop the background thread and flush the pending changes.
+        Closing more than once has no effect.
+        """
+
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        if not (self._thread is None):
+            self._thread.join()
+        atexit.unregister(self.close)
+        self.flush()
+
+    def _wait(self) -> bool:
+        """
+        Wait until the pending changes should be flushed.
+
+        Returns:
+            Whether the pending changes should be flushed, as opposed
+            to having been closed.
+        """
+
+        with self._condition:
+            while self._pending == 0 and not self._closed:
+                self._condition.wait()
+            while 0 < self._pending < self.max_pending and not self._closed:
+                remaining = self._first_pending + self.max_delay - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return not self._closed
+
+    def _run(self):
+
+        while self._wait():
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing in the background failed")
+                # back off before trying again
+                with self._condition:
+                    self._condition.wait_for(lambda: self._closed, self.max_delay)
@@ -0,0 +1,38 @@
+import numpy as np
+
+from filecache.blob_store import BlobStore
+
+
+def test_round_trip(tmp_path):
+    """
+    Values are read back as written, buffers being memory-mapped.
+    """
+
+    store = BlobStore(tmp_path)
+    value = {"array": np.arange(1000, dtype=np.float64), "bytes": bytearray(b"ab")}
+
+    ref = store.write(value)
+    read = store.read(ref)
+
+    assert np.array_equal(read["array"], value["array"])
+    assert read["bytes"] == value["bytes"]
+    # backed by the read-only mapping of the file
+    assert not read["array"].flags.writeable
+
+
+def test_content_addressed(tmp_path):
+    """
+    Equal values are stored once, and blobs are not rewritten.
+    """
+
+    store = BlobStore(tmp_path)
+    ref = store.write([1, 2, 3])
+    modified = store.path(ref).stat().st_mtime_ns
+
+    assert store.write([1, 2, 3]) == ref
+    assert store.path(ref).stat().st_mtime_ns == modified
+    assert store.write([1, 2]) != ref
+    assert len([path for path in tmp_path.rglob("*") if path.is_file()]) == 2
+
+    store.delete([ref])
+    assert not store.path(ref).exists()
@@ -0,0 +1,38 @@
+from filecache.call_log import CallLog
+
+
+def test_call_log(tmp_path):
+    """
+    Invocations are recorded once per key, and reading stops at a
+    record cut short.
+    """
+
+    path = tmp_path / "calls.log"
+    call_log = CallLog(path)
+    call_log.record("func", {"value": 1}, key=1)
+    call_log.record("func", {"value": 1}, key=1)
+    call_log.record("other", {"value": 1}, key=1)
+    # not fingerprinted, so keyed by the pickled arguments
+    call_log.record("func", {"value": [2]}, key=None)
+    call_log.record("func", {"value": [2]}, key=None)
+    call_log.record("func", {"value": [3]}, key=None)
+    # cannot be pickled
+    call_log.record("func", {"value": lambda: None}, key=3)
+
+    expected = [
+        ("func", {"value": 1}),
+        ("other", {"value": 1}),
+        ("func", {"value": [2]}),
+        ("func", {"value": [3]}),
+    ]
+    assert list(CallLog.read(path)) == expected
+
+    # recorded before, by another `CallLog`, read on its first record
+    assert CallLog(path)._recorded is None
+    CallLog(path).record("func", {"value": 1}, key=1)
+    CallLog(path).record("func", {"value": [2]}, key=None)
+    assert list(CallLog.read(path)) == expected
+
+    with open(path, "ab") as f:
+        f.write(b"\x80\x05\x95")
+    assert list(CallLog.read(path)) == expected
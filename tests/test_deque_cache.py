@@ -1,8 +1,8 @@
 import pytest
 
-from collections import deque
+import pickle
 
-from filecache.deque_cache import DequeCache
+from filecache.deque_cache import DequeCache, RecencyDeque
 
 
 def test_deque_added_automatically():
@@ -13,7 +13,7 @@ def test_deque_added_automatically():
     assert len(deq) == 0
     deq["dummy_key"]
     assert len(deq) == 1
-    assert isinstance(deq["dummy_key"], deque)
+    assert isinstance(deq["dummy_key"], RecencyDeque)
 
 
 @pytest.mark.parametrize(
@@ -89,3 +89,119 @@ def test_find_cached_complex():
             deq.find_cached_item("dummy_key", 1)
         # passed function overwrites instance default
         assert deq.find_cached_item("dummy_key", 1, lambda one, two: one == two) == 1
+
+
+def _index_key(item):
+    return item.get("key")
+
+
+def test_find_indexed():
+    """Items added with an index key can be found by the key"""
+
+    deq = DequeCache(max_size=2, index_key=_index_key)
+
+    first = deq.add_item("dummy_key", {"key": 1})
+    deq.add_item("dummy_key", {"key": 2})
+    deq.add_item("dummy_key", {"key": None})
+    assert list(deq["dummy_key"]) == [{"key": None}, {"key": 2}]
+
+    assert deq.find_indexed_item("dummy_key", 2) == {"key": 2}
+    # evicted item is no longer indexed
+    with pytest.raises(LookupError):
+        deq.find_indexed_item("dummy_key", first["key"])
+    # unindexed items are only found by comparison
+    with pytest.raises(LookupError):
+        deq.find_indexed_item("dummy_key", None)
+    assert deq.find_cached_item("dummy_key", {"key": None}) == {"key": None}
+
+
+def test_remove_item():
+    """Items are removed by identity, along with their index entry"""
+
+    deq = DequeCache(index_key=_index_key)
+
+    item = deq.add_item("dummy_key", {"key": 1})
+    deq.add_item("dummy_key", {"key": 2})
+    assert not deq.remove_item("dummy_key", {"key": 1})
+    assert deq.remove_item("dummy_key", item)
+    assert list(deq["dummy_key"]) == [{"key": 2}]
+    with pytest.raises(LookupError):
+        deq.find_indexed_item("dummy_key", 1)
+
+
+def test_indexed_moves_to_front():
+    """Item found using the index is moved to the front"""
+
+    deq = DequeCache(index_key=_index_key)
+
+    for i in range(3):
+        deq.add_item("dummy_key", {"key": i})
+    deq.find_indexed_item("dummy_key", 0)
+    assert [item["key"] for item in deq["dummy_key"]] == [0, 2, 1]
+
+
+def test_index_after_resize_and_pickle():
+    """Index stays consistent when max size changes and when pickled"""
+
+    deq = DequeCache(index_key=_index_key)
+
+    for i in range(5):
+        deq.add_item("dummy_key", {"key": i})
+    deq.max_size = 2
+    with pytest.raises(LookupError):
+        deq.find_indexed_item("dummy_key", 0)
+
+    loaded = pickle.loads(pickle.dumps(deq))
+    assert loaded.find_indexed_item("dummy_key", 4) == {"key": 4}
+    with pytest.raises(LookupError):
+        loaded.find_indexed_item("dummy_key", 1)
+
+    loaded.invalidate("dummy_key")
+    with pytest.raises(LookupError):
+        loaded.find_indexed_item("dummy_key", 4)
+
+
+def test_recency_deque():
+    """Items are moved, removed and replaced by identity, keeping the order"""
+
+    items = [{"value": i} for i in range(4)]
+    deq = RecencyDeque(items[:3], maxlen=3)
+    assert list(deq) == items[:3]
+    assert deq[0] is items[0] and deq[-1] is items[2]
+
+    assert deq.move_to_front(items[2])
+    assert not deq.move_to_front({"value": 2})
+    assert list(deq) == [items[2], items[0], items[1]]
+
+    # full, so the least recently used item is dropped
+    deq.appendleft(items[3])
+    assert list(deq) == [items[3], items[2], items[0]]
+    assert not items[1] in deq
+
+    new_item = {"value": 5}
+    assert deq.replace(items[2], new_item)
+    assert list(deq) == [items[3], new_item, items[0]]
+    assert not deq.discard(items[2])
+    deq.remove(new_item)
+    assert deq.pop() is items[0]
+    assert list(pickle.loads(pickle.dumps(deq))) == [items[3]]
+
+    copied = deq.copy()
+    copied.appendleft(items[1])
+    assert list(deq) == [items[3]]
+    assert list(copied) == [items[1], items[3]]
+
+
+def test_move_to_front_constant_time(monkeypatch):
+    """Indexed items are moved to the front and removed without scanning"""
+
+    deq = DequeCache(index_key=_index_key)
+    for i in range(10_000):
+        deq.add_item("dummy_key", {"key": i})
+
+    def fail(*args):
+        raise AssertionError("deque scanned")
+
+    monkeypatch.setattr(RecencyDeque, "__iter__", fail)
+    assert deq.find_indexed_item("dummy_key", 0) == {"key": 0}
+    assert deq.remove_item("dummy_key", deq.find_indexed_item("dummy_key", 1))
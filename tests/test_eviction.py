@@ -0,0 +1,47 @@
+from filecache.deque_cache import DequeCache
+from filecache.eviction import GreedyDualSize
+
+
+def test_greedy_dual_size_keeps_expensive():
+    """
+    Items that are cheap to recompute per byte are evicted first.
+    """
+
+    deq = DequeCache(max_size=2, eviction_policy=GreedyDualSize())
+
+    expensive = deq.add_item("dummy_key", {"cost": 10.0, "size": 10})
+    deq.add_item("dummy_key", {"cost": 1.0, "size": 1000})
+    cheap_small = deq.add_item("dummy_key", {"cost": 1.0, "size": 10})
+
+    assert list(deq["dummy_key"]) == [cheap_small, expensive]
+
+
+def test_greedy_dual_size_ages():
+    """
+    Items not accessed in a while lose out to newly added ones.
+    """
+
+    policy = GreedyDualSize()
+    deq = DequeCache(max_size=2, eviction_policy=policy)
+
+    old = deq.add_item("dummy_key", {"cost": 2.0, "size": 1})
+    for _ in range(5):
+        deq.add_item("dummy_key", {"cost": 1.0, "size": 1})
+
+    assert not any(item is old for item in deq["dummy_key"])
+    assert policy.aging > 0
+
+
+def test_greedy_dual_size_resize():
+    """
+    Shrinking the deques evicts by priority.
+    """
+
+    deq = DequeCache(max_size=3, eviction_policy=GreedyDualSize())
+
+    expensive = deq.add_item("dummy_key", {"cost": 10.0, "size": 1})
+    deq.add_item("dummy_key", {"cost": 1.0, "size": 1})
+    deq.add_item("dummy_key", {"cost": 2.0, "size": 1})
+    deq.max_size = 1
+
+    assert list(deq["dummy_key"]) == [expensive]
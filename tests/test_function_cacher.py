@@ -1,13 +1,30 @@
 import pandas as pd
+import numpy as np
 import pytest
 
 from pathlib import Path
 import string
-from collections import deque
-
+from collections import deque, namedtuple
+import importlib.util
+import multiprocessing
+import dbm
+import asyncio
+import os
+import threading
+import time
+import datetime as dt
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from filecache import function_cacher
 from filecache.function_cacher import FunctionCacher
+from filecache.call_log import CallLog
+from filecache.deque_cache import RecencyDeque
 from filecache.exceptions import StateNotFoundError
 from filecache.utils.compare import all_instance_of
+from filecache.utils.inspect import unique_name
+from filecache.utils import size
+from filecache.invocation_store import InvocationStore
 
 
 # NOTE: tmp_path is a pytest thing
@@ -125,6 +142,64 @@ def test_caching_complex(tmp_path: Path):
     assert called == 2
 
 
+def test_compare_funcs_not_indexed(tmp_path: Path):
+    """
+    Comparison functions are used even for arguments that could be
+    fingerprinted, whether given per function or for the cacher.
+    """
+
+    def compare_case(one, two):
+        if all_instance_of(str, one, two):
+            return one.lower() == two.lower()
+
+    function_cache = FunctionCacher(save_path=tmp_path)
+    calls = []
+
+    @function_cache(compare_funcs=[compare_case])
+    def upper(text):
+        calls.append(text)
+        return text.upper()
+
+    assert upper("a") == upper("A") == "A"
+    assert calls == ["a"]
+
+    other_cache = FunctionCacher(save_path=tmp_path / "other", thread_safe=True)
+    other_cache.compare_funcs = [compare_case]
+
+    @other_cache()
+    def lower(text):
+        calls.append(text)
+        return text.lower()
+
+    assert lower("B") == lower("b") == "b"
+    assert calls == ["a", "B"]
+
+
+def test_compare_funcs_state_digest(tmp_path: Path):
+    """
+    Equal dataframes whose states differ are found with a comparison
+    function.
+    """
+
+    def compare_df(one, two):
+        if all_instance_of(pd.DataFrame, one, two):
+            return one.equals(two)
+
+    function_cache = FunctionCacher(save_path=tmp_path)
+    called = 0
+
+    @function_cache(compare_funcs=[compare_df])
+    def first_time(df):
+        nonlocal called
+        called += 1
+        return df["time"].min()
+
+    df = pd.DataFrame({"time": pd.to_datetime(["2020-01-01", "2020-01-02"])})
+    first_time(df)
+    first_time(df.copy())
+    assert called == 1
+
+
 def test_is_cached(tmp_path: Path):
     """
     The return value is actually cached, i.e. that
@@ -376,6 +451,54 @@ class TestAutoSave:
         dummy_function(value=1)
         assert len(next(iter(function_cache.load_cache(inplace=False).values()))) == 2
 
+    def test_auto_save_background(self, tmp_path, monkeypatch):
+        """
+        Background auto-saving coalesces invocations into a single save,
+        and pending invocations are saved when flushing.
+        """
+
+        saves = []
+        save = FunctionCacher.save
+
+        def recording_save(self, *args, **kwargs):
+            saves.append(threading.current_thread())
+            return save(self, *args, **kwargs)
+
+        monkeypatch.setattr(FunctionCacher, "save", recording_save)
+
+        function_cache = FunctionCacher(
+            save_path=tmp_path, auto_save="background", max_save_delay=60
+        )
+
+        @function_cache()
+        def add_one(value):
+            return value + 1
+
+        for value in range(10):
+            add_one(value)
+        # nothing saved in the calling thread
+        assert saves == []
+
+        function_cache.flush()
+        assert len(saves) == 1
+        loaded = FunctionCacher(save_path=tmp_path).get_cached_data(add_one)
+        assert len(loaded) == 10
+
+        # saved in the background once enough changes are pending
+        function_cache.max_pending_changes = 3
+        function_cache.close()
+        for value in range(10, 13):
+            add_one(value)
+        deadline = time.monotonic() + 5
+        while len(saves) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(saves) == 2
+        assert saves[1] != threading.current_thread()
+
+        function_cache.close()
+        loaded = FunctionCacher(save_path=tmp_path).get_cached_data(add_one)
+        assert len(loaded) == 13
+
 
 def test_auto_load(tmp_path):
     """
@@ -401,3 +524,1299 @@ def test_auto_load(tmp_path):
     function_cache.save()
     new_function_cacher = FunctionCacher(save_path=cache_path)
     assert len(next(iter(new_function_cacher.cache.values()))) == 1
+
+
+def test_function_hashed_once(tmp_path, monkeypatch):
+    """
+    The function is hashed when wrapped, not on each invocation.
+    """
+
+    cache_path = tmp_path / "cache"
+    cache_path.mkdir()
+
+    function_cache = FunctionCacher(save_path=cache_path)
+
+    hashed = 0
+    original_hash_function = function_cacher.hash_function
+
+    def counting_hash_function(*args, **kwargs):
+        nonlocal hashed
+        hashed += 1
+        return original_hash_function(*args, **kwargs)
+
+    monkeypatch.setattr(function_cacher, "hash_function", counting_hash_function)
+
+    @function_cache()
+    def dummy_function(value=0):
+        return value
+
+    assert hashed == 1
+    for i in range(3):
+        dummy_function(i)
+        dummy_function(i)
+    assert hashed == 1
+
+    function_cache.rehash(dummy_function)
+    assert hashed == 2
+
+
+def test_rehash_on_source_change(tmp_path):
+    """
+    The function is hashed again when its source file changes.
+    """
+
+    cache_path = tmp_path / "cache"
+    cache_path.mkdir()
+    module_path = tmp_path / "dummy_module.py"
+    module_path.write_text("def dummy_function(value):\n    return value\n")
+
+    spec = importlib.util.spec_from_file_location("dummy_module", module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    function_cache = FunctionCacher(save_path=cache_path)
+    dummy_function = function_cache()(module.dummy_function)
+    dummy_function(0)
+    old_hash = function_cache.hash_function(dummy_function)
+
+    module_path.write_text("def dummy_function(value):\n    return value + 1\n")
+    stat = module_path.stat()
+    os.utime(module_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    new_hash = function_cache.hash_function(dummy_function)
+    assert old_hash != new_hash
+    assert len(function_cache.get_cached_data(dummy_function)) == 0
+
+
+class Unhashable:
+
+    __hash__ = None
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def test_indexed_lookup(tmp_path):
+    """
+    Invocations with fingerprintable arguments are looked up using
+    the index, others by comparison.
+    """
+
+    cache_path = tmp_path / "cache"
+    cache_path.mkdir()
+
+    function_cache = FunctionCacher(save_path=cache_path)
+
+    called = 0
+
+    @function_cache()
+    def dummy_function(value):
+        nonlocal called
+        called += 1
+        return value
+
+    for value in [[1, 2], {"a": 1}, Unhashable(1)]:
+        dummy_function(value)
+        dummy_function(value)
+    assert called == 3
+    dummy_function(Unhashable(1))
+    assert called == 3
+
+    cached_data = function_cache.get_cached_data(dummy_function)
+    assert [input_output["key"] is None for input_output in cached_data] == [
+        True,
+        False,
+        False,
+    ]
+
+    function_cache.save()
+    function_cache.load_cache(inplace=True)
+    dummy_function([1, 2])
+    assert called == 3
+
+
+def test_fingerprinted_dataframe(tmp_path):
+    """
+    DataFrames are indexed by their contents without comparison functions.
+    """
+
+    cache_path = tmp_path / "cache"
+    cache_path.mkdir()
+
+    function_cache = FunctionCacher(save_path=cache_path)
+
+    called = 0
+
+    @function_cache()
+    def dummy_function(df):
+        nonlocal called
+        called += 1
+        return df
+
+    df = pd.DataFrame(dict(idx=range(5)))
+    dummy_function(df)
+    dummy_function(df.copy())
+    assert called == 1
+    assert not (function_cache.get_cached_data(dummy_function)[0]["key"] is None)
+    dummy_function(df + 1)
+    assert called == 2
+
+
+def test_copy_policy(tmp_path):
+    """
+    Copy policy can be set for the cacher and overridden per function.
+    """
+
+    cache_path = tmp_path / "cache"
+    cache_path.mkdir()
+
+    function_cache = FunctionCacher(save_path=cache_path, copy="none")
+
+    @function_cache()
+    def shared():
+        return {"value": 0}
+
+    @function_cache(copy="freeze")
+    def frozen():
+        return {"value": [0]}
+
+    shared()
+    shared()["value"] = 1
+    assert shared()["value"] == 1
+
+    # frozen on a miss too
+    assert frozen() is frozen()
+    assert frozen()["value"] == (0,)
+    with pytest.raises(TypeError):
+        frozen()["value"] = 1
+
+    function_cache.save()
+    function_cache.load_cache(inplace=True)
+    assert frozen()["value"] == (0,)
+
+    with pytest.raises(ValueError):
+        function_cache.copy_policy = "deeper"
+    with pytest.raises(ValueError):
+        function_cache(copy="deeper")(shared)
+
+
+def test_freeze_on_miss(tmp_path):
+    """
+    Frozen outputs are returned on a miss as well, whether invoked
+    thread-safely, through `.map` or as coroutines.
+    """
+
+    function_cache = FunctionCacher(save_path=tmp_path, copy="freeze", thread_safe=True)
+
+    @function_cache()
+    def frozen(value):
+        return [value]
+
+    @function_cache()
+    async def frozen_async(value):
+        return [value]
+
+    assert frozen(1) is frozen(1) == (1,)
+    assert function_cache.map(frozen, [(2,), (2,)]) == [(2,), (2,)]
+    assert asyncio.run(frozen_async(3)) == (3,)
+
+    Point = namedtuple("Point", "x y")
+
+    @function_cache()
+    def point(x):
+        return Point(x, [x])
+
+    assert point(1).x == 1
+    assert point(1) is point(1)
+
+    @function_cache()
+    def queue(value):
+        return deque([value])
+
+    # cannot be frozen, so a copy each time
+    queue(1).append(2)
+    assert queue(1) == deque([1])
+
+
+class TestAsync:
+
+    def test_caches_result(self, tmp_path):
+        """
+        Results of coroutine functions are cached, not the coroutines.
+        """
+
+        function_cache = FunctionCacher(save_path=tmp_path, auto_save=True)
+
+        called = 0
+
+        @function_cache()
+        async def dummy_function(value):
+            nonlocal called
+            called += 1
+            await asyncio.sleep(0)
+            return {"value": value}
+
+        async def main():
+            assert await dummy_function(1) == {"value": 1}
+            assert await dummy_function(1) == {"value": 1}
+
+        asyncio.run(main())
+        assert called == 1
+        # saved off the event loop
+        loaded = function_cache.load_cache(inplace=False)
+        assert next(iter(loaded.values()))[0]["output"] == {"value": 1}
+
+    def test_concurrent_deduplicated(self, tmp_path):
+        """
+        Concurrent invocations with the same input are computed once.
+        """
+
+        function_cache = FunctionCacher(save_path=tmp_path)
+
+        called = 0
+
+        @function_cache()
+        async def dummy_function(value):
+            nonlocal called
+            called += 1
+            await asyncio.sleep(0.01)
+            return [value]
+
+        async def main():
+            return await asyncio.gather(*(dummy_function(i % 2) for i in range(6)))
+
+        results = asyncio.run(main())
+        assert called == 2
+        assert results == [[0], [1]] * 3
+        # each caller gets its own copy
+        assert len(set(map(id, results))) == 6
+
+    def test_concurrent_exception(self, tmp_path):
+        """
+        Exception from the computation is raised to each concurrent invocation.
+        """
+
+        function_cache = FunctionCacher(save_path=tmp_path)
+
+        called = 0
+
+        @function_cache()
+        async def dummy_function():
+            nonlocal called
+            called += 1
+            await asyncio.sleep(0.01)
+            raise ValueError()
+
+        async def main():
+            return await asyncio.gather(
+                *(dummy_function() for _ in range(3)), return_exceptions=True
+            )
+
+        results = asyncio.run(main())
+        assert called == 1
+        assert all(isinstance(result, ValueError) for result in results)
+
+    def test_cancelled_caller(self, tmp_path):
+        """
+        Cancelling the invocation computing the output does not cancel
+        the concurrent invocations waiting for it.
+        """
+
+        function_cache = FunctionCacher(save_path=tmp_path)
+
+        called = 0
+
+        @function_cache()
+        async def dummy_function(value):
+            nonlocal called
+            called += 1
+            await asyncio.sleep(0.01)
+            return [value]
+
+        async def main():
+            computing = asyncio.create_task(dummy_function(1))
+            await asyncio.sleep(0)
+            waiting = asyncio.create_task(dummy_function(1))
+            await asyncio.sleep(0)
+            computing.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await computing
+            return await waiting
+
+        assert asyncio.run(main()) == [1]
+        assert called == 1
+        cached = function_cache.get_cached_data(dummy_function)
+        assert [input_output["output"] for input_output in cached] == [[1]]
+
+
+def test_thread_safe(tmp_path):
+    """
+    Thread-safe cacher computes each invocation once and stores the
+    outputs with the right inputs.
+    """
+
+    function_cache = FunctionCacher(
+        save_path=tmp_path, thread_safe=True, auto_save=True
+    )
+
+    called = Counter()
+    called_lock = threading.Lock()
+
+    @function_cache()
+    def dummy_function(value):
+        with called_lock:
+            called[value] += 1
+        time.sleep(0.01)
+        return {"value": value}
+
+    values = [i % 4 for i in range(64)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(dummy_function, values))
+
+    assert results == [{"value": value} for value in values]
+    assert called == {value: 1 for value in range(4)}
+    for input_output in function_cache.get_cached_data(dummy_function):
+        assert input_output["output"] == {"value": input_output["input"]["value"]}
+
+    loaded = function_cache.load_cache(inplace=False)
+    assert len(next(iter(loaded.values()))) == 4
+
+
+def test_thread_safe_exception(tmp_path):
+    """
+    Exception is raised to the threads waiting for the computation.
+    """
+
+    function_cache = FunctionCacher(save_path=tmp_path, thread_safe=True)
+
+    called = 0
+
+    @function_cache()
+    def dummy_function():
+        nonlocal called
+        called += 1
+        time.sleep(0.05)
+        raise ValueError()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(dummy_function) for _ in range(4)]
+    for future in futures:
+        assert isinstance(future.exception(), ValueError)
+    assert called == 1
+
+
+@pytest.mark.parametrize("thread_safe", [False, True])
+def test_failed_invocation_not_cached(tmp_path, thread_safe):
+    """
+    Invocations that raise are not added to the cache, so they do not
+    evict cached invocations.
+    """
+
+    function_cache = FunctionCacher(
+        save_path=tmp_path, cache_size=2, thread_safe=thread_safe
+    )
+    calls = []
+
+    @function_cache()
+    def invert(value):
+        calls.append(value)
+        return 1 / value
+
+    invert(1)
+    invert(2)
+    for _ in range(3):
+        with pytest.raises(ZeroDivisionError):
+            invert(0)
+
+    cached = function_cache.get_cached_data(invert)
+    assert [input_output["input"]["value"] for input_output in cached] == [2, 1]
+    invert(1)
+    invert(2)
+    assert calls == [1, 2, 0, 0, 0]
+
+
+def _shared_function(value):
+    _shared_function.called += 1
+    return value + 1
+
+
+_shared_function.called = 0
+
+
+def test_shared(tmp_path):
+    """
+    Cachers sharing a cache file merge their invocations when saving
+    and pick up each other's invocations.
+    """
+
+    _shared_function.called = 0
+    one = FunctionCacher(save_path=tmp_path, shared=True, auto_save=True)
+    other = FunctionCacher(save_path=tmp_path, shared=True, auto_save=True)
+    function_one = one()(_shared_function)
+    function_other = other()(_shared_function)
+
+    assert function_one(1) == 2
+    assert function_other(2) == 3
+    assert _shared_function.called == 2
+
+    # saving did not overwrite the other's invocation
+    loaded = FunctionCacher(save_path=tmp_path).get_cached_data(_shared_function)
+    assert sorted(input_output["output"] for input_output in loaded) == [2, 3]
+
+    # computed by the other cacher, no need to compute again
+    assert function_one(2) == 3
+    assert function_other(1) == 2
+    assert _shared_function.called == 2
+
+
+def _shared_worker(save_path: Path, values: range):
+    function_cache = FunctionCacher(save_path=save_path, shared=True, auto_save=True)
+    function = function_cache()(_shared_function)
+    for value in values:
+        function(value)
+
+
+def test_shared_processes(tmp_path):
+    """
+    Processes auto-saving to a shared cache concurrently keep each
+    other's invocations.
+    """
+
+    # not forked, as other tests leave threads running
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=_shared_worker, args=(tmp_path, range(start, start + 50))
+        )
+        for start in range(0, 200, 50)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+
+    loaded = FunctionCacher(save_path=tmp_path).get_cached_data(_shared_function)
+    assert sorted(input_output["output"] for input_output in loaded) == list(
+        range(1, 201)
+    )
+
+
+def test_incremental_save(tmp_path, monkeypatch):
+    """
+    Saving appends only the changes to the invocations, deleting the
+    ones evicted from the cache.
+    """
+
+    appended = []
+    append = InvocationStore.append
+
+    def recording_append(self, metadata, max_size, valid_for, accessed, changes):
+        changes = list(changes)
+        appended.append(sorted(change.kind for change in changes))
+        return append(self, metadata, max_size, valid_for, accessed, changes)
+
+    monkeypatch.setattr(InvocationStore, "append", recording_append)
+
+    function_cache = FunctionCacher(save_path=tmp_path, cache_size=2, auto_save=True)
+
+    @function_cache()
+    def add_one(value):
+        return value + 1
+
+    add_one(1)
+    add_one(2)
+    assert appended == [["write"], ["write"]]
+
+    # a hit only moves the invocation to the front
+    add_one(1)
+    function_cache.save()
+    assert appended[-1] == ["touch"]
+
+    # third invocation evicts the least recently used one
+    add_one(3)
+    assert appended[-1] == ["delete", "write"]
+
+    loaded = FunctionCacher(save_path=tmp_path).get_cached_data(add_one)
+    assert [input_output["output"] for input_output in loaded] == [4, 2]
+
+
+def test_save_cost(tmp_path):
+    """
+    The bytes appended by a save depend on the changes made, not on
+    the number of invocations cached, and evictions do not grow the
+    file without bound.
+    """
+
+    appended = []
+    for count in (10, 1000):
+        function_cache = FunctionCacher(save_path=tmp_path / str(count))
+
+        @function_cache()
+        def add_one(value):
+            return value + 1
+
+        for value in range(count):
+            add_one(value)
+        function_cache.save()
+        log_path = InvocationStore(function_cache.save_path).log_path
+        size = log_path.stat().st_size
+        add_one(-1)
+        function_cache.save()
+        appended.append(log_path.stat().st_size - size)
+    assert appended[0] == appended[1]
+
+    function_cache = FunctionCacher(
+        save_path=tmp_path / "evicting", cache_size=10, auto_save=True
+    )
+    add_one = function_cache()(add_one.__wrapped__)
+    for value in range(2000):
+        add_one(value)
+    log_path = InvocationStore(function_cache.save_path).log_path
+    assert log_path.stat().st_size < 128 * 1024
+    loaded = FunctionCacher(save_path=tmp_path / "evicting").get_cached_data(add_one)
+    assert [input_output["output"] for input_output in loaded] == list(
+        range(2000, 1990, -1)
+    )
+
+
+def test_torn_save(tmp_path):
+    """
+    A save left incomplete is ignored when loading, and overwritten
+    by the next save.
+    """
+
+    function_cache = FunctionCacher(save_path=tmp_path, auto_save=True)
+
+    @function_cache()
+    def add_one(value):
+        return value + 1
+
+    add_one(1)
+    add_one(2)
+    log_path = InvocationStore(function_cache.save_path).log_path
+    with open(log_path, "r+b") as f:
+        f.truncate(log_path.stat().st_size - 5)
+
+    loaded = FunctionCacher(save_path=tmp_path, auto_save=True)
+    loaded_add_one = loaded()(add_one.__wrapped__)
+    assert [
+        input_output["output"] for input_output in loaded.get_cached_data(add_one)
+    ] == [2]
+    loaded_add_one(3)
+    assert [
+        input_output["output"]
+        for input_output in FunctionCacher(save_path=tmp_path).get_cached_data(add_one)
+    ] == [4, 2]
+
+
+def test_load_legacy_layout(tmp_path):
+    """
+    A cache saved with the whole cache as a single record still loads,
+    without the invocations that were never computed.
+    """
+
+    function_cache = FunctionCacher(save_path=tmp_path)
+
+    @function_cache()
+    def add_one(value):
+        return value + 1
+
+    add_one(1)
+    state = function_cache.get_state()
+    for deq in state["cache"].values():
+        for input_output in deq:
+            del input_output["id"]
+        # left by versions that added invocations before computing them
+        deq.appendleft({"input": {"value": 2}, "output": None})
+    function_cacher.ShelveCacher.save(function_cache, state=state)
+
+    loaded = FunctionCacher(save_path=tmp_path)
+    assert [
+        input_output["output"] for input_output in loaded.get_cached_data(add_one)
+    ] == [2]
+    assert all("id" in input_output for input_output in loaded.get_cached_data(add_one))
+
+    # saving switches to the new layout
+    loaded.save()
+    assert InvocationStore(loaded.save_path).refresh()
+    assert dbm.whichdb(loaded.save_path) is None
+    assert [
+        input_output["output"]
+        for input_output in FunctionCacher(save_path=tmp_path).get_cached_data(add_one)
+    ] == [2]
+
+
+def test_lazy_load(tmp_path, monkeypatch):
+    """
+    With lazy loading, invocations are read from file only when
+    looked up.
+    """
+
+    function_cache = FunctionCacher(save_path=tmp_path)
+
+    @function_cache()
+    def add_one(value):
+        return getattr(value, "value", value) + 1
+
+    for value in range(5):
+        add_one(value)
+    add_one(Unhashable(1))
+    function_cache.save()
+
+    read = []
+    read_entries = function_cacher.InvocationStore.read_entries
+
+    def recording_read_entries(self, entry_ids):
+        entry_ids = list(entry_ids)
+        read.append(len(entry_ids))
+        return read_entries(self, entry_ids)
+
+    monkeypatch.setattr(
+        function_cacher.InvocationStore, "read_entries", recording_read_entries
+    )
+
+    lazy_cache = FunctionCacher(save_path=tmp_path, lazy=True, auto_save=True)
+    lazy_add_one = lazy_cache()(add_one.__wrapped__)
+    assert read == []
+
+    # only the looked up invocation is read
+    assert lazy_add_one(3) == 4
+    assert read == [1]
+    assert lazy_add_one(3) == 4
+    assert read == [1]
+    # unindexed invocations are read to compare against
+    assert lazy_add_one(Unhashable(1)) == 2
+    assert read == [1, 1]
+
+    # saving keeps the invocations not read
+    lazy_add_one(10)
+    loaded = FunctionCacher(save_path=tmp_path).get_cached_data(add_one)
+    assert len(loaded) == 7
+
+    assert len(lazy_cache.get_cached_data(add_one)) == 7
+    assert read[-1] == 4
+
+
+def test_greedy_dual_size_eviction(tmp_path):
+    """
+    Invocations record their compute time and size, and with
+    greedy_dual_size eviction, the expensive invocation is kept.
+    """
+
+    function_cache = FunctionCacher(
+        save_path=tmp_path, cache_size=2, eviction="greedy_dual_size"
+    )
+
+    @function_cache()
+    def slow_for(seconds):
+        time.sleep(seconds)
+        return seconds
+
+    slow_for(0.05)
+    slow_for(0)
+    slow_for(0.001)
+
+    cached = function_cache.get_cached_data(slow_for)
+    assert sorted(input_output["output"] for input_output in cached) == [0.001, 0.05]
+    assert all(input_output["size"] > 0 for input_output in cached)
+    assert max(input_output["cost"] for input_output in cached) >= 0.05
+
+    with pytest.raises(ValueError):
+        FunctionCacher(save_path=tmp_path, eviction="random")
+
+
+def test_byte_budgets(tmp_path):
+    """
+    Invocations are evicted across functions to stay within the byte
+    budgets, invocations saved to file being only dropped from memory.
+    """
+
+    size = function_cacher.estimate_size(bytes(1000))
+    function_cache = FunctionCacher(
+        save_path=tmp_path, max_memory_bytes=2.5 * size, max_disk_bytes=3.5 * size
+    )
+
+    @function_cache()
+    def one(value):
+        return bytes(1000)
+
+    @function_cache()
+    def other(value):
+        return bytes(1000)
+
+    def in_memory():
+        return sum(
+            1
+            for deq in function_cache.cache.values()
+            for input_output in deq
+            if "output" in input_output
+        )
+
+    one(1)
+    other(1)
+    function_cache.save()
+    one(2)
+    # the oldest saved invocation is only dropped from memory
+    assert in_memory() == 2
+    assert sum(len(deq) for deq in function_cache.cache.values()) == 3
+
+    # the least recently used invocation is evicted altogether
+    other(2)
+    assert sum(len(deq) for deq in function_cache.cache.values()) == 3
+    assert len(function_cache.cache[function_cache.hash_function(one)]) == 1
+    assert function_cache._disk_bytes == 3 * size
+    assert function_cache._memory_bytes == 2 * size
+
+    # removed invocations are no longer counted
+    function_cache.clear_memory_cache()
+    assert function_cache._disk_bytes == function_cache._memory_bytes == 0
+
+
+def test_byte_budgets_incremental(tmp_path, monkeypatch):
+    """
+    Keeping within the byte budgets does not go through all the cached
+    invocations, and evicts down to the low watermark such that the
+    next invocations fit.
+    """
+
+    size = function_cacher.estimate_size(bytes(1000))
+    function_cache = FunctionCacher(save_path=tmp_path, max_disk_bytes=20 * size)
+
+    @function_cache()
+    def one(value):
+        return bytes(1000)
+
+    for value in range(20):
+        one(value)
+    assert function_cache._disk_bytes == 20 * size
+
+    enforced = []
+    enforce = function_cache.enforce_byte_budgets
+
+    def recording_enforce():
+        enforced.append(True)
+        enforce()
+
+    def failing_iter(self):
+        raise AssertionError("cached invocations iterated")
+
+    monkeypatch.setattr(function_cache, "enforce_byte_budgets", recording_enforce)
+    with monkeypatch.context() as patched:
+        patched.setattr(RecencyDeque, "__iter__", failing_iter)
+        one(20)
+        assert function_cache._disk_bytes == 18 * size
+        # room left for the next invocation
+        one(21)
+    assert len(enforced) == 1
+    assert function_cache._disk_bytes == 19 * size
+    cached = function_cache.get_cached_data(one)
+    assert {input_output["input"]["value"] for input_output in cached} == set(
+        range(3, 22)
+    )
+
+
+def test_size_estimator(tmp_path, monkeypatch):
+    """
+    Outputs are sized without being pickled by default, or with
+    the estimator given, and saved with their size.
+    """
+
+    function_cache = FunctionCacher(save_path=tmp_path)
+
+    @function_cache()
+    def one(value):
+        return bytes(1000)
+
+    def failing_dumps(*args, **kwargs):
+        raise AssertionError("output pickled")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(size.pickle, "dumps", failing_dumps)
+        one(1)
+    assert function_cache._memory_bytes == function_cache._disk_bytes
+    assert function_cache._disk_bytes == size.estimate_size(bytes(1000))
+    function_cache.save()
+
+    store = InvocationStore(function_cache.save_path)
+    assert store.refresh()
+    (entry,) = next(iter(store.functions.values())).values()
+    assert entry.size == size.estimate_size(bytes(1000))
+    lazy_cache = FunctionCacher(save_path=tmp_path, lazy=True, max_disk_bytes=10**6)
+    assert lazy_cache._disk_bytes == entry.size
+
+    pickled_cache = FunctionCacher(
+        save_path=tmp_path / "pickled", size_estimator=size.pickled_size
+    )
+
+    @pickled_cache()
+    def other(value):
+        return bytes(1000)
+
+    other(1)
+    (input_output,) = pickled_cache.get_cached_data(other)
+    assert input_output["size"] == size.pickled_size(bytes(1000))
+
+
+def test_invocation_ttl(tmp_path):
+    """
+    Invocations expire individually, with the validity period given
+    per cacher, per function or per call.
+    """
+
+    function_cache = FunctionCacher(save_path=tmp_path, valid_for=dt.timedelta(hours=1))
+    calls = Counter()
+
+    @function_cache(ttl=dt.timedelta(seconds=0.05))
+    def add_one(value):
+        calls[value] += 1
+        return value + 1
+
+    add_one(1)
+    add_one.with_ttl(dt.timedelta(hours=1))(2)
+    time.sleep(0.06)
+
+    # only the expired invocation is computed again
+    add_one(2)
+    add_one(1)
+    assert calls == {1: 2, 2: 1}
+
+    time.sleep(0.06)
+    assert function_cache.remove_expired() == 1
+    cached = function_cache.get_cached_data(add_one)
+    assert [input_output["input"] for input_output in cached] == [{"value": 2}]
+
+    @function_cache()
+    def add_two(value):
+        return value + 2
+
+    add_two(1)
+    expires = function_cache.get_cached_data(add_two)[0]["expires"]
+    assert 3500 < expires - time.time() <= 3600
+
+    with pytest.raises(ValueError):
+        add_one.with_ttl(dt.timedelta(seconds=-1))
+
+
+def test_caches_none(tmp_path):
+    """
+    Invocations returning None are cached like any other.
+    """
+
+    function_cache = FunctionCacher(save_path=tmp_path, auto_save=True, metrics=True)
+    calls = []
+
+    @function_cache()
+    def nothing(value):
+        calls.append(value)
+
+    assert nothing(1) is None
+    assert nothing(1) is None
+    assert calls == [1]
+    stats = function_cache.stats()
+    counters = stats["counters"]
+    assert (counters["hits"], counters["misses"], stats["entries"]) == (1, 1, 1)
+
+    loaded = FunctionCacher(save_path=tmp_path)
+    loaded()(nothing.__wrapped__)(1)
+    assert calls == [1]
+
+
+@pytest.mark.parametrize("thread_safe", [False, True])
+def test_cache_exceptions(tmp_path, thread_safe):
+    """
+    Exceptions of the given types are cached until they expire,
+    raising a fresh copy on each hit.
+    """
+
+    function_cache = FunctionCacher(
+        save_path=tmp_path,
+        thread_safe=thread_safe,
+        cache_exceptions=(FileNotFoundError,),
+        exception_ttl=dt.timedelta(seconds=0.05),
+    )
+    calls = []
+
+    @function_cache()
+    def read(name):
+        calls.append(name)
+        if name == "missing":
+            raise FileNotFoundError(name)
+        if name == "invalid":
+            raise ValueError(name)
+        return name
+
+    for _ in range(2):
+        with pytest.raises(FileNotFoundError, match="missing") as info:
+            read("missing")
+        with pytest.raises(ValueError):
+            read("invalid")
+    assert calls == ["missing", "invalid", "invalid"]
+    (cached,) = [
+        input_output["output"]
+        for input_output in function_cache.get_cached_data(read)
+        if input_output["input"] == {"name": "missing"}
+    ]
+    assert not (info.value is cached.exception)
+    assert cached.exception.__traceback__ is None
+
+    function_cache.save()
+    loaded = FunctionCacher(save_path=tmp_path, cache_exceptions=(FileNotFoundError,))
+    loaded()(read.__wrapped__)
+    with pytest.raises(FileNotFoundError):
+        loaded.map(read, [("missing",)])
+    assert calls == ["missing", "invalid", "invalid"]
+
+    time.sleep(0.06)
+    with pytest.raises(FileNotFoundError):
+        read("missing")
+    assert calls == ["missing", "invalid", "invalid", "missing"]
+
+
+def test_stale_while_revalidate(tmp_path):
+    """
+    Within the window, the expired output is returned while a single
+    background computation replaces it.
+    """
+
+    function_cache = FunctionCacher(
+        save_path=tmp_path,
+        valid_for=dt.timedelta(seconds=0.05),
+        stale_while_revalidate=dt.timedelta(hours=1),
+    )
+    computed = threading.Event()
+    calls = []
+
+    @function_cache()
+    def version(value):
+        calls.append(value)
+        if len(calls) > 1:
+            computed.wait(5)
+        return len(calls)
+
+    assert version(1) == 1
+    time.sleep(0.06)
+
+    # stale value returned while computing again once
+    assert version(1) == 1
+    assert version(1) == 1
+    computed.set()
+    function_cache.close()
+    assert calls == [1, 1]
+    assert version(1) == 2
+
+    # outside the window, computed again by the caller
+    function_cache.stale_while_revalidate = None
+    time.sleep(0.06)
+    assert version(1) == 3
+
+
+def test_stale_while_revalidate_async(tmp_path):
+    """
+    Coroutine functions are computed again in a background task.
+    """
+
+    function_cache = FunctionCacher(
+        save_path=tmp_path,
+        valid_for=dt.timedelta(seconds=0.05),
+        stale_while_revalidate=dt.timedelta(hours=1),
+    )
+    calls = []
+
+    @function_cache()
+    async def version(value):
+        calls.append(value)
+        return len(calls)
+
+    async def main():
+        assert await version(1) == 1
+        await asyncio.sleep(0.06)
+        assert await version(1) == 1
+        await asyncio.gather(*function_cache._revalidate_tasks)
+        assert await version(1) == 2
+
+    asyncio.run(main())
+    assert calls == [1, 1]
+
+
+def test_stats(tmp_path):
+    """
+    Counters, latencies and sizes are reported in total and per function.
+    """
+
+    events = []
+    function_cache = FunctionCacher(
+        save_path=tmp_path,
+        cache_size=1,
+        metrics=True,
+        metrics_callback=lambda *event: events.append(event),
+    )
+
+    @function_cache()
+    def add(one, two=1):
+        return one + two
+
+    assert add(1) == 2
+    assert add(1) == 2
+    assert add(2) == 3
+    function_cache.save()
+
+    stats = function_cache.stats()
+    name = unique_name(add.__wrapped__)
+    assert stats["counters"] == {
+        "hits": 1,
+        "misses": 2,
+        "evictions": 1,
+        "expirations": 0,
+        "inserts": 2,
+    }
+    assert stats["functions"][name]["counters"] == stats["counters"]
+    assert stats["timings"]["lookup"]["count"] == 3
+    assert stats["timings"]["compute"]["count"] == 2
+    assert stats["timings"]["save"]["count"] == 1
+    assert not "save" in stats["functions"][name]["timings"]
+    assert stats["entries"] == stats["functions"][name]["entries"] == 1
+    assert 0 < stats["memory_bytes"] == stats["disk_bytes"]
+
+    assert ("hits", name, 1) in events
+    assert ("evictions", name, 1) in events
+
+    function_cache.metrics.reset()
+    assert function_cache.stats()["counters"]["hits"] == 0
+    # sizes do not depend on the metrics
+    assert FunctionCacher(save_path=tmp_path).stats()["entries"] == 1
+
+    # sizes are kept up to date rather than estimated when read
+    def failing_estimator(value):
+        raise AssertionError("output sized")
+
+    function_cache.size_estimator = failing_estimator
+    stats = function_cache.stats()
+    assert stats["memory_bytes"] == function_cache._memory_bytes
+    assert stats["functions"][name]["disk_bytes"] == function_cache._disk_bytes
+
+
+def test_profile(tmp_path):
+    """
+    Phases of hits and misses are timed per function, suggesting
+    changes for the dominant phases.
+    """
+
+    function_cache = FunctionCacher(save_path=tmp_path, auto_save=True, profile=True)
+
+    @function_cache()
+    def add(one, two=1):
+        return one + two
+
+    add(1)
+    add(1)
+    add(2)
+
+    profile = function_cache.profiler.report()[unique_name(add.__wrapped__)]
+    assert profile["calls"] == 3
+    assert profile["hits"] == 1
+    phases = profile["phases"]
+    assert phases["hash"]["count"] == phases["copy"]["count"] == 3
+    assert phases["compute"]["count"] == phases["save"]["count"] == 2
+    assert not "compare" in phases
+    assert profile["overhead"] == pytest.approx(
+        sum(phase["total"] for name, phase in phases.items() if name != "compute")
+    )
+    # writing to file after each miss takes far longer than the rest
+    assert any("auto_save" in suggestion for suggestion in profile["suggestions"])
+    assert "save" in function_cache.profiler.format_report()
+
+
+def test_blob_storage(tmp_path):
+    """
+    Large outputs are saved out of line, read when looked up, and
+    deleted once no invocation refers to them.
+    """
+
+    function_cache = FunctionCacher(
+        save_path=tmp_path, cache_size=2, auto_save=True, blob_threshold=1000
+    )
+
+    @function_cache()
+    def array(length):
+        return np.arange(length)
+
+    array(10)
+    array(10_000)
+    save_path = function_cache.save_path
+    blob_directory = save_path.with_name(f"{save_path.name}.blobs")
+    blob_files = [path for path in blob_directory.rglob("*") if path.is_file()]
+    assert len(blob_files) == 1
+
+    store = InvocationStore(function_cache.save_path)
+    store.refresh()
+    records = store.read_entries(store.functions[function_cache.hash_function(array)])
+    outputs = [record["output"] for record in records.values()]
+    assert sum(isinstance(output, function_cacher.BlobRef) for output in outputs) == 1
+
+    loaded = FunctionCacher(save_path=tmp_path, blob_threshold=1000)
+    large = [
+        input_output
+        for input_output in loaded.cache[loaded.hash_function(array)]
+        if input_output["input"]["length"] == 10_000
+    ][0]
+    # not read until looked up
+    assert isinstance(large["output"], function_cacher.BlobRef)
+    assert np.array_equal(loaded()(array.__wrapped__)(10_000), np.arange(10_000))
+
+    # a copy next to it is cleared without the blobs of the original
+    copy_path = save_path.with_name("copy.pkl")
+    function_cache.save(copy_path)
+    function_cache.clear_file_cache(copy_path)
+    assert blob_files[0].exists()
+    reloaded = FunctionCacher(save_path=tmp_path)
+    reloaded()(array.__wrapped__)
+    assert len(reloaded.get_cached_data(array)) == 2
+
+    # evicted from the cache, and the blob with it
+    array(1)
+    array(2)
+    assert not blob_files[0].exists()
+
+
+def test_compression(tmp_path):
+    """
+    Invocations above the threshold are saved compressed, and read
+    regardless of the codec of the cacher reading them.
+    """
+
+    function_cache = FunctionCacher(
+        save_path=tmp_path, auto_save=True, compression="zlib"
+    )
+
+    @function_cache()
+    def repeat(text, times):
+        return [text] * times
+
+    repeat("tiny", 1)
+    repeat("compressible", 1000)
+
+    compression = function_cache.stats()["compression"]
+    assert compression["entries"] == 1
+    assert compression["uncompressed_bytes"] > compression["compressed_bytes"]
+    assert compression["ratio"] > 1
+
+    store = InvocationStore(function_cache.save_path)
+    store.refresh()
+    codecs = [
+        entry.codec
+        for entries in store.functions.values()
+        for entry in entries.values()
+    ]
+    assert codecs.count("zlib") == 1 and codecs.count(None) == 1
+
+    loaded = FunctionCacher(save_path=tmp_path).get_cached_data(repeat)
+    assert sorted(len(input_output["output"]) for input_output in loaded) == [1, 1000]
+    assert FunctionCacher(save_path=tmp_path).stats()["compression"]["ratio"] == 1.0
+
+
+@pytest.mark.parametrize("threads", [False, True])
+def test_map(tmp_path, monkeypatch, threads):
+    """
+    Only invocations not cached are computed, each once, and the
+    cache is saved once.
+    """
+
+    function_cache = FunctionCacher(save_path=tmp_path, auto_save=True)
+    calls = []
+
+    @function_cache()
+    def square(value):
+        calls.append(value)
+        return [value**2]
+
+    square(2)
+    saves = []
+    append = InvocationStore.append
+
+    def recording_append(self, *args, **kwargs):
+        saves.append(1)
+        return append(self, *args, **kwargs)
+
+    monkeypatch.setattr(InvocationStore, "append", recording_append)
+
+    executor = ThreadPoolExecutor(2) if threads else None
+    outputs = function_cache.map(square, [(1,), (2,), (3,), (1,)], executor)
+    assert outputs == [[1], [4], [9], [1]]
+    # outputs are copies of the cached ones
+    assert not (outputs[0] is outputs[3])
+    assert sorted(calls) == [1, 2, 3]
+    assert len(saves) == 1
+
+    assert function_cache.map(square, [(3,), (1,)]) == [[9], [1]]
+    assert sorted(calls) == [1, 2, 3]
+    assert len(saves) == 1
+
+
+def test_map_exception(tmp_path):
+    """
+    The outputs computed are cached even if an invocation raises.
+    """
+
+    function_cache = FunctionCacher(save_path=tmp_path)
+    calls = []
+
+    @function_cache()
+    def invert(value):
+        calls.append(value)
+        return 1 / value
+
+    with pytest.raises(ZeroDivisionError):
+        function_cache.map(invert, [(1,), (0,), (2,)])
+    assert invert(2) == 0.5
+    assert calls == [1, 0, 2]
+
+
+def test_warm(tmp_path):
+    """
+    The invocations computed are recorded once each, and only those
+    not cached are computed when warming up.
+    """
+
+    log_path = tmp_path / "calls.log"
+    function_cache = FunctionCacher(
+        save_path=tmp_path / "one",
+        call_log=log_path,
+        cache_exceptions=(ZeroDivisionError,),
+    )
+
+    @function_cache()
+    def power(value, exponent=2):
+        return value**exponent
+
+    power(2)
+    power(2)
+    power(3, exponent=3)
+    # cached exceptions are not recorded
+    with pytest.raises(ZeroDivisionError):
+        power(0, exponent=-1)
+    assert list(CallLog.read(log_path)) == [
+        (unique_name(power), {"value": 2, "exponent": 2}),
+        (unique_name(power), {"value": 3, "exponent": 3}),
+    ]
+
+    function_cache = FunctionCacher(save_path=tmp_path / "two", auto_save=True)
+    calls = []
+
+    @function_cache()
+    def power(value, exponent=2):
+        calls.append(value)
+        return value**exponent
+
+    power(3, exponent=3)
+    with ThreadPoolExecutor(2) as executor:
+        assert function_cache.warm(log_path, executor=executor) == 1
+    assert calls == [3, 2]
+    assert power(2) == 4
+    assert calls == [3, 2]
+
+    loaded = FunctionCacher(save_path=tmp_path / "two")
+    assert len(loaded.get_cached_data(power)) == 2
@@ -0,0 +1,38 @@
+from filecache.metrics import Histogram, Metrics, BUCKET_BOUNDS
+
+
+def test_histogram_percentiles():
+    """
+    Percentiles are the upper bounds of the buckets they fall in.
+    """
+
+    histogram = Histogram()
+    for _ in range(9):
+        histogram.observe(1e-6)
+    histogram.observe(1.0)
+
+    summary = histogram.summary()
+    assert summary["count"] == 10
+    assert summary["max"] == 1.0
+    assert summary["p50"] == summary["p90"] == BUCKET_BOUNDS[0]
+    assert 1.0 <= summary["p99"] < 2.0
+    assert sum(summary["buckets"].values()) == 10
+
+    histogram.observe(1e6)
+    assert histogram.percentile(1.0) == float("inf")
+
+
+def test_metrics_scopes():
+    """
+    Metrics are recorded in total and per function.
+    """
+
+    metrics = Metrics()
+    metrics.count("hits", "one")
+    metrics.count("hits", "two", 2)
+    metrics.observe("save", 0.1)
+
+    assert metrics.scope_stats()["counters"]["hits"] == 3
+    assert metrics.scope_stats("two")["counters"]["hits"] == 2
+    assert metrics.scope_stats()["timings"]["save"]["count"] == 1
+    assert sorted(metrics.functions) == ["one", "two"]
@@ -1,5 +1,6 @@
 import pytest
 
+from filecache.utils import compare
 from filecache.utils.compare import compare_dict_values, all_instance_of
 
 
@@ -50,3 +51,19 @@ def test_comparison_funcs():
     comp = compare_dict_values(dict1, dict2, [compare_dummy])
     assert sum(comp.values()) == 1
     assert comp["dummy"]
+
+
+def test_compare_linear(monkeypatch):
+    """Each key is compared once with each comparison function"""
+
+    calls = []
+
+    def counting_all_instance_of(type, *instances):
+        calls.append(instances)
+        return all_instance_of(type, *instances)
+
+    monkeypatch.setattr(compare, "all_instance_of", counting_all_instance_of)
+
+    dict1 = {str(i): i for i in range(10)}
+    assert not any(compare_dict_values(dict1, dict1).values())
+    assert len(calls) == len(dict1)
@@ -0,0 +1,18 @@
+import pytest
+
+from filecache.utils.compression import CODECS, compress, decompress, validate_codec
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_round_trip(codec):
+
+    data = b"compressible " * 100
+    compressed = compress(data, codec)
+    assert len(compressed) < len(data)
+    assert decompress(compressed, codec) == data
+
+
+def test_validate_codec():
+
+    with pytest.raises(ValueError):
+        validate_codec("gzip")
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+import pickle
+from collections import deque, namedtuple
+
+from filecache.utils.copy_policy import (
+    freeze,
+    FrozenDict,
+    copy_to_cache,
+    copy_from_cache,
+    validate_copy_policy,
+)
+
+
+def test_freeze():
+    """Frozen values are immutable and equal in content"""
+
+    value = {"list": [1, [2, 3]], "set": {1, 2}, "bytes": bytearray(b"abc")}
+    frozen = freeze(value)
+
+    assert frozen == {"list": (1, (2, 3)), "set": frozenset({1, 2}), "bytes": b"abc"}
+    with pytest.raises(TypeError):
+        frozen["list"] = 1
+    with pytest.raises(TypeError):
+        frozen.update({"new": 1})
+
+    array = np.arange(3)
+    frozen_array = freeze(array)
+    with pytest.raises(ValueError):
+        frozen_array[0] = 1
+    # the original is not affected
+    array[0] = 1
+
+
+def test_freeze_types():
+    """Named tuples keep their type, subclasses are copied instead"""
+
+    Point = namedtuple("Point", "x y")
+    frozen = freeze(Point(1, [2]))
+    assert type(frozen) is Point
+    assert frozen.y == (2,)
+
+    class Items(list):
+        pass
+
+    items = Items([1, [2]])
+    frozen = freeze(items)
+    assert type(frozen) is Items
+    assert frozen == items and not (frozen is items)
+
+
+def test_frozen_dict_pickle():
+    """FrozenDict can be pickled"""
+
+    frozen = FrozenDict({"value": 1})
+    loaded = pickle.loads(pickle.dumps(frozen))
+    assert isinstance(loaded, FrozenDict)
+    assert loaded == frozen
+
+
+@pytest.mark.parametrize(
+    "policy, same_on_store, same_on_return, same_inner",
+    [
+        ("deep", False, False, False),
+        ("none", True, True, True),
+        ("shallow", False, False, True),
+        ("pickle", False, False, False),
+    ],
+)
+def test_copy_policies(policy, same_on_store, same_on_return, same_inner):
+    """Values are copied according to the policy"""
+
+    value = {"inner": [1, 2]}
+
+    stored = copy_to_cache(value, policy)
+    assert stored == value
+    assert (stored is value) == same_on_store
+    assert (stored["inner"] is value["inner"]) == same_inner
+
+    returned = copy_from_cache(stored, policy)
+    assert returned == value
+    assert (returned is stored) == same_on_return
+
+
+def test_freeze_policy():
+    """Frozen value is returned as-is"""
+
+    stored = copy_to_cache({"inner": [1, 2]}, "freeze")
+    assert copy_from_cache(stored, "freeze") is stored
+
+    # cannot be frozen in whole, so copied on the way out too
+    stored = copy_to_cache({"inner": deque([1, 2])}, "freeze")
+    returned = copy_from_cache(stored, "freeze")
+    assert returned == {"inner": deque([1, 2])}
+    returned["inner"].append(3)
+    assert copy_from_cache(stored, "freeze") == {"inner": deque([1, 2])}
+
+
+def test_invalid_policy():
+
+    with pytest.raises(ValueError):
+        validate_copy_policy("deeper")
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from filecache.utils.fingerprint import (
+    fingerprint,
+    fingerprint_arguments,
+    FingerprinterRegistry,
+)
+from filecache.exceptions import FingerprintError
+
+
+def test_equal_values_equal_fingerprints():
+    """Values that compare equal have equal fingerprints"""
+
+    value = {"list": [1, 2, {"inner": (3, 4)}], "set": {1, 2}, "string": "hello"}
+    other_value = {"string": "hello", "set": {2, 1}, "list": [1, 2, {"inner": (3, 4)}]}
+
+    assert fingerprint(value) == fingerprint(other_value)
+    assert hash(fingerprint(value)) == hash(fingerprint(other_value))
+
+
+@pytest.mark.parametrize(
+    "one, two",
+    [([1, 2], (1, 2)), ([1, 2], [2, 1]), ({"a": 1}, {"a": 2}), ({1}, [1]), ("1", 1)],
+)
+def test_different_values_different_fingerprints(one, two):
+    """Values that do not compare equal have different fingerprints"""
+
+    assert fingerprint(one) != fingerprint(two)
+
+
+def test_unhashable():
+    """Values that are not hashable cannot be fingerprinted"""
+
+    class Unhashable:
+        __hash__ = None
+
+    with pytest.raises(FingerprintError):
+        fingerprint([1, Unhashable()])
+
+    with pytest.raises(FingerprintError):
+        fingerprint_arguments({"value": Unhashable()})
+
+
+def test_fingerprint_arguments():
+    """Bound arguments are fingerprinted by name and value"""
+
+    assert fingerprint_arguments({"one": 1, "two": [2]}) == fingerprint_arguments(
+        {"one": 1, "two": [2]}
+    )
+    assert fingerprint_arguments({"one": 1}) != fingerprint_arguments({"two": 1})
+
+
+def test_bytes_digest():
+    """Bytes-like values are fingerprinted by their digest"""
+
+    value = b"a" * 1000
+    assert fingerprint(value) == fingerprint(bytes(value))
+    assert fingerprint(value) != fingerprint(b"b" * 1000)
+    assert len(fingerprint(value)[-1]) == 64
+    assert fingerprint(memoryview(value)) == fingerprint(memoryview(bytes(value)))
+
+
+def test_buffer_digest():
+    """Objects supporting the buffer protocol are fingerprinted by contents"""
+
+    array = np.arange(12).reshape(3, 4)
+    assert fingerprint(array) == fingerprint(array.copy())
+    # non-contiguous
+    assert fingerprint(array.T) == fingerprint(array.T.copy())
+    assert fingerprint(array) != fingerprint(array.reshape(4, 3))
+    assert fingerprint(array) != fingerprint(array + 1)
+
+    with pytest.raises(FingerprintError):
+        fingerprint(np.array([1, "a"], dtype=object))
+    # format not supported by the buffer protocol
+    with pytest.raises(FingerprintError):
+        fingerprint(np.array(["2020-01-01"], dtype="datetime64[ns]"))
+
+
+def test_state_digest():
+    """Unhashable objects with custom state are fingerprinted by the state"""
+
+    df = pd.DataFrame(dict(idx=range(5), letters=list("abcde")))
+    assert fingerprint(df) == fingerprint(df.copy())
+    df2 = df.copy()
+    df2.loc[0, "idx"] = 10
+    assert fingerprint(df) != fingerprint(df2)
+
+
+def test_registry():
+    """Fingerprinters can be registered, with lookup falling back to parent"""
+
+    class Dummy:
+        __hash__ = None
+
+        def __init__(self, value):
+            self.value = value
+
+    parent = FingerprinterRegistry()
+    registry = FingerprinterRegistry(parent=parent)
+
+    with pytest.raises(FingerprintError):
+        fingerprint(Dummy(1), fingerprinters=registry)
+
+    @parent.register(Dummy)
+    def stream_dummy(value, hasher):
+        hasher.update(str(value.value).encode())
+
+    assert registry.lookup(Dummy) is stream_dummy
+    assert fingerprint(Dummy(1), fingerprinters=registry) == fingerprint(
+        Dummy(1), fingerprinters=registry
+    )
+    assert fingerprint(Dummy(1), fingerprinters=registry) != fingerprint(
+        Dummy(2), fingerprinters=registry
+    )
+    # not in the default registry
+    with pytest.raises(FingerprintError):
+        fingerprint(Dummy(1))
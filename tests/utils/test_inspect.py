@@ -1,3 +1,5 @@
+import pytest
+
 from hashlib import sha256
 
 from filecache.utils import inspect
@@ -64,3 +66,53 @@ def test_bind_ignore():
 
     assert bound_args["string_value"] == string_value
     assert bound_args["other_string_value"] == other_string_value
+
+
+@pytest.mark.parametrize(
+    "args, kwargs",
+    [
+        ((1,), {}),
+        ((1, 2), {}),
+        ((1, 2, 3), {}),
+        ((), {"one": 1}),
+        ((), {"two": 2, "one": 1}),
+        ((1,), {"three": 3}),
+    ],
+)
+def test_argument_binder(args, kwargs):
+    """Binder binds like `bind_arguments`"""
+
+    def dummy_function(one, two=[2], three=None):
+        return one
+
+    binder = inspect.ArgumentBinder(dummy_function)
+    bound_args = binder.bind(args, kwargs)
+    expected = inspect.bind_arguments(dummy_function, args, kwargs)
+    assert bound_args == expected
+    assert list(bound_args) == list(expected)
+
+
+@pytest.mark.parametrize(
+    "args, kwargs",
+    [((), {}), ((1, 2, 3, 4), {}), ((), {"two": 2}), ((), {"four": 4})],
+)
+def test_argument_binder_errors(args, kwargs):
+    """Binder raises for invalid calls"""
+
+    def dummy_function(one, two=2, three=3):
+        return one
+
+    binder = inspect.ArgumentBinder(dummy_function)
+    with pytest.raises(TypeError):
+        binder.bind(args, kwargs)
+
+
+def test_argument_binder_complex_signature():
+    """Binder binds signatures not covered by the fast path"""
+
+    def dummy_function(one, /, *args, two=2, **kwargs):
+        return one
+
+    binder = inspect.ArgumentBinder(dummy_function)
+    bound_args = binder.bind((1, 3), {"four": 4})
+    assert bound_args == inspect.bind_arguments(dummy_function, (1, 3), {"four": 4})
@@ -0,0 +1,52 @@
+import numpy as np
+
+from filecache.utils.size import estimate_size, pickled_size
+
+
+def test_estimate_size():
+    """
+    The estimate grows with the size of the value, counting the buffers
+    of arrays and the contents of containers and objects.
+    """
+
+    assert estimate_size(b"") < estimate_size(b"x" * 1000)
+    assert estimate_size(b"x" * 1000) >= 1000
+
+    array = np.zeros(1000, dtype=np.float64)
+    assert estimate_size(array) >= array.nbytes
+    # views are counted by the size of their buffer
+    assert estimate_size(array[:500]) >= array[:500].nbytes
+
+    assert estimate_size([b"x" * 1000] * 10) >= 10_000
+    assert estimate_size({"key": b"x" * 1000}) >= 1000
+
+    class Holder:
+        def __init__(self):
+            self.value = b"x" * 1000
+
+    assert estimate_size(Holder()) >= 1000
+    assert estimate_size(lambda: None) > 0
+
+
+def test_estimate_size_sampled():
+    """
+    Only a sample of the items of large containers is looked at,
+    the rest being assumed to be of the same size.
+    """
+
+    items = [bytes([index % 256]) * 100 for index in range(10_000)]
+    estimate = estimate_size(items)
+    assert 10_000 * 100 <= estimate <= 2 * pickled_size(items)
+
+
+def test_pickled_size():
+    """
+    The pickled size counts out-of-band buffers, falling back
+    for unpicklable values.
+    """
+
+    assert pickled_size(b"x" * 1000) >= 1000
+    array = np.zeros(1000, dtype=np.float64)
+    assert pickled_size(array) >= array.nbytes
+    # not picklable
+    assert pickled_size(lambda: None) > 0
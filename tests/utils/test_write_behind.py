@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from filecache.utils.write_behind import WriteBehind
+
+
+def _wait_for(predicate, timeout=5):
+
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_flush_after_delay():
+    """
+    Changes are flushed once after the delay.
+    """
+
+    flushed = []
+    write_behind = WriteBehind(lambda: flushed.append(1), max_delay=0.05)
+    for _ in range(10):
+        write_behind.mark()
+
+    assert _wait_for(lambda: len(flushed) == 1)
+    time.sleep(0.1)
+    assert len(flushed) == 1
+    assert write_behind.pending == 0
+    write_behind.close()
+
+
+def test_flush_after_max_pending():
+    """
+    Changes are flushed without waiting for the delay once enough
+    are pending.
+    """
+
+    flushed = threading.Event()
+    write_behind = WriteBehind(flushed.set, max_delay=60, max_pending=5)
+    for _ in range(4):
+        write_behind.mark()
+    assert not flushed.wait(0.1)
+
+    write_behind.mark()
+    assert flushed.wait(5)
+    write_behind.close()
+
+
+def test_close():
+    """
+    Closing flushes the pending changes, and changes cannot be marked
+    afterwards.
+    """
+
+    flushed = []
+    write_behind = WriteBehind(lambda: flushed.append(1), max_delay=60)
+    write_behind.close()
+    assert flushed == []
+
+    write_behind = WriteBehind(lambda: flushed.append(1), max_delay=60)
+    write_behind.mark()
+    write_behind.close()
+    write_behind.close()
+    assert flushed == [1]
+    with pytest.raises(RuntimeError):
+        write_behind.mark()
+
+
+def test_failed_flush_stays_pending():
+    """
+    Changes whose flush failed are flushed again.
+    """
+
+    def fail():
+        raise OSError()
+
+    write_behind = WriteBehind(fail, max_delay=60)
+    write_behind.mark(2)
+    with pytest.raises(OSError):
+        write_behind.flush()
+    assert write_behind.pending == 2
+
+    write_behind._flush = lambda: None
+    write_behind.close()
+    assert write_behind.pending == 0